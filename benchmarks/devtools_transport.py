@@ -0,0 +1,137 @@
+"""
+Compare page scripts run through chromedriver with the DevTools WebSocket transport.
+
+Usage:
+    python benchmarks/devtools_transport.py [--calls N] [--batch N] [--no-headless]
+                                            [--chrome PATH] [--chromedriver PATH] [--json FILE]
+
+Launches one real Chrome with Browser(devtools=True) on a small local page and
+runs the same scripts three ways: Selenium's execute_script over chromedriver's
+HTTP endpoint, Browser.execute_script over the persistent DevTools WebSocket,
+and Browser.execute_scripts pipelining --batch scripts per round trip. The
+scripts are a bare `return 1` and the harvester's batched tick script. For each
+path the script reports p50/p95 latency per call, CPU per call in this
+process and, on Linux, CPU per call in chromedriver.
+"""
+import argparse
+import json
+import logging
+import os
+import pathlib
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from selenium.webdriver import Chrome  # noqa: E402
+from harvester.browser import Browser  # noqa: E402
+from harvester.harvester import PAGE_STATE_JS  # noqa: E402
+
+PAGE = 'data:text/html,<title>bench</title><div class="controlElement1">benchmark</div>'
+
+
+def process_cpu(pid: int):
+    """CPU seconds used by another process so far, None where /proc is missing"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def measure(name: str, run, calls: int, per_run: int, driver_pid):
+    """Time calls // per_run runs of run(), each making per_run script calls"""
+    run()
+    latencies = []
+    driver_before = process_cpu(driver_pid) if driver_pid else None
+    cpu_before = time.process_time()
+    started = time.perf_counter()
+    for _ in range(max(calls // per_run, 1)):
+        call_started = time.perf_counter()
+        run()
+        latencies.append((time.perf_counter() - call_started) / per_run)
+    elapsed = time.perf_counter() - started
+    count = len(latencies) * per_run
+    cpu = time.process_time() - cpu_before
+    driver_after = process_cpu(driver_pid) if driver_pid else None
+
+    return {
+        'path': name,
+        'calls': count,
+        'p50_us': round(percentile(latencies, 0.5) * 1e6, 1),
+        'p95_us': round(percentile(latencies, 0.95) * 1e6, 1),
+        'mean_us': round(statistics.mean(latencies) * 1e6, 1),
+        'calls_per_second': round(count / elapsed, 1),
+        'cpu_us_per_call': round(cpu / count * 1e6, 1),
+        'chromedriver_cpu_us_per_call': (
+            round((driver_after - driver_before) / count * 1e6, 1)
+            if driver_before is not None and driver_after is not None else None
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=2000, help='Script calls per path')
+    parser.add_argument('--batch', type=int, default=10, help='Scripts pipelined per DevTools round trip')
+    parser.add_argument('--no-headless', action='store_true', help='Show the browser window')
+    parser.add_argument('--chrome', help='Chrome binary')
+    parser.add_argument('--chromedriver', help='ChromeDriver binary')
+    parser.add_argument('--json', type=pathlib.Path, help='Also write the results to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    options = ['--no-sandbox', '--disable-gpu', '--disable-dev-shm-usage']
+    if not args.no_headless:
+        options.append('--headless=new')
+    browser = Browser(executable=args.chromedriver, options=options, chrome_executable=args.chrome, devtools=True)
+    browser.start(PAGE)
+    if not browser.devtools_connection:
+        browser.quit()
+        sys.exit('Chrome offered no DevTools endpoint')
+    driver_pid = getattr(getattr(browser.service, 'process', None), 'pid', None)
+
+    scripts = (
+        ('return 1', 'return 1;', ()),
+        ('page state', PAGE_STATE_JS, ('benchmarkPending', 'controlElement1')),
+    )
+    results = []
+    try:
+        for label, script, script_args in scripts:
+            paths = (
+                ('webdriver', lambda: Chrome.execute_script(browser, script, *script_args), 1),
+                ('devtools', lambda: browser.execute_script(script, *script_args), 1),
+                (f'devtools x{args.batch}', lambda: browser.execute_scripts([(script, script_args)] * args.batch),
+                 args.batch),
+            )
+            for name, run, per_run in paths:
+                result = measure(name, run, args.calls, per_run, driver_pid)
+                result['script'] = label
+                results.append(result)
+    finally:
+        browser.quit()
+
+    columns = (
+        ('script', 'script', 12), ('path', 'path', 14), ('p50_us', 'p50 us', 10), ('p95_us', 'p95 us', 10),
+        ('calls_per_second', 'calls/s', 10), ('cpu_us_per_call', 'cpu us', 9),
+        ('chromedriver_cpu_us_per_call', 'driver us', 11),
+    )
+    header = ''.join(f'{title:>{width}}' for _, title, width in columns)
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        print(''.join(f'{"-" if result[key] is None else result[key]:>{width}}' for key, _, width in columns))
+
+    if args.json:
+        args.json.write_text(json.dumps({'arguments': dict(vars(args), json=str(args.json)), 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,501 @@
+"""
+Offline stand-ins for Chrome and Google used by the scaling benchmark.
+
+FakeRecaptchaServer serves shop pages carrying a reCAPTCHA widget and issues
+tokens for them, CaptchaSolver plays the person solving every rendered widget
+after a simulated delay, and FakeBrowser replaces the chromedriver round trips
+of Browser with in-process calls of configurable latency. FakeHarvester is the
+real Harvester running on a FakeBrowser, so ticks, push capture and the manager
+run exactly the code they run against Chrome. FakeProxy answers the CONNECT
+requests of proxy health checks, slowly, wrongly or not at all.
+"""
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingTCPServer, StreamRequestHandler
+from threading import Thread, Lock, Condition
+from typing import Optional, Dict, List, Any
+from urllib.parse import urlsplit, parse_qs
+import urllib.request
+import base64
+import hashlib
+import heapq
+import random
+import re
+import tempfile
+import time
+
+from harvester.browser import Browser
+from harvester.harvester import Harvester, SETUP_JS, DRAIN_JS, PAGE_STATE_JS, IS_SET_JS, TRACE_DRAIN_JS
+from harvester.metrics import WEBDRIVER_SECONDS
+from selenium.webdriver.common.by import By
+
+SITEKEY = '6LfakeAAAAAAAHarvesterBenchmarkSitekey0'
+
+PAGE_TEMPLATE = """<!doctype html>
+<html><head><title>Shop {number}</title></head>
+<body>
+<h1>Checkout</h1>
+<form method="post" action="/checkout">
+<div class="g-recaptcha" data-sitekey="{sitekey}"></div>
+<input type="submit" value="Pay">
+</form>
+</body></html>
+"""
+
+CONTROL_PATTERN = re.compile(r'class="(controlElement\d+)"')
+SITEKEY_PATTERN = re.compile(r'data-sitekey="([^"]+)"')
+WINDOW_SIZE_PATTERN = re.compile(r'--window-size=(\d+),(\d+)')
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self) -> None:
+        started = time.thread_time()
+        parts = urlsplit(self.path).path.strip('/').split('/')
+        if len(parts) == 2 and parts[0] == 'shop':
+            body = PAGE_TEMPLATE.format(number=parts[1], sitekey=self.server.fake.sitekey).encode('utf-8')
+            self._send(200, body, 'text/html; charset=utf-8')
+        else:
+            self._send(404, b'', 'text/plain')
+        self.server.fake.add_cpu(time.thread_time() - started)
+
+    def do_POST(self) -> None:
+        started = time.thread_time()
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        sitekey = parse_qs(url.query).get('k', [None])[0]
+        if url.path == '/recaptcha/api2/userverify' and sitekey:
+            self._send(200, self.server.fake.issue(sitekey).encode('ascii'), 'text/plain')
+        else:
+            self._send(404, b'', 'text/plain')
+        self.server.fake.add_cpu(time.thread_time() - started)
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class _ProxyHandler(StreamRequestHandler):
+
+    def handle(self) -> None:
+        fake = self.server.fake
+        request = self.rfile.readline(1024)
+        headers = {}
+        while True:
+            line = self.rfile.readline(1024).strip()
+            if not line:
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        with fake._lock:
+            fake.requests += 1
+            mode = fake.mode
+        if mode == FakeProxy.MODE_SILENT:
+            time.sleep(fake.latency + 60)
+            return
+        time.sleep(fake.latency)
+        if mode == FakeProxy.MODE_GARBAGE:
+            self.wfile.write(b'SSH-2.0-OpenSSH_9.6\r\n')
+        elif not request.startswith(b'CONNECT '):
+            self.wfile.write(b'HTTP/1.1 405 Method Not Allowed\r\n\r\n')
+        elif fake.credentials and headers.get('proxy-authorization') != f'Basic {fake.credentials}':
+            self.wfile.write(b'HTTP/1.1 407 Proxy Authentication Required\r\n\r\n')
+        else:
+            self.wfile.write(b'HTTP/1.1 200 Connection established\r\n\r\n')
+
+
+class _ProxyServer(ThreadingTCPServer):
+    # Silent mode parks handler threads, they must not hold up the exit
+    daemon_threads = True
+
+
+class FakeProxy:
+    """
+    Loopback HTTP proxy answering CONNECT without opening the tunnel.
+
+    Modes:
+        ok       200 after `latency` seconds, 407 without the right credentials
+        silent   accept the connection and never answer
+        garbage  answer with something that is not HTTP
+
+    stop() closes the socket, so the next check sees a refused connection.
+    """
+    MODE_OK = 'ok'
+    MODE_SILENT = 'silent'
+    MODE_GARBAGE = 'garbage'
+
+    def __init__(self, latency: float = 0.0, username: Optional[str] = None, password: Optional[str] = None,
+                 mode: str = MODE_OK, host: str = '127.0.0.1', port: int = 0):
+        self.latency = latency
+        self.username = username
+        self.password = password
+        self.mode = mode
+        self.host = host
+        self.port = port
+
+        self.credentials = base64.b64encode(f'{username}:{password}'.encode()).decode() if username else None
+        self.requests = 0
+        self._lock = Lock()
+        self._server: Optional[_ProxyServer] = None
+
+    def start(self) -> None:
+        """Bind the socket and start serving in a background thread"""
+        if self._server:
+            return
+        self._server = _ProxyServer((self.host, self.port), _ProxyHandler)
+        self._server.fake = self
+        self.port = self._server.server_address[1]
+        Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        """Stop serving and release the socket"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def address(self) -> str:
+        """Proxy in the host:port[:username:password] form harvesters take"""
+        if self.username:
+            return f'{self.host}:{self.port}:{self.username}:{self.password}'
+        return f'{self.host}:{self.port}'
+
+
+class FakeRecaptchaServer:
+    """
+    Loopback HTTP server standing in for the shop and for Google.
+
+    Endpoints:
+        GET  /shop/<n>                          page with a reCAPTCHA widget
+        POST /recaptcha/api2/userverify?k=...   issue a token for a solved widget
+
+    Tokens are derived from a seed and a counter, so a run issues the same tokens
+    every time, and the issue time of each one is kept to measure capture latency.
+    """
+
+    def __init__(self, sitekey: str = SITEKEY, seed: int = 0, host: str = '127.0.0.1', port: int = 0):
+        self.sitekey = sitekey
+        self.seed = seed
+        self.host = host
+        self.port = port
+
+        self.issued: Dict[str, float] = {}
+        self.cpu_time = 0.0
+        self._counter = 0
+        self._lock = Lock()
+        self._server: Optional[HTTPServer] = None
+
+    def start(self) -> None:
+        """Bind the socket and start serving in a background thread"""
+        if self._server:
+            return
+        self._server = HTTPServer((self.host, self.port), _RequestHandler)
+        self._server.fake = self
+        self.port = self._server.server_address[1]
+        Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        """Stop serving and release the socket"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def page_url(self, number: int) -> str:
+        return f'http://{self.host}:{self.port}/shop/{number}'
+
+    def issue(self, sitekey: str) -> str:
+        """Create a token, reCAPTCHA tokens are a few hundred characters long"""
+        with self._lock:
+            self._counter += 1
+            digest = hashlib.sha256(f'{self.seed}:{sitekey}:{self._counter}'.encode()).hexdigest()
+            token = '03A' + digest * 8
+            self.issued[token] = time.monotonic()
+        return token
+
+    def fetch_token(self, sitekey: str) -> str:
+        """Ask for a token over HTTP, as the widget does once the challenge is solved"""
+        url = f'http://{self.host}:{self.port}/recaptcha/api2/userverify?k={sitekey}'
+        with urllib.request.urlopen(urllib.request.Request(url, data=b'', method='POST'), timeout=10) as response:
+            return response.read().decode('ascii')
+
+    def add_cpu(self, seconds: float) -> None:
+        with self._lock:
+            self.cpu_time += seconds
+
+
+class _Widget:
+    """Captcha rendered by SETUP_JS in one fake page"""
+
+    def __init__(self, browser: 'FakeBrowser', control_class: str, sitekey: str, pending_key: str,
+                 endpoint: Optional[str], trace: bool = False):
+        self.browser = browser
+        self.control_class = control_class
+        self.sitekey = sitekey
+        self.pending_key = pending_key
+        self.endpoint = endpoint
+        self.trace = trace
+        self.pending: List[str] = []
+        # Trace events queued like SETUP_JS does while tracing
+        self.events: List[list] = []
+        self.active = True
+
+
+class CaptchaSolver:
+    """
+    Solves every rendered widget after a random delay around solve_time, on one thread.
+
+    A solve fetches a token from the server, queues it in the page like the widget
+    callback does and POSTs it to the harvester's push endpoint like the extension.
+    The delay sequence of each harvester is seeded by its id.
+    """
+
+    def __init__(self, server: FakeRecaptchaServer, solve_time: float = 5.0, seed: int = 0):
+        self.server = server
+        self.solve_time = solve_time
+        self.seed = seed
+
+        self.solved = 0
+        self.cpu_time = 0.0
+        self._heap: list = []
+        self._sequence = 0
+        self._rngs: Dict[int, random.Random] = {}
+        self._condition = Condition()
+        self._running = False
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        Thread(target=self._run, daemon=True).start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    def schedule(self, widget: _Widget) -> None:
+        """Queue the next solve of a widget"""
+        with self._condition:
+            rng = self._rngs.setdefault(widget.browser.id, random.Random(self.seed * 1000003 + widget.browser.id))
+            due = time.monotonic() + self.solve_time * rng.uniform(0.5, 1.5)
+            self._sequence += 1
+            heapq.heappush(self._heap, (due, self._sequence, widget))
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._running and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    self._condition.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                if not self._running:
+                    return
+                _, _, widget = heapq.heappop(self._heap)
+
+            started = time.thread_time()
+            try:
+                self._solve(widget)
+            except Exception:
+                pass
+            self.cpu_time += time.thread_time() - started
+
+    def _solve(self, widget: _Widget) -> None:
+        if not widget.active:
+            return
+        token = self.server.fetch_token(widget.sitekey)
+        if not widget.browser.deliver(widget, token):
+            return
+        self.solved += 1
+
+        if widget.endpoint:
+            request = urllib.request.Request(
+                widget.endpoint, data=token.encode('ascii'), headers={'Content-Type': 'text/plain'}, method='POST'
+            )
+            with urllib.request.urlopen(request, timeout=10):
+                pass
+
+        # The widget callback resets the captcha for the next solve
+        self.schedule(widget)
+
+
+class FakeBrowser(Browser):
+    """
+    Browser whose WebDriver calls are answered in process after a simulated round trip.
+
+    Implements the calls harvesters make: execute_script for the harvester scripts,
+    find_elements, get_log, window size and handles, get, refresh and quit. Every
+    call sleeps latency (plus up to jitter) seconds and is counted and timed the
+    way Browser.execute counts real commands.
+    """
+    latency = 0.002
+    jitter = 0.0
+    solver: Optional[CaptchaSolver] = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.page_url: Optional[str] = None
+        self.page_html = ''
+        self.widget: Optional[_Widget] = None
+        self.window = (800, 600)
+        self._page_lock = Lock()
+        self._latency_rng = random.Random(getattr(self, 'id', 0))
+
+        for argument in self.options.arguments:
+            match = WINDOW_SIZE_PATTERN.match(argument)
+            if match:
+                self.window = (int(match.group(1)), int(match.group(2)))
+
+    def start(self, url: str = None) -> bool:
+        self._command('newSession')
+        if url:
+            self.get(url)
+            return bool(self.wait_for_ready_state())
+        return True
+
+    def get(self, url: str) -> None:
+        self._command('get')
+        with urllib.request.urlopen(url, timeout=10) as response:
+            html = response.read().decode('utf-8')
+        with self._page_lock:
+            self._close_widget()
+            self.page_url = url
+            self.page_html = html
+
+    def refresh(self) -> None:
+        self.get(self.page_url)
+
+    def execute_script(self, script: str, *args):
+        self._command('executeScript')
+        if script == 'return document.readyState;':
+            return 'complete' if self.page_url else 'loading'
+        if script == PAGE_STATE_JS:
+            with self._page_lock:
+                is_set = bool(self.widget and self.widget.control_class == args[1])
+                return [is_set, self._drain(args[0]), 'complete', self.window[0], self.window[1],
+                        self._drain_events(args[0])]
+        if script == DRAIN_JS:
+            with self._page_lock:
+                return self._drain(args[0])
+        if script == TRACE_DRAIN_JS:
+            with self._page_lock:
+                return self._drain_events(args[0])
+        if script == IS_SET_JS:
+            with self._page_lock:
+                return bool(self.widget and self.widget.control_class == args[0])
+        if script == SETUP_JS:
+            self._render(*args)
+            return None
+        if script == 'grecaptcha.reset();':
+            return None
+        return None
+
+    def find_elements(self, by: str = By.ID, value: Optional[str] = None) -> list:
+        self._command('findElements')
+        with self._page_lock:
+            if by == By.CLASS_NAME and self.widget and self.widget.control_class == value:
+                return [value]
+        return []
+
+    def get_log(self, log_type: str) -> list:
+        self._command('getLog')
+        return []
+
+    def get_window_size(self, windowHandle: str = 'current') -> dict:
+        self._command('getWindowRect')
+        return {'width': self.window[0], 'height': self.window[1]}
+
+    def set_window_size(self, width, height, windowHandle: str = 'current') -> None:
+        self._command('setWindowRect')
+        self.window = (int(width), int(height))
+
+    @property
+    def window_handles(self) -> List[str]:
+        self._command('getWindowHandles')
+        return ['main']
+
+    def quit(self) -> None:
+        with self._page_lock:
+            self._close_widget()
+            self.page_url = None
+        self._alive = False
+
+    def deliver(self, widget: _Widget, token: str) -> bool:
+        """Queue a solved token in the page, False if the widget is gone"""
+        with self._page_lock:
+            if not widget.active or widget is not self.widget:
+                return False
+            widget.pending.append(token)
+            if widget.trace:
+                widget.events.append(['solved', time.time() * 1000, token[-16:]])
+            return True
+
+    def _render(self, title: str, html: str, callback_name: str, pending_key: str,
+                endpoint: Optional[str], loader: Optional[str], trace: bool = False) -> None:
+        control = CONTROL_PATTERN.search(html)
+        sitekey = SITEKEY_PATTERN.search(html)
+        with self._page_lock:
+            self._close_widget()
+            self.widget = _Widget(
+                self, control.group(1) if control else '', sitekey.group(1) if sitekey else '', pending_key, endpoint,
+                trace
+            )
+            widget = self.widget
+        if self.solver:
+            self.solver.schedule(widget)
+
+    def _drain(self, pending_key: str) -> List[str]:
+        # Page lock held
+        if not self.widget or self.widget.pending_key != pending_key:
+            return []
+        pending, self.widget.pending = self.widget.pending, []
+        return pending
+
+    def _drain_events(self, pending_key: str) -> List[list]:
+        # Page lock held
+        if not self.widget or self.widget.pending_key != pending_key:
+            return []
+        events, self.widget.events = self.widget.events, []
+        return events
+
+    def _close_widget(self) -> None:
+        # Page lock held
+        if self.widget:
+            self.widget.active = False
+            self.widget = None
+
+    def _command(self, name: str) -> None:
+        started = time.perf_counter()
+        self.round_trips += 1
+        delay = self.latency + (self._latency_rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+        WEBDRIVER_SECONDS.labels(name).observe(time.perf_counter() - started)
+        self._alive = True
+        self._alive_at = time.monotonic()
+
+
+class FakeHarvester(Harvester, FakeBrowser):
+    """Harvester running on a FakeBrowser with a throwaway profile path"""
+
+    def __init__(self, url: str, sitekey: str, solver: CaptchaSolver, latency: float = 0.002,
+                 jitter: float = 0.0, **kwargs):
+        self.solver = solver
+        self.latency = latency
+        self.jitter = jitter
+        super().__init__(url, sitekey, **kwargs)
+
+    def setup_paths(self) -> None:
+        # Nothing is launched, so no profile is cloned
+        self.profile_path = f'{tempfile.gettempdir()}/harvester-benchmark-{self.id}'
+        self.extension_path = self.EXTENSION_BLUEPRINT_DIR
+        self.proxy_auth_extension_path = None
@@ -0,0 +1,99 @@
+"""
+Measure how long importing harvester takes for each kind of consumer.
+
+Usage:
+    python benchmarks/import_time.py [--repeat N] [--check] [--budget-ms MS]
+
+Every scenario runs in a fresh interpreter with -X importtime and reports the
+median import time and which heavy dependencies got loaded. With --check the
+script exits non-zero when a scenario loads a dependency it must not need, or
+when it takes longer than its budget. tests/test_import_time.py runs the same
+checks under pytest.
+"""
+import argparse
+import pathlib
+import statistics
+import subprocess
+import sys
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+HEAVY = ('selenium', 'webdriver_manager', 'requests', 'urllib3')
+
+# (name, statement, dependencies it must not load, budget in ms)
+SCENARIOS = (
+    ('import harvester', 'import harvester', HEAVY, 100),
+    ('token pool', 'from harvester import Token, TokenPool', HEAVY, 150),
+    ('manager', 'from harvester import HarvesterManager, TokenLease', HEAVY, 200),
+    ('token server', 'from harvester import TokenServer', HEAVY, 300),
+    ('sitekey discovery', 'from harvester import SitekeyDiscovery', ('selenium', 'webdriver_manager'), None),
+    ('full harvester', 'from harvester import Harvester', (), None),
+)
+
+REPORT = "import sys; print(','.join(sorted(name for name in {heavy!r} if name in sys.modules)))"
+
+
+def run(statement: str):
+    """Import time in ms and heavy modules loaded, None if the statement failed"""
+    code = f'{statement}; ' + REPORT.format(heavy=HEAVY)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1:]
+
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Only top level entries, nested ones are part of their parent's cumulative time
+        if not name.startswith('  '):
+            total += int(cumulative)
+    loaded = [name for name in result.stdout.strip().split(',') if name]
+    return total / 1000, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per scenario, the median counts')
+    parser.add_argument('--check', action='store_true', help='Exit non-zero on a regression')
+    parser.add_argument('--budget-ms', type=float, help='Override every scenario budget')
+    args = parser.parse_args()
+
+    failures = []
+    print(f'{"scenario":<20}{"median ms":>11}{"budget":>9}  heavy modules loaded')
+    for name, statement, forbidden, budget in SCENARIOS:
+        budget = args.budget_ms if args.budget_ms and budget is not None else budget
+        times, loaded = [], []
+        for _ in range(args.repeat):
+            elapsed, loaded = run(statement)
+            if elapsed is None:
+                break
+            times.append(elapsed)
+
+        if not times:
+            print(f'{name:<20}{"failed":>11}{"":>9}  {" ".join(loaded)}')
+            if forbidden:
+                failures.append(f'{name}: import failed')
+            continue
+
+        median = statistics.median(times)
+        print(f'{name:<20}{median:>11.1f}{budget or "-":>9}  {", ".join(loaded) or "-"}')
+
+        unexpected = [module for module in loaded if module in forbidden]
+        if unexpected:
+            failures.append(f'{name}: loaded {", ".join(unexpected)}')
+        if budget is not None and median > budget:
+            failures.append(f'{name}: {median:.1f} ms over the {budget} ms budget')
+
+    if failures:
+        print()
+        print('\n'.join(failures))
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
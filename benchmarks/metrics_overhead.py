@@ -0,0 +1,120 @@
+"""
+Measure what the built-in instrumentation costs.
+
+Usage:
+    python benchmarks/metrics_overhead.py [--iterations N] [--check] [--budget-ns NS]
+
+Times the raw metric updates with the registry enabled and disabled, then the
+token hot path (HarvesterManager.push_response + take_response, which bumps
+the consumed counter and the token age histogram) both ways. With --check the
+script exits non-zero when one enabled update costs more than the budget, so
+it can guard against regressions in CI.
+"""
+import argparse
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from harvester.metrics import REGISTRY, Registry  # noqa: E402
+from harvester.harvester_manager import HarvesterManager  # noqa: E402
+from harvester.token_pool import Token  # noqa: E402
+
+SITEKEY = '6Le-wvkSAAAAAPBMRTvw0Q4Muexq9bi0DJwx_mJ-'
+
+
+def per_call_ns(function, iterations: int, repeat: int = 5) -> float:
+    """Best of several runs, in ns per call"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        function(iterations)
+        best = min(best, time.perf_counter_ns() - started)
+    return best / iterations
+
+
+def micro_benchmarks(registry: Registry):
+    counter = registry.counter('bench_total', 'Benchmark counter')
+    labelled = registry.counter('bench_labelled_total', 'Benchmark counter', ('sitekey',))
+    histogram = registry.histogram('bench_seconds', 'Benchmark histogram')
+
+    def baseline(n):
+        for _ in range(n):
+            pass
+
+    def counter_inc(n):
+        for _ in range(n):
+            counter.inc()
+
+    def labels_inc(n):
+        for _ in range(n):
+            labelled.labels(SITEKEY).inc()
+
+    def labels_int_inc(n):
+        # Harvester ids are ints, like TOKENS_HARVESTED.labels(self.id)
+        for _ in range(n):
+            labelled.labels(7).inc()
+
+    def histogram_observe(n):
+        for i in range(n):
+            histogram.observe(0.0125)
+
+    return (
+        ('empty loop', baseline),
+        ('Counter.inc', counter_inc),
+        ('labels().inc', labels_inc),
+        ('labels(int).inc', labels_int_inc),
+        ('Histogram.observe', histogram_observe),
+    )
+
+
+def token_round_trip(n):
+    manager = HarvesterManager()
+    for i in range(n):
+        manager.push_response(Token(f'token-{i}', SITEKEY, 'https://example.com'))
+        manager.take_response(SITEKEY)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200000, help='Calls per measurement')
+    parser.add_argument('--check', action='store_true', help='Exit non-zero when an update is over budget')
+    parser.add_argument('--budget-ns', type=float, default=2000.0, help='Allowed cost of one enabled update')
+    args = parser.parse_args()
+
+    registry = Registry()
+    print(f'{"operation":<24}{"enabled ns":>12}{"disabled ns":>13}')
+    failures = []
+    for name, function in micro_benchmarks(registry):
+        registry.enabled = True
+        enabled = per_call_ns(function, args.iterations)
+        registry.enabled = False
+        disabled = per_call_ns(function, args.iterations)
+        print(f'{name:<24}{enabled:>12.0f}{disabled:>13.0f}')
+        if enabled > args.budget_ns:
+            failures.append(f'{name}: {enabled:.0f} ns over the {args.budget_ns:g} ns budget')
+
+    iterations = max(args.iterations // 10, 1)
+    REGISTRY.enabled = True
+    enabled = per_call_ns(token_round_trip, iterations)
+    REGISTRY.enabled = False
+    disabled = per_call_ns(token_round_trip, iterations)
+    REGISTRY.enabled = True
+    overhead = enabled - disabled
+    print(f'{"push + take token":<24}{enabled:>12.0f}{disabled:>13.0f}'
+          f'  overhead {overhead:.0f} ns ({overhead / disabled:.1%})')
+
+    render_started = time.perf_counter()
+    text = REGISTRY.render()
+    print(f'render /metrics: {(time.perf_counter() - render_started) * 1000:.2f} ms, {len(text)} bytes')
+
+    if failures:
+        print()
+        print('\n'.join(failures))
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
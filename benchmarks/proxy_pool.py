@@ -0,0 +1,102 @@
+"""
+Check that ProxyPool ranks, spreads and evicts proxies, offline.
+
+Usage:
+    python benchmarks/proxy_pool.py [--healthy N] [--harvesters N] [--rounds N]
+                                    [--timeout S] [--json FILE]
+
+Starts local FakeProxy instances: healthy ones with latencies from 5 ms up,
+one that requires credentials and gets the right ones, one given the wrong
+password, one that never answers, one that does not speak HTTP and one that is
+shut down. The script runs several health check rounds, reports the wall time
+of each, the resulting ranking and evictions, then hands proxies to a fleet of
+harvesters to show how load is spread. It exits non-zero if a broken proxy
+survived or a healthy one was evicted.
+"""
+import argparse
+import json
+import logging
+import pathlib
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from harvester.proxies import Proxy, ProxyPool  # noqa: E402
+from fakes import FakeProxy  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--healthy', type=int, default=6, help='Healthy proxies, 5 ms slower each')
+    parser.add_argument('--harvesters', type=int, default=24, help='Harvesters taking a proxy')
+    parser.add_argument('--rounds', type=int, default=3, help='Health check rounds')
+    parser.add_argument('--timeout', type=float, default=1.0, help='Health check timeout in seconds')
+    parser.add_argument('--json', type=pathlib.Path, help='Also write the results to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    healthy = [FakeProxy(latency=0.005 * (number + 1)) for number in range(args.healthy)]
+    authed = FakeProxy(latency=0.005, username='user', password='p:ss')
+    wrong_password = FakeProxy(username='user', password='right')
+    silent = FakeProxy(mode=FakeProxy.MODE_SILENT)
+    garbage = FakeProxy(mode=FakeProxy.MODE_GARBAGE)
+    down = FakeProxy()
+    fakes = healthy + [authed, wrong_password, silent, garbage, down]
+    for fake in fakes:
+        fake.start()
+    down.stop()
+
+    wrong = f'{wrong_password.host}:{wrong_password.port}:user:wrong'
+    addresses = [fake.address for fake in healthy + [authed, silent, garbage, down]] + [wrong]
+    pool = ProxyPool(addresses, check_url='https://www.google.com/', check_timeout=args.timeout,
+                     max_failures=args.rounds)
+
+    rounds = []
+    try:
+        for number in range(args.rounds):
+            started = time.monotonic()
+            results = pool.check_all()
+            rounds.append(round(time.monotonic() - started, 3))
+            print(f'round {number + 1}: {len(results)} proxies checked in {rounds[-1] * 1000:.0f} ms')
+
+        stats = pool.stats()
+        print()
+        print(f'{"proxy":<44}{"latency ms":>12}{"checks":>8}')
+        for record in stats['proxies']:
+            latency = '-' if record['latency_ms'] is None else record['latency_ms']
+            print(f'{record["proxy"]:<44}{latency:>12}{record["checks"]:>8}')
+        print()
+        for record in stats['evicted']:
+            print(f'evicted {record["proxy"]}: {record["error"]}')
+
+        assigned = Counter(repr(pool.acquire()) for _ in range(args.harvesters))
+        print()
+        print(f'{args.harvesters} harvesters: ' + ', '.join(f'{proxy} x{count}' for proxy, count in assigned.items()))
+    finally:
+        for fake in fakes:
+            fake.stop()
+
+    expected_live = {Proxy.parse(fake.address) for fake in healthy + [authed]}
+    live = set(pool.proxies())
+    failures = []
+    if live != expected_live:
+        failures.append(f'live proxies {sorted(map(repr, live))} != {sorted(map(repr, expected_live))}')
+
+    if args.json:
+        args.json.write_text(json.dumps({
+            'arguments': dict(vars(args), json=str(args.json)),
+            'round_seconds': rounds,
+            'stats': stats,
+            'assigned': assigned,
+        }, indent=2))
+
+    if failures:
+        print()
+        print('\n'.join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
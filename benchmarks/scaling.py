@@ -0,0 +1,168 @@
+"""
+Measure how HarvesterManager scales from one to hundreds of harvesters, offline.
+
+Usage:
+    python benchmarks/scaling.py [--harvesters 1,10,50,100,250,500] [--duration S]
+                                 [--latency MS] [--jitter MS] [--solve-time S]
+                                 [--workers N] [--no-push] [--unbatched] [--seed N] [--json FILE]
+                                 [--trace FILE]
+
+Harvesters run the real Harvester and manager code on the fake browser and the
+local fake reCAPTCHA page from benchmarks/fakes.py, so no Chrome, ChromeDriver
+or network is needed. For each fleet size the script reports tick throughput,
+WebDriver round trips per tick, token capture latency (token issued by the fake
+server until it is queued in the manager), CPU per harvester with the fake
+server and solver excluded, and the number of threads the fleet adds.
+Solve delays and tokens are seeded, so runs are repeatable. With --trace the
+token lifecycle is recorded, both to measure what tracing costs and to try
+`python -m harvester.trace FILE` on a trace.
+"""
+import argparse
+import json
+import logging
+import pathlib
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from harvester.harvester_manager import HarvesterManager  # noqa: E402
+from harvester.token_listener import TokenListener  # noqa: E402
+from harvester.trace import TRACE  # noqa: E402
+from fakes import FakeRecaptchaServer, CaptchaSolver, FakeHarvester  # noqa: E402
+
+
+def percentile(values, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def run(count: int, server: FakeRecaptchaServer, solver: CaptchaSolver, listener: TokenListener, args):
+    manager = HarvesterManager(delay=args.delay, workers=args.workers)
+    for number in range(count):
+        manager.add_harvester(FakeHarvester(
+            server.page_url(number), server.sitekey, solver,
+            latency=args.latency / 1000, jitter=args.jitter / 1000,
+            push_capture=not args.no_push, token_listener=listener,
+            batched_tick=not args.unbatched,
+        ))
+
+    latencies = []
+
+    def on_tokens(tokens):
+        now = time.monotonic()
+        for token in tokens:
+            issued = server.issued.get(token.response)
+            if issued is not None:
+                latencies.append(now - issued)
+
+    manager.add_response_listener(on_tokens)
+
+    launch_started = time.monotonic()
+    manager.start_harvesters(concurrency=min(count, args.launch_concurrency))
+    launch_seconds = time.monotonic() - launch_started
+    # Let the launcher's threads wind down before counting
+    time.sleep(0.2)
+    baseline_threads = threading.active_count()
+
+    issued_before = len(server.issued)
+    ticks_before = sum(harvester.ticks for harvester in manager.harvesters)
+    trips_before = sum(harvester.tick_round_trips for harvester in manager.harvesters)
+    harness_cpu_before = server.cpu_time + solver.cpu_time
+    cpu_before = time.process_time()
+    started = time.monotonic()
+
+    loop = threading.Thread(target=manager.main_loop, daemon=True)
+    loop.start()
+    thread_samples = []
+    while time.monotonic() - started < args.duration:
+        time.sleep(0.05)
+        thread_samples.append(threading.active_count() - baseline_threads)
+
+    manager.looping = False
+    loop.join()
+    elapsed = time.monotonic() - started
+    cpu = time.process_time() - cpu_before - (server.cpu_time + solver.cpu_time - harness_cpu_before)
+    harvesters = list(manager.harvesters)
+    ticks = sum(harvester.ticks for harvester in harvesters) - ticks_before
+    round_trips = sum(harvester.tick_round_trips for harvester in harvesters) - trips_before
+    issued = len(server.issued) - issued_before
+    manager.stop()
+
+    return {
+        'harvesters': count,
+        'launch_seconds': round(launch_seconds, 3),
+        'ticks_per_second': round(ticks / elapsed, 1),
+        'round_trips_per_tick': round(round_trips / ticks, 3) if ticks else None,
+        'tokens_issued': issued,
+        'tokens_captured': len(latencies),
+        'capture_p50_ms': round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+        'capture_p95_ms': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        'cpu_percent_per_harvester': round(cpu / elapsed / count * 100, 3),
+        'cpu_ms_per_tick': round(cpu / ticks * 1000, 3) if ticks else None,
+        'threads_median': statistics.median(thread_samples) if thread_samples else 0,
+        'threads_peak': max(thread_samples, default=0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--harvesters', default='1,10,50,100,250,500', help='Comma separated fleet sizes')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds measured per fleet size')
+    parser.add_argument('--latency', type=float, default=2.0, help='WebDriver round trip latency in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra latency of up to this many ms')
+    parser.add_argument('--solve-time', type=float, default=5.0, help='Mean seconds from render to solve')
+    parser.add_argument('--delay', type=float, default=0.1, help='Manager tick delay in seconds')
+    parser.add_argument('--workers', type=int, help='Tick on a pool of this many threads instead of a thread per tick')
+    parser.add_argument('--launch-concurrency', type=int, default=32, help='Harvesters starting at once')
+    parser.add_argument('--no-push', action='store_true', help='Capture tokens by polling only')
+    parser.add_argument('--unbatched', action='store_true', help='Use the per-call tick instead of the batched one')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for solve delays and tokens')
+    parser.add_argument('--json', type=pathlib.Path, help='Also write the results to this file')
+    parser.add_argument('--trace', type=pathlib.Path, help='Record the token lifecycle to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    if args.trace:
+        TRACE.open(args.trace)
+    server = FakeRecaptchaServer(seed=args.seed)
+    server.start()
+    solver = CaptchaSolver(server, args.solve_time, args.seed)
+    solver.start()
+    listener = TokenListener()
+    listener.start()
+
+    columns = (
+        ('harvesters', 'harvesters', 11), ('ticks_per_second', 'ticks/s', 10),
+        ('round_trips_per_tick', 'trips/tick', 11), ('tokens_issued', 'issued', 8), ('tokens_captured', 'captured', 10),
+        ('capture_p50_ms', 'p50 ms', 9), ('capture_p95_ms', 'p95 ms', 9),
+        ('cpu_percent_per_harvester', 'cpu %/h', 9), ('cpu_ms_per_tick', 'cpu ms/tick', 12),
+        ('threads_median', 'threads', 9), ('threads_peak', 'peak', 6),
+    )
+    header = ''.join(f'{title:>{width}}' for _, title, width in columns)
+    print(header)
+    print('-' * len(header))
+
+    results = []
+    try:
+        for count in (int(value) for value in args.harvesters.split(',')):
+            result = run(count, server, solver, listener, args)
+            results.append(result)
+            print(''.join(f'{"-" if result[key] is None else result[key]:>{width}}' for key, _, width in columns))
+    finally:
+        listener.stop()
+        solver.stop()
+        server.stop()
+        TRACE.close()
+
+    if args.json:
+        arguments = dict(vars(args), json=str(args.json), trace=args.trace and str(args.trace))
+        args.json.write_text(json.dumps({'arguments': arguments, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
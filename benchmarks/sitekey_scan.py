@@ -0,0 +1,134 @@
+"""
+Compare the streaming sitekey scanner with reading and parsing whole pages.
+
+Usage:
+    python benchmarks/sitekey_scan.py [DIRECTORY_OF_SAVED_HTML_PAGES] [--bandwidth MBPS]
+
+Without a directory a synthetic corpus of storefront sized pages is generated,
+with the captcha near the top, in the middle, at the bottom and missing.
+Download time is modelled from the bytes read at the given bandwidth.
+"""
+from html.parser import HTMLParser
+import argparse
+import pathlib
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from harvester.sitekeys import scan_stream, find_sitekey, SCAN_CHUNK_SIZE  # noqa: E402
+
+SITEKEY = '6Le-wvkSAAAAAPBMRTvw0Q4Muexq9bi0DJwx_mJ-'
+
+
+class _FullParser(HTMLParser):
+    # Stand-in for building a full DOM before looking for the sitekey
+    def __init__(self):
+        super().__init__()
+        self.sitekey = None
+
+    def handle_starttag(self, tag, attrs):
+        attributes = dict(attrs)
+        if self.sitekey is None and 'data-sitekey' in attributes:
+            self.sitekey = attributes['data-sitekey']
+
+
+def synthetic_corpus(size: int = 3 * 1024 * 1024):
+    rng = random.Random(0)
+    filler_line = '<div class="product"><a href="/p/{0}">{1}</a><span class="price">{2}</span></div>\n'
+
+    def filler(length):
+        parts, total = [], 0
+        while total < length:
+            name = ''.join(rng.choice(string.ascii_letters) for _ in range(24))
+            line = filler_line.format(rng.randint(0, 10**6), name, rng.randint(1, 999))
+            parts.append(line)
+            total += len(line)
+        return ''.join(parts)
+
+    widget = f'<form><div class="g-recaptcha" data-sitekey="{SITEKEY}"></div></form>\n'
+    head = '<!doctype html><html><head><title>Store</title></head><body>\n'
+    for name, position in (('top', 0.02), ('middle', 0.5), ('bottom', 0.98), ('missing', None)):
+        if position is None:
+            body = filler(size)
+        else:
+            body = filler(int(size * position)) + widget + filler(int(size * (1 - position)))
+        yield name, (head + body + '</body></html>').encode('utf-8')
+
+
+def load_corpus(directory: pathlib.Path):
+    for path in sorted(directory.glob('*.htm*')):
+        yield path.name, path.read_bytes()
+
+
+def chunked(data: bytes, chunk_size: int = SCAN_CHUNK_SIZE):
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+
+def full_read(data: bytes):
+    text = b''.join(chunked(data)).decode('utf-8', errors='replace')
+    parser = _FullParser()
+    parser.feed(text)
+    sitekey = parser.sitekey or find_sitekey(text)[0]
+    return sitekey, len(data)
+
+
+def streamed(data: bytes):
+    sitekey, _, read = scan_stream(chunked(data))
+    return sitekey, read
+
+
+def measure(function, data: bytes, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        sitekey, read = function(data)
+        best = min(best, time.perf_counter() - started)
+    return sitekey, read, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('corpus', nargs='?', type=pathlib.Path, help='Directory of saved HTML pages')
+    parser.add_argument('--bandwidth', type=float, default=20.0, help='Modelled download speed in MB/s')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per page, the best one counts')
+    args = parser.parse_args()
+
+    corpus = list(load_corpus(args.corpus) if args.corpus else synthetic_corpus())
+    if not corpus:
+        print(f'No .htm/.html pages in {args.corpus}')
+        return
+
+    bandwidth = args.bandwidth * 1024 * 1024
+    header = f'{"page":<24}{"size KB":>10}{"full KB":>10}{"stream KB":>11}{"full ms":>10}{"stream ms":>11}{"saved ms":>10}'
+    print(header)
+    print('-' * len(header))
+
+    totals = [0, 0, 0.0, 0.0]
+    for name, data in corpus:
+        full_key, full_bytes, full_cpu = measure(full_read, data, args.repeat)
+        stream_key, stream_bytes, stream_cpu = measure(streamed, data, args.repeat)
+        if full_key != stream_key:
+            print(f'{name}: scanners disagree, full={full_key} stream={stream_key}')
+
+        # Download time dominates in practice, add it to the measured parsing time
+        full_ms = (full_cpu + full_bytes / bandwidth) * 1000
+        stream_ms = (stream_cpu + stream_bytes / bandwidth) * 1000
+        totals[0] += full_bytes
+        totals[1] += stream_bytes
+        totals[2] += full_ms
+        totals[3] += stream_ms
+        print(f'{name[:23]:<24}{len(data) / 1024:>10.0f}{full_bytes / 1024:>10.0f}{stream_bytes / 1024:>11.0f}'
+              f'{full_ms:>10.1f}{stream_ms:>11.1f}{full_ms - stream_ms:>10.1f}')
+
+    print('-' * len(header))
+    print(f'{"total":<24}{"":>10}{totals[0] / 1024:>10.0f}{totals[1] / 1024:>11.0f}'
+          f'{totals[2]:>10.1f}{totals[3]:>11.1f}{totals[2] - totals[3]:>10.1f}')
+    print(f'bytes read: {totals[1] / max(totals[0], 1):.1%} of a full download at {args.bandwidth:g} MB/s')
+
+
+if __name__ == '__main__':
+    main()
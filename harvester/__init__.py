@@ -1,5 +1,75 @@
-from .harvester import Harvester
-from .harvester_manager import HarvesterManager
-from .browser import Browser
+from typing import TYPE_CHECKING
+import importlib
 
-__all__ = ['Harvester', 'HarvesterManager', 'Browser']
\ No newline at end of file
+# Public name -> module defining it. Modules load on first attribute access (PEP 562),
+# so consumers of the token pool or server never import Selenium or requests.
+_EXPORTS = {
+    'Harvester': 'harvester',
+    'HarvesterManager': 'harvester_manager',
+    'TokenLease': 'harvester_manager',
+    'AsyncHarvesterManager': 'async_manager',
+    'ShardedHarvesterManager': 'sharding',
+    'RemoteHarvester': 'sharding',
+    'Browser': 'browser',
+    'DevToolsConnection': 'devtools',
+    'TokenListener': 'token_listener',
+    'TickScheduler': 'scheduler',
+    'Token': 'token_pool',
+    'TokenPool': 'token_pool',
+    'TokenServer': 'server',
+    'FleetLauncher': 'fleet',
+    'StandbyPool': 'fleet',
+    'DriverResolver': 'driver_cache',
+    'ProfileProvisioner': 'profiles',
+    'Proxy': 'proxies',
+    'ProxyPool': 'proxies',
+    'HarvesterSupervisor': 'supervisor',
+    'Autoscaler': 'autoscaler',
+    'DropPlanner': 'planner',
+    'TokenJournal': 'journal',
+    'TokenInjector': 'injector',
+    'SitekeyDiscovery': 'sitekeys',
+    'Registry': 'metrics',
+    'REGISTRY': 'metrics',
+    'TraceLog': 'trace',
+    'TRACE': 'trace',
+}
+
+__all__ = list(_EXPORTS)
+
+if TYPE_CHECKING:
+    from .harvester import Harvester
+    from .harvester_manager import HarvesterManager, TokenLease
+    from .async_manager import AsyncHarvesterManager
+    from .sharding import ShardedHarvesterManager, RemoteHarvester
+    from .browser import Browser
+    from .devtools import DevToolsConnection
+    from .token_listener import TokenListener
+    from .scheduler import TickScheduler
+    from .token_pool import Token, TokenPool
+    from .server import TokenServer
+    from .fleet import FleetLauncher, StandbyPool
+    from .driver_cache import DriverResolver
+    from .profiles import ProfileProvisioner
+    from .proxies import Proxy, ProxyPool
+    from .supervisor import HarvesterSupervisor
+    from .autoscaler import Autoscaler
+    from .planner import DropPlanner
+    from .journal import TokenJournal
+    from .injector import TokenInjector
+    from .sitekeys import SitekeyDiscovery
+    from .metrics import Registry, REGISTRY
+    from .trace import TraceLog, TRACE
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
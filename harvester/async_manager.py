@@ -0,0 +1,164 @@
+from .harvester_manager import HarvesterManager
+from .token_pool import Token, Domain
+from collections import deque
+from typing import Optional, Dict, Any, Deque, List, AsyncIterator, Tuple, TYPE_CHECKING
+import asyncio
+
+if TYPE_CHECKING:
+    from .harvester import Harvester
+
+
+class AsyncHarvesterManager:
+    """
+    asyncio facade over HarvesterManager.
+
+    Waiting tasks park on futures grouped by (url, sitekey) filter. Each queued
+    token is handed straight to one of them from the manager's response listener,
+    so any number of tasks can wait without polling. Ticks run in the default
+    executor and never block the loop.
+    """
+
+    def __init__(self, manager: Optional[HarvesterManager] = None, **manager_kwargs: Any):
+        """
+        Initialize the async manager
+
+        Args:
+            manager: Existing manager to wrap, a new one is created when omitted
+            manager_kwargs: Arguments for the new HarvesterManager
+        """
+        self.manager = manager or HarvesterManager(**manager_kwargs)
+        self.looping = False
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._waiters: Dict[Domain, Deque[Tuple[asyncio.Future, float]]] = {}
+
+        self.manager.add_response_listener(self._on_responses)
+
+    @property
+    def harvesters(self) -> List['Harvester']:
+        return self.manager.harvesters
+
+    def add_harvester(self, harvester: 'Harvester') -> None:
+        """Add a new harvester to manage"""
+        self.manager.add_harvester(harvester)
+
+    def remove_harvester(self, harvester: 'Harvester') -> None:
+        """Remove a harvester from management"""
+        self.manager.remove_harvester(harvester)
+
+    async def start_harvesters(self) -> None:
+        """Start all managed harvesters without blocking the event loop"""
+        await self._bind_loop().run_in_executor(None, self.manager.start_harvesters)
+
+    async def main_loop(self) -> None:
+        """Main update loop, ticking the manager from the default executor"""
+        if self.looping:
+            return
+
+        loop = self._bind_loop()
+        self.looping = True
+        try:
+            while self.looping:
+                await loop.run_in_executor(None, self.manager.tick)
+                if not self.manager.harvesters:
+                    break
+                await asyncio.sleep(self.manager.delay)
+        finally:
+            self.looping = False
+
+    async def stop(self) -> None:
+        """Stop the manager and all harvesters"""
+        self.looping = False
+        await self._bind_loop().run_in_executor(None, self.manager.stop)
+
+    async def get_token(self, sitekey: Optional[str] = None, timeout: Optional[float] = None,
+                        min_ttl: float = 0.0, policy: Optional[str] = None,
+                        url: Optional[str] = None) -> Optional[Token]:
+        """
+        Wait for a solved token
+
+        Args:
+            sitekey: Only accept tokens harvested for this sitekey
+            timeout: Seconds to wait, forever when None
+            min_ttl: Seconds of validity the token must have left
+            policy: Pull policy overriding the manager default
+            url: Only accept tokens harvested on this url
+
+        Returns:
+            Token: Response or None if the timeout passed first
+        """
+        loop = self._bind_loop()
+        response = self.manager.take_response(sitekey, min_ttl, policy, url)
+        if response:
+            return response
+
+        waiter = loop.create_future()
+        waiters = self._waiters.setdefault((url, sitekey), deque())
+        waiters.append((waiter, min_ttl))
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            self._discard(waiters, waiter)
+            return waiter.result() if waiter.done() and not waiter.cancelled() else None
+        except asyncio.CancelledError:
+            self._discard(waiters, waiter)
+            if waiter.done() and not waiter.cancelled():
+                # Handed a token right before being cancelled, put it back
+                self.manager.return_token(waiter.result())
+            raise
+
+    async def tokens(self, sitekey: Optional[str] = None, min_ttl: float = 0.0,
+                     url: Optional[str] = None) -> AsyncIterator[Token]:
+        """Iterate over tokens as they are harvested, each one taken from the queue"""
+        while True:
+            yield await self.get_token(sitekey, min_ttl=min_ttl, url=url)
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        self._loop = asyncio.get_running_loop()
+        return self._loop
+
+    def _on_responses(self, responses: List[Token]) -> None:
+        # Called from manager threads
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._dispatch, responses)
+
+    def _dispatch(self, tokens: List[Token]) -> None:
+        # Hand each token to the waiter with the most specific filter it matches. A waiter
+        # only leaves its queue once the token is claimed for it, so losing the token to
+        # another consumer leaves it waiting for the next one.
+        for token in tokens:
+            ttl = token.ttl()
+            for key in ((token.url, token.sitekey), (None, token.sitekey), (token.url, None), (None, None)):
+                index = self._find_waiter(key, ttl)
+                if index is None:
+                    continue
+                waiters = self._waiters[key]
+                waiter, min_ttl = waiters[index]
+                if not self.manager.claim(token):
+                    # Taken by another consumer first, another queued token may still match
+                    token = self.manager.take_response(key[1], min_ttl, url=key[0])
+                    if token is None:
+                        break
+                del waiters[index]
+                waiter.set_result(token)
+                break
+
+    def _find_waiter(self, key: Domain, ttl: float) -> Optional[int]:
+        waiters = self._waiters.get(key)
+        if not waiters:
+            return None
+        # Drop waiters that timed out or were cancelled
+        while waiters and waiters[0][0].done():
+            waiters.popleft()
+        for index, (waiter, min_ttl) in enumerate(waiters):
+            if not waiter.done() and min_ttl <= ttl:
+                return index
+        return None
+
+    def _discard(self, waiters: Deque, waiter: asyncio.Future) -> None:
+        for index, (queued, _) in enumerate(waiters):
+            if queued is waiter:
+                del waiters[index]
+                return
@@ -0,0 +1,336 @@
+from .harvester_manager import HarvesterManager
+from .token_pool import Domain
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Lock, Event
+from typing import Optional, Dict, List, Any, TYPE_CHECKING
+import math
+import time
+import logging
+
+if TYPE_CHECKING:
+    from .harvester import Harvester
+
+
+class _Policy:
+    """Scaling goal and bounds of one domain"""
+    __slots__ = ('target', 'min_ttl', 'min_harvesters', 'max_harvesters')
+
+    def __init__(self, target: int, min_ttl: float, min_harvesters: int, max_harvesters: int):
+        self.target = target
+        self.min_ttl = min_ttl
+        self.min_harvesters = min_harvesters
+        self.max_harvesters = max_harvesters
+
+
+class _Signals:
+    """Smoothed demand and supply of one domain"""
+    __slots__ = ('checked_at', 'changed_at', 'harvested', 'consumed', 'expired', 'consumption_rate',
+                 'harvest_rate', 'waste_rate', 'depth', 'desired')
+
+    def __init__(self, now: float, harvest_rate: float):
+        self.checked_at = now
+        self.changed_at = 0.0
+        self.harvested: Optional[int] = None
+        self.consumed: Optional[int] = None
+        self.expired: Optional[int] = None
+        self.consumption_rate = 0.0
+        self.harvest_rate = harvest_rate
+        self.waste_rate = 0.0
+        self.depth = 0
+        self.desired = 0
+
+
+class Autoscaler:
+    """
+    Opens and parks harvesters so each domain holds a target of usable tokens.
+
+    Every pass compares the domain's pool depth, counting only tokens with at least
+    min_ttl seconds left, against its target. Consumption, harvest per harvester and
+    expiry waste are tracked as moving averages from the manager's domain counters,
+    and the fleet is sized to cover consumption plus refilling the shortfall within
+    refill_time. Harvesters are added as soon as the pool is short, but only parked
+    once it is well above target (or tokens expire unused) and the domain has been
+    stable for down_cooldown, so the fleet does not flap around the target.
+
+    Parking closes Chrome but keeps the Harvester and its profile, so unparking
+    is a relaunch into a warm profile rather than a fresh harvester.
+    """
+
+    def __init__(self, manager: HarvesterManager, interval: float = 2.0, window: float = 60.0,
+                 refill_time: float = 60.0, expected_solve_time: float = 30.0, hysteresis: float = 0.5,
+                 up_cooldown: float = 5.0, down_cooldown: float = 60.0, park_timeout: float = 10.0,
+                 concurrency: int = 2, **harvester_kwargs: Any):
+        """
+        Initialize the autoscaler
+
+        Args:
+            manager: Manager whose harvesters are scaled
+            interval: Seconds between scaling passes
+            window: Seconds over which rates are averaged
+            refill_time: Seconds in which a shortfall below target should be made up
+            expected_solve_time: Seconds per token per harvester assumed until one is measured
+            hysteresis: Fraction of the target the pool must exceed it by before harvesters are parked
+            up_cooldown: Seconds between two scale ups of a domain
+            down_cooldown: Seconds a domain must go without scaling before a harvester is parked
+            park_timeout: Seconds to wait for a running tick before parking a harvester anyway
+            concurrency: Maximum number of browsers launching at once
+            harvester_kwargs: Arguments for new harvesters
+        """
+        self.manager = manager
+        self.interval = interval
+        self.window = window
+        self.refill_time = refill_time
+        self.expected_solve_time = expected_solve_time
+        self.hysteresis = hysteresis
+        self.up_cooldown = up_cooldown
+        self.down_cooldown = down_cooldown
+        self.park_timeout = park_timeout
+        self.harvester_kwargs = harvester_kwargs
+
+        self.launches = 0
+        self.unparks = 0
+        self.parks = 0
+        self.failed_launches = 0
+
+        self._policies: Dict[Domain, _Policy] = {}
+        self._signals: Dict[Domain, _Signals] = {}
+        self._parked: Dict[Domain, List['Harvester']] = {}
+        self._starting: Dict[Domain, int] = {}
+        self._parking: Dict[Domain, int] = {}
+        self._launched_at: Dict[int, float] = {}
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread: Optional[Thread] = None
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='harvester-autoscale')
+
+        manager.autoscaler = self
+
+    def set_policy(self, url: str, sitekey: str, target: Optional[int], min_ttl: float = 30.0,
+                   min_harvesters: int = 0, max_harvesters: int = 4) -> None:
+        """
+        Scale a domain to hold a number of usable tokens
+
+        Args:
+            url: Url of the domain
+            sitekey: Sitekey of the domain
+            target: Tokens with at least min_ttl left to hold, None stops scaling the domain
+            min_ttl: Seconds of validity a token needs to count towards the target
+            min_harvesters: Harvesters kept open even without demand
+            max_harvesters: Harvesters never exceeded, parked ones not included
+        """
+        domain = (url, sitekey)
+        with self._lock:
+            if target is None:
+                self._policies.pop(domain, None)
+                self._signals.pop(domain, None)
+                return
+            if min_harvesters > max_harvesters:
+                raise ValueError(f"min_harvesters {min_harvesters} is above max_harvesters {max_harvesters}")
+            self._policies[domain] = _Policy(target, min_ttl, min_harvesters, max_harvesters)
+
+    def start(self) -> None:
+        """Run scaling passes in a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, daemon=True, name='harvester-autoscaler')
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop scaling, launches and parks in progress finish in the background"""
+        self._stopped.set()
+        self._executor.shutdown(wait=False)
+        if self.manager.autoscaler is self:
+            self.manager.autoscaler = None
+
+    def parked(self, url: str, sitekey: str) -> List['Harvester']:
+        """Parked harvesters of a domain"""
+        with self._lock:
+            return list(self._parked.get((url, sitekey), ()))
+
+    def check(self) -> None:
+        """Single scaling pass: update the signals of every domain and open or park harvesters"""
+        now = time.monotonic()
+        status = self.manager.domain_status()
+        managed = list(self.manager.harvesters)
+
+        with self._lock:
+            policies = list(self._policies.items())
+
+        depths = {
+            domain: self.manager.token_count(domain[1], policy.min_ttl, domain[0])
+            for domain, policy in policies
+        }
+
+        launch, park = [], []
+        with self._lock:
+            for domain, policy in policies:
+                if self._policies.get(domain) is not policy:
+                    continue
+                active = [
+                    harvester for harvester in managed
+                    if (harvester.url, harvester.sitekey) == domain and not harvester.closed
+                ]
+                signals = self._signals.get(domain)
+                if signals is None:
+                    signals = self._signals[domain] = _Signals(now, 1.0 / self.expected_solve_time)
+                self._update(signals, status.get(domain, {}), len(active), depths[domain], now)
+
+                current = len(active) + self._starting.get(domain, 0)
+                change = self._plan(policy, signals, current, now)
+                if change > 0:
+                    signals.changed_at = now
+                    parked = self._parked.setdefault(domain, [])
+                    for _ in range(change):
+                        unpark = bool(parked)
+                        harvester = parked.pop() if unpark else self.manager.create_harvester(
+                            domain[0], domain[1], **self.harvester_kwargs
+                        )
+                        self._starting[domain] = self._starting.get(domain, 0) + 1
+                        launch.append((domain, harvester, unpark))
+                elif change < 0:
+                    signals.changed_at = now
+                    # Park the most recently opened harvesters, those not mid tick first
+                    candidates = sorted(
+                        active, key=lambda harvester: (not harvester.ticking, self._launched_at.get(harvester.id, 0.0))
+                    )
+                    for harvester in candidates[change:]:
+                        self._parking[domain] = self._parking.get(domain, 0) + 1
+                        park.append((domain, harvester))
+
+        for domain, harvester in park:
+            # Removed right away so the next pass no longer counts it
+            self.manager.remove_harvester(harvester)
+            self._executor.submit(self._park, domain, harvester)
+        for domain, harvester, unpark in launch:
+            self._executor.submit(self._launch, domain, harvester, unpark)
+
+    def stats(self) -> Dict[str, Any]:
+        """Scaling counters and, per domain, the signals and the fleet size they led to"""
+        with self._lock:
+            domains = {}
+            for domain, policy in self._policies.items():
+                signals = self._signals.get(domain)
+                domains[domain] = {
+                    'target': policy.target,
+                    'min_ttl': policy.min_ttl,
+                    'min_harvesters': policy.min_harvesters,
+                    'max_harvesters': policy.max_harvesters,
+                    'depth': signals.depth if signals else None,
+                    'desired': signals.desired if signals else None,
+                    'consumption_rate': round(signals.consumption_rate, 4) if signals else None,
+                    'harvest_rate_per_harvester': round(signals.harvest_rate, 4) if signals else None,
+                    'waste_rate': round(signals.waste_rate, 4) if signals else None,
+                    'starting': self._starting.get(domain, 0),
+                    'parking': self._parking.get(domain, 0),
+                    'parked': len(self._parked.get(domain, ())),
+                }
+            return {
+                'launches': self.launches,
+                'unparks': self.unparks,
+                'parks': self.parks,
+                'failed_launches': self.failed_launches,
+                'domains': domains,
+            }
+
+    def _update(self, signals: _Signals, status: Dict[str, Any], active: int, depth: int, now: float) -> None:
+        # Must be called with the lock held
+        elapsed = now - signals.checked_at
+        harvested = status.get('harvested', 0)
+        consumed = status.get('consumed', 0)
+        expired = status.get('expired', 0)
+
+        if signals.harvested is not None and elapsed > 0:
+            weight = 1 - math.exp(-elapsed / self.window)
+            signals.consumption_rate += weight * ((consumed - signals.consumed) / elapsed - signals.consumption_rate)
+            signals.waste_rate += weight * ((expired - signals.expired) / elapsed - signals.waste_rate)
+            if active:
+                rate = (harvested - signals.harvested) / elapsed / active
+                signals.harvest_rate += weight * (rate - signals.harvest_rate)
+
+        signals.checked_at = now
+        signals.harvested = harvested
+        signals.consumed = consumed
+        signals.expired = expired
+        signals.depth = depth
+
+    def _plan(self, policy: _Policy, signals: _Signals, current: int, now: float) -> int:
+        # Must be called with the lock held. Returns the number of harvesters to open
+        # (positive) or park (negative)
+        shortfall = max(policy.target - signals.depth, 0)
+        demand = signals.consumption_rate + shortfall / self.refill_time
+        # A harvester that has not solved anything yet still counts for a fraction of the prior
+        supply = max(signals.harvest_rate, 0.1 / self.expected_solve_time)
+        desired = min(max(math.ceil(demand / supply), policy.min_harvesters), policy.max_harvesters)
+        signals.desired = desired
+
+        if current < policy.min_harvesters:
+            return policy.min_harvesters - current
+        if current > policy.max_harvesters:
+            return policy.max_harvesters - current
+
+        if desired > current and signals.depth < policy.target:
+            if now - signals.changed_at >= self.up_cooldown:
+                return desired - current
+            return 0
+
+        surplus = signals.depth >= policy.target + max(1, math.ceil(policy.target * self.hysteresis))
+        wasting = signals.waste_rate > 0 and signals.depth >= policy.target
+        if desired < current and (surplus or wasting) and now - signals.changed_at >= self.down_cooldown:
+            # One at a time, the next pass sees what parking it did
+            return -1
+        return 0
+
+    def _launch(self, domain: Domain, harvester: 'Harvester', unpark: bool) -> None:
+        try:
+            if unpark:
+                harvester.restart()
+            else:
+                harvester.start()
+            ok = harvester.ready
+        except Exception as e:
+            logging.error(f"Failed to open harvester {harvester.id}: {e}")
+            ok = False
+
+        added = ok and self.manager.add_harvester(harvester)
+
+        with self._lock:
+            self._starting[domain] -= 1
+            if added:
+                self._launched_at[harvester.id] = time.monotonic()
+                if unpark:
+                    self.unparks += 1
+                else:
+                    self.launches += 1
+            else:
+                if not ok:
+                    self.failed_launches += 1
+                if unpark or ok:
+                    # Keep the profile for the next attempt
+                    self._parked.setdefault(domain, []).append(harvester)
+
+        if ok and not added:
+            # Over the manager's quota
+            harvester.quit()
+
+    def _park(self, domain: Domain, harvester: 'Harvester') -> None:
+        deadline = time.monotonic() + self.park_timeout
+        while harvester.ticking and time.monotonic() < deadline:
+            time.sleep(0.05)
+        try:
+            harvester.quit()
+        except Exception as e:
+            logging.error(f"Failed to close parked harvester {harvester.id}: {e}")
+
+        with self._lock:
+            self._parking[domain] -= 1
+            self._launched_at.pop(harvester.id, None)
+            self._parked.setdefault(domain, []).append(harvester)
+            self.parks += 1
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logging.error(f"Autoscaler pass failed: {e}")
@@ -3,12 +3,27 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver import Chrome, ChromeOptions
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.support.ui import WebDriverWait
-from webdriver_manager.chrome import ChromeDriverManager
+from selenium.common.exceptions import InvalidSessionIdException, NoSuchWindowException, JavascriptException
+from selenium.webdriver.remote.command import Command
+from urllib3.exceptions import MaxRetryError, ProtocolError
+from .driver_cache import DriverResolver
+from .injector import TokenInjector
+from .devtools import DevToolsConnection, DevToolsError, function_call
+from .metrics import WEBDRIVER_SECONDS, DEVTOOLS_SECONDS
+from typing import Optional, List, Tuple, Any
 import os
+import time
 import logging
 
+DRIVER_CLOSED_MESSAGE = 'Unable to evaluate script: disconnected: not connected to DevTools\n'
+
+# Errors that mean the browser or its session is gone rather than a failed command
+DEAD_SESSION_ERRORS = (InvalidSessionIdException, NoSuchWindowException, ConnectionError, MaxRetryError, ProtocolError)
+
 class Browser(Chrome):
-    def __init__(self, executable: str = None, options: list = None, experimental_options: dict = None):
+    def __init__(self, executable: str = None, options: list = None, experimental_options: dict = None,
+                 offline: bool = None, chrome_executable: str = None, liveness_ttl: float = 5.0,
+                 devtools: bool = False):
         """
         Initialize the browser
 
@@ -16,11 +31,32 @@ class Browser(Chrome):
             executable: Path to ChromeDriver executable
             options: List of Chrome options
             experimental_options: Dictionary of experimental options
+            offline: Never download ChromeDriver, see DriverResolver
+            chrome_executable: Chrome binary, used to pick the matching ChromeDriver
+            liveness_ttl: Seconds a successful command vouches for the browser being open
+            devtools: Run scripts over a persistent DevTools WebSocket, chromedriver only for the rest
         """
         self.executable = executable
+        self.offline = offline
+        self.chrome_executable = chrome_executable
+        self.liveness_ttl = liveness_ttl
+        self.devtools = devtools
+
+        # Every command is a round trip to chromedriver, counted to keep ticks cheap
+        self.round_trips = 0
+        self._alive: Optional[bool] = None
+        self._alive_at = 0.0
+        self._injector: Optional[TokenInjector] = None
+        self._devtools: Optional[DevToolsConnection] = None
+        # Window WebDriver commands go to, None until a switch
+        self._window: Optional[str] = None
         if executable and not os.path.isfile(executable):
             self.executable = None
 
+        self.configure_options(options, experimental_options)
+
+    def configure_options(self, options: list = None, experimental_options: dict = None) -> None:
+        """Replace the Chrome options used by the next start"""
         self.options = ChromeOptions()
 
         # Add options
@@ -39,14 +75,24 @@ class Browser(Chrome):
                 self.options.add_experimental_option('useAutomationExtension',
                                                   experimental_options['useAutomationExtension'])
 
-    def start(self, url: str = None) -> None:
-        """Start the browser"""
-        service = Service(self.executable) if self.executable else Service(ChromeDriverManager().install())
+    def start(self, url: str = None) -> bool:
+        """
+        Start the browser
+
+        Returns:
+            bool: False if the page did not finish loading in time
+        """
+        if not self.executable:
+            self.executable = DriverResolver(offline=self.offline, chrome_executable=self.chrome_executable).resolve()
+        service = Service(self.executable)
         super(Browser, self).__init__(service=service, options=self.options)
+        if self.devtools:
+            self.connect_devtools()
 
         if url:
             self.get(url)
-            self.wait_for_ready_state()
+            return bool(self.wait_for_ready_state())
+        return True
 
     def wait_for_ready_state(self, timeout: int = 30) -> bool:
         """Wait for page to be ready"""
@@ -57,19 +103,171 @@ class Browser(Chrome):
         except Exception:
             return False
 
+    def connect_devtools(self) -> bool:
+        """
+        Open the DevTools WebSocket to the current window, scripts fall back to WebDriver without it
+
+        Returns:
+            bool: False if Chrome's debugging endpoint could not be reached
+        """
+        self.close_devtools()
+        try:
+            address = self.capabilities.get('goog:chromeOptions', {}).get('debuggerAddress')
+            if not address:
+                raise ConnectionError("chromedriver reported no debugger address")
+            self._window = self.current_window_handle
+            self._devtools = DevToolsConnection.for_target(address, self._window)
+            return True
+        except (OSError, ValueError) as e:
+            logging.error(f"DevTools transport unavailable, using WebDriver: {e}")
+            return False
+
+    def close_devtools(self) -> None:
+        """Close the DevTools WebSocket"""
+        if self._devtools:
+            self._devtools.close()
+            self._devtools = None
+
+    @property
+    def devtools_connection(self) -> Optional[DevToolsConnection]:
+        """DevTools connection scripts run over, None when they go through chromedriver"""
+        connection = self._devtools
+        # Attached to one page, scripts for other windows go through WebDriver
+        if connection and connection.connected and self._window == connection.target_id:
+            return connection
+        return None
+
+    def execute_script(self, script: str, *args) -> Any:
+        """Run a script in the page, over DevTools when connected and the arguments are plain data"""
+        connection = self.devtools_connection
+        if connection is None:
+            return super().execute_script(script, *args)
+        try:
+            expression = function_call(script, args)
+        except TypeError:
+            # WebElement arguments only exist on the WebDriver side
+            return super().execute_script(script, *args)
+        return self._devtools_call(connection, [expression])[0]
+
+    def execute_scripts(self, calls: List[Tuple[str, tuple]]) -> List[Any]:
+        """
+        Run several scripts, pipelined in one round trip over DevTools
+
+        Args:
+            calls: (script, args) pairs
+
+        Returns:
+            list: Result of each script, or the JavascriptException it raised
+        """
+        connection = self.devtools_connection
+        try:
+            expressions = [function_call(script, args) for script, args in calls] if connection else None
+        except TypeError:
+            expressions = None
+        if expressions is None:
+            results = []
+            for script, args in calls:
+                try:
+                    results.append(super().execute_script(script, *args))
+                except JavascriptException as e:
+                    results.append(e)
+            return results
+        return self._devtools_call(connection, expressions, raise_errors=False)
+
+    def _devtools_call(self, connection: DevToolsConnection, expressions: List[str],
+                       raise_errors: bool = True) -> List[Any]:
+        self.round_trips += 1
+        started = time.perf_counter()
+        try:
+            if len(expressions) == 1:
+                replies = [connection.call('Runtime.evaluate', DevToolsConnection.evaluate_params(expressions[0]))]
+            else:
+                replies = connection.call_many([
+                    ('Runtime.evaluate', DevToolsConnection.evaluate_params(expression)) for expression in expressions
+                ])
+        except ConnectionError:
+            self._alive = False
+            raise
+        except DevToolsError as e:
+            self._alive = None
+            raise JavascriptException(str(e))
+        finally:
+            DEVTOOLS_SECONDS.labels('Runtime.evaluate').observe(time.perf_counter() - started)
+        self._alive = True
+        self._alive_at = time.monotonic()
+
+        results = []
+        for reply in replies:
+            try:
+                if isinstance(reply, DevToolsError):
+                    raise reply
+                results.append(DevToolsConnection.value(reply))
+            except DevToolsError as e:
+                if raise_errors:
+                    raise JavascriptException(str(e))
+                results.append(JavascriptException(str(e)))
+        return results
+
     @property
     def is_website_ready(self) -> bool:
         return self.execute_script('return document.readyState;') == 'complete'
 
+    def execute(self, driver_command: str, params: dict = None) -> dict:
+        """Run a WebDriver command, counting it and recording what it says about liveness"""
+        self.round_trips += 1
+        started = time.perf_counter()
+        if driver_command == Command.SWITCH_TO_WINDOW and params:
+            self._window = params.get('handle')
+        try:
+            response = super().execute(driver_command, params)
+        except DEAD_SESSION_ERRORS:
+            self._alive = False
+            raise
+        except Exception:
+            # A failed script or lookup does not tell whether the browser is still there
+            self._alive = None
+            raise
+        finally:
+            WEBDRIVER_SECONDS.labels(driver_command).observe(time.perf_counter() - started)
+        self._alive = True
+        self._alive_at = time.monotonic()
+        return response
+
+    @property
+    def injector(self) -> TokenInjector:
+        """Token injector for the page open in this browser"""
+        if self._injector is None:
+            self._injector = TokenInjector(self)
+        return self._injector
+
+    def quit(self) -> None:
+        """Close the browser"""
+        self.close_devtools()
+        try:
+            super().quit()
+        finally:
+            self._alive = False
+
     @property
     def is_open(self) -> bool:
+        """Whether the browser is open, answered from recent commands when possible"""
+        if self._alive is False:
+            return False
+        if self._alive and time.monotonic() - self._alive_at < self.liveness_ttl:
+            return True
+        if self._devtools:
+            # The WebSocket closes with the browser, no need to ask chromedriver
+            self._alive = self._devtools.connected
+            self._alive_at = time.monotonic()
+            return self._alive
+
         try:
             log = self.get_log('driver')
-            if not log:
-                return True
-            return log[0].get('message') != DRIVER_CLOSED_MESSAGE
+            alive = not log or log[0].get('message') != DRIVER_CLOSED_MESSAGE
         except Exception:
-            return False
+            alive = False
+        self._alive = alive
+        return alive
 
     def find_element_safe(self, by: By, value: str, timeout: int = 10):
         """Safe element finding with wait"""
@@ -0,0 +1,289 @@
+from . import websocket
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from threading import Thread, Lock
+from typing import Optional, Dict, List, Any, Tuple, Callable
+from urllib.parse import urlsplit
+import urllib.request
+import base64
+import itertools
+import socket
+import json
+import os
+import logging
+
+# Chrome sends whole DOM snapshots or screenshots in one message if asked
+MAX_MESSAGE_SIZE = 64 << 20
+
+
+class DevToolsError(Exception):
+    """Command rejected by Chrome or script that threw"""
+
+
+def function_call(script: str, args: Tuple = ()) -> str:
+    """
+    Expression running a WebDriver style script body with its arguments
+
+    Raises:
+        TypeError: If an argument is not JSON, e.g. a WebElement
+    """
+    return f'(function(){{{script}\n}}).apply(null, {json.dumps(list(args))})'
+
+
+class DevToolsConnection:
+    """
+    Persistent WebSocket to one Chrome page speaking the DevTools protocol.
+
+    Commands are written as soon as they are issued and matched to their replies
+    by id on a reader thread, so any number can be in flight at once: call_many
+    pipelines a batch into one write and waits for all replies together, paying
+    one round trip instead of one per command. Events are passed to on_event.
+    """
+
+    def __init__(self, url: str, target_id: Optional[str] = None, timeout: float = 10.0,
+                 on_event: Optional[Callable[[str, Dict], None]] = None):
+        """
+        Initialize the connection, it is opened by connect
+
+        Args:
+            url: webSocketDebuggerUrl of the page
+            target_id: DevTools target id of the page, equal to its WebDriver window handle
+            timeout: Seconds to connect and to wait for a reply
+            on_event: Optional callback called with (method, params) of every event
+        """
+        self.url = url
+        self.target_id = target_id
+        self.timeout = timeout
+        self.on_event = on_event
+
+        self.calls = 0
+        self.events = 0
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, Tuple[str, Future]] = {}
+        self._lock = Lock()
+        self._send_lock = Lock()
+        self._socket: Optional[socket.socket] = None
+        self._stream = None
+        self._connected = False
+
+    @classmethod
+    def for_target(cls, debugger_address: str, target_id: Optional[str] = None,
+                   timeout: float = 10.0) -> 'DevToolsConnection':
+        """
+        Connect to a page of a running Chrome
+
+        Args:
+            debugger_address: host:port of Chrome's remote debugging endpoint
+            target_id: Page to attach to, the first page when None
+
+        Returns:
+            DevToolsConnection: Open connection
+        """
+        with urllib.request.urlopen(f'http://{debugger_address}/json/list', timeout=timeout) as response:
+            targets = json.load(response)
+        pages = [target for target in targets if target.get('type') == 'page' and target.get('webSocketDebuggerUrl')]
+        page = next((target for target in pages if target['id'] == target_id), None) or (pages[0] if pages else None)
+        if page is None:
+            raise ConnectionError(f"No page to attach to at {debugger_address}")
+
+        connection = cls(page['webSocketDebuggerUrl'], page['id'], timeout)
+        connection.connect()
+        return connection
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    def connect(self) -> None:
+        """Open the WebSocket and start reading replies"""
+        parts = urlsplit(self.url)
+        sock = socket.create_connection((parts.hostname, parts.port or 80), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        # No Origin header: Chrome only checks --remote-allow-origins for browser pages
+        sock.sendall((
+            f'GET {parts.path or "/"} HTTP/1.1\r\n'
+            f'Host: {parts.netloc}\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Key: {key}\r\n'
+            'Sec-WebSocket-Version: 13\r\n\r\n'
+        ).encode('latin-1'))
+
+        stream = sock.makefile('rb')
+        status = stream.readline(1024).decode('latin-1').strip()
+        headers = {}
+        while True:
+            line = stream.readline(8192).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if ' 101 ' not in f'{status} ' or headers.get('sec-websocket-accept') != websocket.accept_key(key):
+            sock.close()
+            raise ConnectionError(f"DevTools WebSocket handshake failed: {status}")
+
+        sock.settimeout(None)
+        self._socket, self._stream = sock, stream
+        self._connected = True
+        Thread(target=self._read, daemon=True, name='devtools-reader').start()
+
+    def send(self, method: str, params: Optional[Dict] = None) -> Future:
+        """
+        Issue a command without waiting for its reply
+
+        Returns:
+            Future: Resolves to the command's result or raises DevToolsError
+        """
+        future = Future()
+        command_id = next(self._ids)
+        message = json.dumps({'id': command_id, 'method': method, 'params': params or {}}).encode('utf-8')
+        with self._lock:
+            if not self._connected:
+                raise ConnectionError("DevTools connection is closed")
+            self._pending[command_id] = (method, future)
+            self.calls += 1
+        self._write(websocket.encode_frame(message, mask=True))
+        return future
+
+    def call(self, method: str, params: Optional[Dict] = None, timeout: Optional[float] = None) -> Dict:
+        """Issue a command and wait for its result"""
+        return self._result(self.send(method, params), method, timeout)
+
+    def call_many(self, commands: List[Tuple[str, Optional[Dict]]], timeout: Optional[float] = None) -> List[Any]:
+        """
+        Pipeline several commands in one write and wait for all of them
+
+        Returns:
+            list: Result of each command, or the DevToolsError it failed with
+        """
+        frames, futures = [], []
+        with self._lock:
+            if not self._connected:
+                raise ConnectionError("DevTools connection is closed")
+            for method, params in commands:
+                command_id = next(self._ids)
+                future = Future()
+                self._pending[command_id] = (method, future)
+                futures.append((method, future))
+                frames.append(websocket.encode_frame(
+                    json.dumps({'id': command_id, 'method': method, 'params': params or {}}).encode('utf-8'), mask=True
+                ))
+            self.calls += len(frames)
+        self._write(b''.join(frames))
+
+        results = []
+        for method, future in futures:
+            try:
+                results.append(self._result(future, method, timeout))
+            except DevToolsError as e:
+                results.append(e)
+        return results
+
+    def evaluate(self, expression: str, timeout: Optional[float] = None) -> Any:
+        """
+        Evaluate an expression in the page and return its value
+
+        Raises:
+            DevToolsError: If the expression threw
+        """
+        return self.value(self.call('Runtime.evaluate', self.evaluate_params(expression), timeout))
+
+    @staticmethod
+    def evaluate_params(expression: str) -> Dict[str, Any]:
+        return {'expression': expression, 'returnByValue': True, 'awaitPromise': False}
+
+    @staticmethod
+    def value(result: Dict) -> Any:
+        """Value of a Runtime.evaluate result, raising what the script threw"""
+        details = result.get('exceptionDetails')
+        if details:
+            exception = details.get('exception') or {}
+            raise DevToolsError(exception.get('description') or details.get('text') or 'Script threw')
+        return result.get('result', {}).get('value')
+
+    def close(self) -> None:
+        """Close the WebSocket, commands in flight fail with ConnectionError"""
+        with self._lock:
+            if not self._connected:
+                return
+            self._connected = False
+        try:
+            self._write(websocket.encode_frame(b'\x03\xe8', websocket.OP_CLOSE, mask=True))
+        except OSError:
+            pass
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'connected': self._connected, 'calls': self.calls, 'events': self.events,
+                    'in_flight': len(self._pending)}
+
+    def _result(self, future: Future, method: str, timeout: Optional[float]) -> Any:
+        try:
+            return future.result(self.timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"No reply to {method} within {self.timeout if timeout is None else timeout}s")
+
+    def _write(self, data: bytes) -> None:
+        try:
+            with self._send_lock:
+                self._socket.sendall(data)
+        except OSError:
+            self._disconnected()
+            raise ConnectionError("DevTools connection lost")
+
+    def _read_exactly(self, size: int) -> bytes:
+        data = self._stream.read(size)
+        if len(data) < size:
+            raise EOFError
+        return data
+
+    def _read(self) -> None:
+        try:
+            while True:
+                opcode, payload = websocket.read_frame_blocking(self._read_exactly, MAX_MESSAGE_SIZE)
+                if opcode == websocket.OP_CLOSE:
+                    break
+                if opcode == websocket.OP_PING:
+                    self._write(websocket.encode_frame(payload, websocket.OP_PONG, mask=True))
+                    continue
+                if opcode != websocket.OP_TEXT:
+                    continue
+                self._dispatch(json.loads(payload))
+        except (EOFError, OSError, ValueError, ConnectionError):
+            pass
+        finally:
+            self._disconnected()
+
+    def _dispatch(self, message: Dict) -> None:
+        command_id = message.get('id')
+        if command_id is None:
+            self.events += 1
+            if self.on_event:
+                try:
+                    self.on_event(message.get('method'), message.get('params', {}))
+                except Exception as e:
+                    logging.error(f"DevTools event callback failed: {e}")
+            return
+
+        with self._lock:
+            method, future = self._pending.pop(command_id, (None, None))
+        if future is None:
+            return
+        error = message.get('error')
+        if error:
+            future.set_exception(DevToolsError(f"{method}: {error.get('message')} ({error.get('code')})"))
+        else:
+            future.set_result(message.get('result', {}))
+
+    def _disconnected(self) -> None:
+        with self._lock:
+            self._connected = False
+            pending, self._pending = self._pending, {}
+        for method, future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"DevTools connection lost before {method} replied"))
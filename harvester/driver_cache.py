@@ -0,0 +1,210 @@
+from threading import Lock
+from typing import Optional, Dict, Iterable
+import pathlib
+import shutil
+import subprocess
+import json
+import os
+import re
+import logging
+
+DEFAULT_CHROME_PATHS = (
+    'C:/Program Files/Google/Chrome/Application/chrome.exe',
+    'C:/Program Files (x86)/Google/Chrome/Application/chrome.exe',
+    '/usr/bin/google-chrome',
+    '/usr/bin/google-chrome-stable',
+    '/usr/bin/chromium',
+    '/usr/bin/chromium-browser',
+    '/Applications/Google Chrome.app/Contents/MacOS/Google Chrome',
+)
+
+DEFAULT_CACHE_FILE = pathlib.Path.home() / '.cache' / 'captcha-harvester' / 'chromedriver.json'
+WDM_DRIVERS_DIR = pathlib.Path.home() / '.wdm' / 'drivers' / 'chromedriver'
+DRIVER_NAMES = ('chromedriver', 'chromedriver.exe')
+
+
+class DriverResolver:
+    """
+    Resolves the ChromeDriver executable once per Chrome version.
+
+    The first browser to start pays for the lookup, every later one in the same
+    process reuses the path. Resolved paths are also written to a small JSON
+    cache keyed by Chrome major version, so new processes skip webdriver_manager
+    entirely. In offline mode the network is never touched: the path comes from
+    the cache, PATH or drivers webdriver_manager downloaded earlier.
+    """
+    _resolved: Dict[Optional[str], str] = {}
+    _versions: Dict[Optional[str], Optional[str]] = {}
+    _lock = Lock()
+
+    def __init__(self, offline: Optional[bool] = None, cache_file: Optional[pathlib.Path] = None,
+                 chrome_executable: Optional[str] = None):
+        """
+        Initialize the resolver
+
+        Args:
+            offline: Never download, defaults to the HARVESTER_OFFLINE environment variable
+            cache_file: Persistent cache location, HARVESTER_DRIVER_CACHE or ~/.cache by default
+            chrome_executable: Chrome binary used to detect the installed version
+        """
+        if offline is None:
+            offline = os.environ.get('HARVESTER_OFFLINE', '').lower() in ('1', 'true', 'yes')
+        self.offline = offline
+        self.cache_file = pathlib.Path(cache_file or os.environ.get('HARVESTER_DRIVER_CACHE') or DEFAULT_CACHE_FILE)
+        self.chrome_executable = chrome_executable
+
+    def resolve(self) -> str:
+        """
+        Get the ChromeDriver path for the installed Chrome
+
+        Returns:
+            str: Path to the chromedriver executable
+        """
+        version = self.chrome_major_version()
+        driver = DriverResolver._resolved.get(version)
+        if driver:
+            return driver
+
+        with DriverResolver._lock:
+            # Another launch may have resolved it while we waited
+            driver = DriverResolver._resolved.get(version)
+            if driver:
+                return driver
+
+            driver = None
+            # Without a version any cached or local driver may be for an older Chrome,
+            # only webdriver_manager can pick the matching one
+            if version or self.offline:
+                driver = self._from_cache(version) or self._locate_local(version)
+            if not driver:
+                if self.offline:
+                    raise FileNotFoundError(
+                        f"No cached ChromeDriver for Chrome {version or 'unknown'} and offline mode is on"
+                    )
+                from webdriver_manager.chrome import ChromeDriverManager
+                driver = ChromeDriverManager().install()
+
+            DriverResolver._resolved[version] = driver
+            if version:
+                self._store(version, driver)
+            return driver
+
+    def chrome_major_version(self) -> Optional[str]:
+        """Major version of the installed Chrome, None if it cannot be detected"""
+        if self.chrome_executable in DriverResolver._versions:
+            return DriverResolver._versions[self.chrome_executable]
+
+        version = self._detect_version()
+        DriverResolver._versions[self.chrome_executable] = version
+        return version
+
+    def _detect_version(self) -> Optional[str]:
+        if os.name == 'nt' and not self.chrome_executable:
+            version = self._registry_version()
+            if version:
+                return version
+
+        for path in self._chrome_paths():
+            if os.name == 'nt':
+                # chrome.exe opens a browser window instead of printing its version, read the file version
+                literal = path.replace("'", "''")
+                command = [
+                    'powershell', '-NoProfile', '-NonInteractive', '-Command',
+                    f"(Get-Item -LiteralPath '{literal}').VersionInfo.ProductVersion",
+                ]
+            else:
+                command = [path, '--version']
+            try:
+                output = subprocess.run(command, capture_output=True, text=True, timeout=10).stdout
+            except (OSError, subprocess.SubprocessError):
+                continue
+            match = re.search(r'(\d+)\.\d+\.\d+', output)
+            if match:
+                return match.group(1)
+        return None
+
+    @staticmethod
+    def _registry_version() -> Optional[str]:
+        # Chrome's updater records the installed version here, per user or machine wide
+        try:
+            import winreg
+        except ImportError:
+            return None
+        for root in (winreg.HKEY_CURRENT_USER, winreg.HKEY_LOCAL_MACHINE):
+            try:
+                with winreg.OpenKey(root, r'Software\Google\Chrome\BLBeacon') as key:
+                    value, _ = winreg.QueryValueEx(key, 'version')
+            except OSError:
+                continue
+            match = re.match(r'(\d+)\.', str(value))
+            if match:
+                return match.group(1)
+        return None
+
+    @classmethod
+    def clear(cls) -> None:
+        """Forget paths resolved in this process"""
+        with cls._lock:
+            cls._resolved.clear()
+            cls._versions.clear()
+
+    def _chrome_paths(self) -> Iterable[str]:
+        if self.chrome_executable:
+            yield self.chrome_executable
+        for name in ('google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser'):
+            path = shutil.which(name)
+            if path:
+                yield path
+        for path in DEFAULT_CHROME_PATHS:
+            if os.path.isfile(path):
+                yield path
+
+    def _load_cache(self) -> Dict[str, str]:
+        try:
+            with open(self.cache_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _from_cache(self, version: Optional[str]) -> Optional[str]:
+        driver = self._load_cache().get(version or 'unknown')
+        return driver if driver and os.path.isfile(driver) else None
+
+    def _store(self, version: str, driver: str) -> None:
+        cache = self._load_cache()
+        if cache.get(version) == driver:
+            return
+        cache[version] = driver
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_file.with_suffix('.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(cache, f, indent=2)
+            os.replace(tmp, self.cache_file)
+        except OSError as e:
+            logging.warning(f"Failed to write ChromeDriver cache {self.cache_file}: {e}")
+
+    def _locate_local(self, version: Optional[str]) -> Optional[str]:
+        # Drivers webdriver_manager downloaded before, newest matching version first
+        if WDM_DRIVERS_DIR.is_dir():
+            candidates = [
+                path for name in DRIVER_NAMES for path in WDM_DRIVERS_DIR.rglob(name) if path.is_file()
+            ]
+            if version:
+                candidates = [path for path in candidates if f'{os.sep}{version}.' in str(path)]
+            candidates.sort(key=lambda path: path.stat().st_mtime, reverse=True)
+            if candidates:
+                return str(candidates[0])
+
+        if self.offline:
+            # A driver on PATH is the best guess when nothing can be downloaded
+            for name in DRIVER_NAMES:
+                path = shutil.which(name)
+                if path:
+                    return path
+        return None
+
+
+def resolve_driver(offline: Optional[bool] = None, chrome_executable: Optional[str] = None) -> str:
+    """Shortcut for DriverResolver(...).resolve()"""
+    return DriverResolver(offline=offline, chrome_executable=chrome_executable).resolve()
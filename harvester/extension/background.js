@@ -0,0 +1,28 @@
+// Relays tokens from the content script to the local TokenListener. Only loopback
+// endpoints are accepted so a page cannot use the extension to post elsewhere.
+function isLoopback(endpoint) {
+    try {
+        var url = new URL(endpoint);
+        return url.protocol === 'http:' && (url.hostname === '127.0.0.1' || url.hostname === 'localhost');
+    } catch (e) {
+        return false;
+    }
+}
+
+chrome.runtime.onMessage.addListener(function (message, sender, sendResponse) {
+    if (!message || message.type !== 'harvester-token' || !isLoopback(message.endpoint)) {
+        return;
+    }
+
+    fetch(message.endpoint, {
+        method: 'POST',
+        headers: {'Content-Type': 'text/plain'},
+        body: message.token
+    }).then(function (response) {
+        sendResponse({ok: response.ok});
+    }).catch(function () {
+        sendResponse({ok: false});
+    });
+
+    return true;
+});
@@ -0,0 +1,13 @@
+// Forwards tokens issued by the harvester page to the background worker, which
+// relays them to the Python process.
+window.addEventListener('message', function (event) {
+    if (event.source !== window || !event.data || !event.data.harvesterToken) {
+        return;
+    }
+
+    chrome.runtime.sendMessage({
+        type: 'harvester-token',
+        token: event.data.harvesterToken,
+        endpoint: event.data.harvesterEndpoint
+    });
+});
@@ -0,0 +1,178 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import Lock, Thread
+from typing import Optional, Callable, List, Dict, Any, TYPE_CHECKING
+import time
+import logging
+
+if TYPE_CHECKING:
+    from .harvester import Harvester
+
+
+class FleetLauncher:
+    """
+    Starts harvesters with bounded concurrency, reporting each one as soon as it is up.
+
+    Launching every Chrome at once makes them all crawl, and joining all of them
+    makes one slow page hold back the whole fleet. The launcher keeps at most
+    `concurrency` launches in flight and calls ready_callback per harvester.
+    """
+
+    def __init__(self, concurrency: int = 4, ready_callback: Optional[Callable] = None):
+        """
+        Initialize the launcher
+
+        Args:
+            concurrency: Maximum number of browsers launching at once
+            ready_callback: Optional callback called with (harvester, ok, seconds) per launch
+        """
+        self.concurrency = concurrency
+        self.ready_callback = ready_callback
+
+        self.launch_times: Dict[int, float] = {}
+        self.failed: List['Harvester'] = []
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='harvester-launch')
+        self._lock = Lock()
+
+    def launch(self, harvesters: List['Harvester']) -> List[Future]:
+        """
+        Queue harvesters for launch without waiting for them
+
+        Args:
+            harvesters: Harvesters to start
+
+        Returns:
+            list: One future per harvester resolving to True once it is ready
+        """
+        return [self._executor.submit(self._launch_one, harvester) for harvester in harvesters]
+
+    def launch_and_wait(self, harvesters: List['Harvester'], timeout: Optional[float] = None) -> List['Harvester']:
+        """
+        Launch harvesters and wait for all of them
+
+        Returns:
+            list: Harvesters that came up
+        """
+        futures = self.launch(harvesters)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for future in futures:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                future.result(remaining)
+            except Exception:
+                pass
+        return [harvester for harvester in harvesters if harvester.ready]
+
+    def shutdown(self) -> None:
+        """Stop accepting launches, running ones finish in the background"""
+        self._executor.shutdown(wait=False)
+
+    def _launch_one(self, harvester: 'Harvester') -> bool:
+        started = time.monotonic()
+        try:
+            harvester.start()
+            ok = True
+        except Exception as e:
+            logging.error(f"Failed to launch harvester {harvester.id}: {e}")
+            ok = False
+
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self.launch_times[harvester.id] = elapsed
+            if not ok:
+                self.failed.append(harvester)
+
+        if self.ready_callback:
+            try:
+                self.ready_callback(harvester, ok, elapsed)
+            except Exception as e:
+                logging.error(f"Ready callback failed: {e}")
+        return ok
+
+
+class StandbyPool:
+    """
+    Already launched Chrome instances waiting to be given a page.
+
+    Launching Chrome is most of a harvester's start-up time, so keeping a few
+    blank browsers around lets capacity be added in the time it takes to load
+    a page. The pool refills itself in the background after each assignment.
+    """
+
+    def __init__(self, size: int = 2, concurrency: int = 2, **harvester_kwargs: Any):
+        """
+        Initialize the pool
+
+        Args:
+            size: Number of browsers kept on standby
+            concurrency: Maximum number of browsers launching at once
+            harvester_kwargs: Arguments for each Harvester, url and sitekey are assigned later
+        """
+        self.size = size
+        self.harvester_kwargs = harvester_kwargs
+
+        self.standby: List['Harvester'] = []
+        self._launching = 0
+        self._lock = Lock()
+        self._launcher = FleetLauncher(concurrency, ready_callback=self._on_ready)
+
+    def fill(self) -> None:
+        """Launch browsers until the pool is at its target size"""
+        with self._lock:
+            missing = self.size - len(self.standby) - self._launching
+            if missing <= 0:
+                return
+            self._launching += missing
+
+        from .harvester import Harvester
+        harvesters = [Harvester(url=None, sitekey=None, **self.harvester_kwargs) for _ in range(missing)]
+        self._launcher.launch(harvesters)
+
+    def available(self) -> int:
+        """Number of browsers ready to be assigned"""
+        with self._lock:
+            return len(self.standby)
+
+    def assign(self, url: str, sitekey: str, manager=None) -> Optional['Harvester']:
+        """
+        Take a standby browser and point it at a page
+
+        Args:
+            url: Page to harvest on
+            sitekey: Sitekey of the page
+            manager: Optional HarvesterManager the harvester is added to
+
+        Returns:
+            Harvester: Ready harvester or None if the pool is empty
+        """
+        with self._lock:
+            harvester = self.standby.pop(0) if self.standby else None
+
+        Thread(target=self.fill, daemon=True).start()
+        if harvester is None:
+            logging.warning("No standby browser available")
+            return None
+
+        harvester.assign(url, sitekey)
+        if manager and not manager.add_harvester(harvester):
+            # Over quota, keep the browser for the next assignment
+            with self._lock:
+                self.standby.append(harvester)
+            return None
+        return harvester
+
+    def stop(self) -> None:
+        """Close all standby browsers"""
+        self._launcher.shutdown()
+        with self._lock:
+            standby, self.standby = self.standby, []
+        for harvester in standby:
+            try:
+                harvester.quit()
+            except Exception:
+                pass
+
+    def _on_ready(self, harvester: 'Harvester', ok: bool, elapsed: float) -> None:
+        with self._lock:
+            self._launching -= 1
+            if ok:
+                self.standby.append(harvester)
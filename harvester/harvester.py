@@ -1,24 +1,143 @@
 from .browser import Browser
+from .driver_cache import DEFAULT_CHROME_PATHS
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
-import requests
-from requests_html import HTML
+from selenium.common.exceptions import JavascriptException
+from .token_listener import TokenListener
+from .token_pool import Token
+from .profiles import ProfileProvisioner
+from .proxies import Proxy, ProxyPool
+from .sitekeys import SitekeyDiscovery
+from .metrics import TOKENS_HARVESTED, SOLVE_SECONDS, TICK_SECONDS
+from .trace import TRACE, EVENT_RENDERED, EVENT_CAPTURED, monotonic_from_wall
 import pathlib
 import random
+import re
 import os
+import time
 import datetime
-from distutils.dir_util import copy_tree
+from collections import deque
+from threading import Lock
+from typing import Optional, Callable, NamedTuple, List, Sequence, Union
 import logging
 import sys
 
+LOGIN_URL = 'https://accounts.google.com/signin/v2/identifier?continue=https%3A%2F%2Fmyaccount.google.com%2F'
+LOGIN_AUTO_CLOSE_URL = 'https://accounts.google.com/AccountChooser?harvester_login'
+LOGGED_URL = 'https://myaccount.google.com/'
+
+# Replaces the page with a bare captcha box. The widget callback queues every issued
+# token in the page and hands it to the bundled extension, which relays it to the
+# local TokenListener, so tokens arrive without waiting for the next tick. While
+# tracing, solves and opened challenges are queued with their time for the trace log.
+SETUP_JS = """
+var title = arguments[0], html = arguments[1], callbackName = arguments[2],
+    pendingKey = arguments[3], endpoint = arguments[4], loader = arguments[5], trace = arguments[6];
+var traceKey = pendingKey + 'Trace';
+window[pendingKey] = [];
+window[traceKey] = [];
+window[callbackName] = function (token) {
+    window[pendingKey].push(token);
+    if (trace) {
+        window[traceKey].push(['solved', Date.now(), token.slice(-16)]);
+    }
+    if (endpoint) {
+        window.postMessage({harvesterToken: token, harvesterEndpoint: endpoint}, '*');
+    }
+    grecaptcha.reset();
+};
+document.title = title;
+document.body.innerHTML = html;
+var widget = document.getElementsByClassName('g-recaptcha')[0];
+if (window.grecaptcha && window.grecaptcha.render) {
+    grecaptcha.render(widget, {sitekey: widget.getAttribute('data-sitekey'), callback: window[callbackName]});
+} else {
+    var script = document.createElement('script');
+    if (loader) {
+        script.text = loader;
+    } else {
+        script.src = 'https://www.google.com/recaptcha/api.js';
+        script.async = true;
+    }
+    document.head.appendChild(script);
+}
+clearInterval(window.harvesterTraceTimer);
+if (trace) {
+    // The challenge lives in the bframe iframe, which turns visible when it opens
+    var challengeOpen = false;
+    window.harvesterTraceTimer = setInterval(function () {
+        var frame = document.querySelector('iframe[src*="/bframe"]');
+        var open = !!frame && getComputedStyle(frame).visibility === 'visible';
+        if (open && !challengeOpen) {
+            window[traceKey].push(['challenge', Date.now()]);
+        }
+        challengeOpen = open;
+    }, 100);
+}
+"""
+
+# Drains tokens queued by the widget callback, also picking up a solved widget whose
+# callback never fired
+DRAIN_JS = """
+var pending = window[arguments[0]] || [];
+window[arguments[0]] = [];
+var response = window.grecaptcha && grecaptcha.getResponse ? grecaptcha.getResponse() : '';
+if (response && pending.indexOf(response) < 0) {
+    pending.push(response);
+    grecaptcha.reset();
+}
+return pending;
+"""
+
+# Everything a tick needs from the page in one round trip: whether the harvester
+# markup is in place, drained tokens, readyState, the window size and trace events
+PAGE_STATE_JS = """
+var pendingKey = arguments[0], control = arguments[1];
+var pending = window[pendingKey] || [];
+var trace = window[pendingKey + 'Trace'] || [];
+window[pendingKey] = [];
+window[pendingKey + 'Trace'] = [];
+try {
+    var response = window.grecaptcha && grecaptcha.getResponse ? grecaptcha.getResponse() : '';
+    if (response && pending.indexOf(response) < 0) {
+        pending.push(response);
+        grecaptcha.reset();
+    }
+} catch (e) {}
+return [document.getElementsByClassName(control).length > 0, pending,
+        document.readyState, window.outerWidth, window.outerHeight, trace];
+"""
+
+# Whether the harvester markup is in place, a script so it can run over DevTools
+IS_SET_JS = 'return document.getElementsByClassName(arguments[0]).length > 0;'
+# Drains trace events queued by the page, for ticks that do not read the page state
+TRACE_DRAIN_JS = """
+var trace = window[arguments[0] + 'Trace'] || [];
+window[arguments[0] + 'Trace'] = [];
+return trace;
+"""
+
+
+class PageState(NamedTuple):
+    """Page state collected by a batched tick"""
+    is_set: bool
+    tokens: List[str]
+    ready_state: str
+    width: int
+    height: int
+    # A tuple so states built without trace events never share a list
+    trace: Sequence[list] = ()
+
+
 class Harvester(Browser):
     harvester_count = 0
 
     BASE_DIR = pathlib.Path(os.path.dirname(os.path.realpath(__file__)))
     PROFILES_DIR = BASE_DIR / 'chrome_profiles' / 'harvester'
     EXTENSION_BLUEPRINT_DIR = BASE_DIR / 'extension'
+    provisioner = ProfileProvisioner(PROFILES_DIR.parent, EXTENSION_BLUEPRINT_DIR)
 
 
     @staticmethod
@@ -26,62 +145,43 @@ class Harvester(Browser):
         """
         Get reCAPTCHA sitekey from the webpage.
 
+        Results are cached on disk, use SitekeyDiscovery to look up many pages at once.
+
         Args:
             url: URL to check for sitekey
 
         Returns:
             str: Sitekey if found, None otherwise
         """
-        try:
-            headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-
-            response = requests.get(url, headers=headers, timeout=10)
-            if not response.ok:
-                logging.error(f"Failed to fetch URL: {url}, status code: {response.status_code}")
-                return None
-
-            html = HTML(html=response.text)
-            captcha_elements = html.find('.g-recaptcha')
-
-            if captcha_elements:
-                for element in captcha_elements:
-                    sitekey = element.attrs.get('data-sitekey')
-                    if sitekey:
-                        return sitekey
-
-            patterns = [
-                    r"sitekey:\s*['\"]([0-9A-Za-z\-_]+)['\"]",
-                    r"data-sitekey=['\"]([0-9A-Za-z\-_]+)['\"]",
-                    r"grecaptcha.execute\(['\"]([0-9A-Za-z\-_]+)['\"]",
-            ]
-
-            for pattern in patterns:
-                matches = re.findall(pattern, response.text)
-                if matches:
-                    return matches[0]
-
-            logging.warning(f"No sitekey found at URL: {url}")
-            return None
-
-        except requests.RequestException as e:
-            logging.error(f"Request failed for URL {url}: {str(e)}")
-            return None
-        except Exception as e:
-            logging.error(f"Unexpected error getting sitekey from {url}: {str(e)}")
-            return None
+        return SitekeyDiscovery.shared().get(url)
 
     def __init__(self, url: str, sitekey: str, proxy: str = None, log_in: bool = False,
                  chrome_executable: str = None, chromedriver_executable: str = None,
                  download_js: bool = True, auto_close_login: bool = True,
                  open_youtube: bool = False, harvester_width: int = 420,
                  harvester_height: int = 600, youtube_width: int = 480,
-                 youtube_height: int = 380):
-        """Initialize the Harvester"""
+                 youtube_height: int = 380, push_capture: bool = True,
+                 fallback_poll_interval: float = 2.0,
+                 token_listener: Optional[TokenListener] = None,
+                 offline: bool = None, batched_tick: bool = True,
+                 proxy_pool: Optional[ProxyPool] = None, devtools: bool = False):
+        """
+        Initialize the Harvester
+
+        Args:
+            push_capture: Relay tokens to a local TokenListener the moment they are issued
+            fallback_poll_interval: Seconds between page polls while push capture is enabled
+            token_listener: Listener to relay tokens to, the process wide one by default
+            offline: Never download ChromeDriver, only use cached or installed drivers
+            batched_tick: Read the whole page state in one script call per tick
+            proxy_pool: Take the best proxy of this pool on every start instead of a fixed proxy
+            devtools: Run page scripts over a persistent DevTools WebSocket instead of chromedriver
+        """
         self.url = url
         self.sitekey = sitekey
-        self.proxy = proxy
+        self.proxy = Proxy.parse(proxy) if proxy else None
+        self.proxy_pool = proxy_pool
+        self._pooled_proxy: Optional[Proxy] = None
         self.log_in = log_in
         self.chrome_executable = chrome_executable
         self.download_js = download_js
@@ -91,6 +191,11 @@ class Harvester(Browser):
         self.harvester_height = harvester_height
         self.youtube_width = youtube_width
         self.youtube_height = youtube_height
+        self.push_capture = push_capture
+        self.fallback_poll_interval = fallback_poll_interval
+        self.token_listener = token_listener
+        self.batched_tick = batched_tick
+        self.id = Harvester.harvester_count
 
         self.setup_paths()
 
@@ -100,34 +205,44 @@ class Harvester(Browser):
         super().__init__(
             executable=chromedriver_executable,
             options=chrome_options,
-            experimental_options=experimental_options
+            experimental_options=experimental_options,
+            offline=offline,
+            chrome_executable=chrome_executable,
+            devtools=devtools
         )
 
+        if self.log_in:
+            self.start = self.login_decorator(self.start)
+
         self.response_queue = []
         self.control_element = f'controlElement{random.randint(0, 10**10)}'
+        self.callback_name = f'{self.control_element}Callback'
+        self.pending_key = f'{self.control_element}Pending'
+        self.on_response: Optional[Callable] = None
         self.is_youtube_setup = False
         self.ticking = False
         self.closed = False
+        self.ready = False
+        # Bumped on every restart so a tick still hanging in the old session cannot close the new one
+        self.generation = 0
+        self.tick_started = 0.0
+        self.ticks = 0
+        self.tick_round_trips = 0
+        # When the captcha was last rendered or reset for a new solve
+        self.solve_started: Optional[float] = None
+        self.page_state: Optional[PageState] = None
+
+        self._response_lock = Lock()
+        self._seen_responses = deque(maxlen=64)
+        self._last_poll = 0.0
 
         Harvester.harvester_count += 1
 
     def setup_paths(self):
-        """Setup all required directories and paths"""
-        self.PROFILES_DIR.mkdir(parents=True, exist_ok=True)
-
-        self.profile_path = self.PROFILES_DIR / str(Harvester.harvester_count)
-        self.extension_path = self.profile_path / 'extension'
-        self.proxy_auth_extension_path = self.profile_path / 'proxy_auth_extension'
-
-        self.profile_path.mkdir(parents=True, exist_ok=True)
-        self.extension_path.mkdir(parents=True, exist_ok=True)
-        self.proxy_auth_extension_path.mkdir(parents=True, exist_ok=True)
-
-        if self.EXTENSION_BLUEPRINT_DIR.exists():
-            copy_tree(str(self.EXTENSION_BLUEPRINT_DIR), str(self.extension_path))
-        else:
-            logging.error(f"Extension blueprint directory not found at: {self.EXTENSION_BLUEPRINT_DIR}")
-            raise FileNotFoundError(f"Extension directory not found: {self.EXTENSION_BLUEPRINT_DIR}")
+        """Clone the harvester's profile from the golden profile and locate the shared extension"""
+        self.profile_path = self.provisioner.clone(self.id)
+        self.extension_path = self.provisioner.blueprint_extension()
+        self.proxy_auth_extension_path = None
 
     def configure_instance(self, url, sitekey, proxy, log_in, chrome_executable,
                          download_js, auto_close_login, open_youtube,
@@ -136,7 +251,7 @@ class Harvester(Browser):
         """Configure the harvester instance"""
         self.url = url
         self.sitekey = sitekey
-        self.proxy = proxy
+        self.proxy = Proxy.parse(proxy) if proxy else None
         self.log_in = log_in
         self.chrome_executable = chrome_executable
         self.download_js = download_js
@@ -181,35 +296,20 @@ class Harvester(Browser):
             '--no-sandbox',
             '--disable-gpu',
         ]
-        chrome_experimental_options = {
-            'prefs': {'profile': {'exit_type': 'Normal'}}
-        }
+        extensions = [str(self.extension_path)]
 
         self.use_proxy_extension = False
-
-        if proxy:
-            if len(proxy.split(':')) >= 4:
-
+        if self.proxy:
+            options.append(f'--proxy-server={self.proxy.server}')
+            if self.proxy.has_auth:
                 self.use_proxy_extension = True
-                chrome_options.append('--proxy-server=' + proxy.split(':')[0] + ':' + proxy.split(':')[1])
-                manifest_json, background_js = self.get_proxy_auth_extension(proxy)
-
-                with open(self.proxy_auth_extension_path + '/manifest.json', 'w') as file:
-                    file.write(manifest_json)
-
-                with open(self.proxy_auth_extension_path + '/background.js', 'w') as file:
-                    file.write(background_js)
-
-                chrome_options.append(f'--load-extension={self.proxy_auth_extension_path}')
-            else:
-                chrome_options.append('--proxy-server=' + proxy)
+                self.proxy_auth_extension_path = self.setup_proxy_auth(self.proxy)
+                extensions.append(str(self.proxy_auth_extension_path))
 
-        super(Harvester, self).__init__(executable=self.chromedriver_executable, options=chrome_options, experimental_options=chrome_experimental_options)
+        # Chrome only honours the last --load-extension flag, so all extensions go in one
+        options.append(f'--load-extension={",".join(extensions)}')
 
-        if self.log_in:
-            self.start = self.login_decorator(self.start)
-
-        self.ip_done = False
+        return options
 
     def login_decorator(self, func):
         def wrapper(*args, **kwargs):
@@ -219,7 +319,11 @@ class Harvester(Browser):
         return wrapper
 
     def login(self) -> None:
+        """Log in to Google once in the golden profile and refresh this harvester's clone of it"""
+        self.provisioner.ensure_golden(self._login_into, logged_in=True)
+        self.profile_path = self.provisioner.clone(self.id)
 
+    def _login_into(self, profile_path: pathlib.Path) -> None:
         if self.auto_close_login:
             start_url = LOGIN_AUTO_CLOSE_URL
             # This JS script is opening new window and closing window that was open before to get around the Chrome rule "Scripts may close only the windows that were opened by them.", so after user log in to Google, window can be closed automatically.
@@ -228,26 +332,26 @@ class Harvester(Browser):
             start_url = LOGIN_URL
             content_js = ''
 
-        with open(f'{self.extension_path}/content.js', 'w') as f:
-            f.write(content_js)
+        files = self.provisioner.blueprint_files()
+        files['content.js'] = content_js
+        extensions = [f'"{self.provisioner.extension_dir("login", files)}"']
 
         chrome_args = [
             f'--app={start_url}',
             f'--window-size={self.harvester_width},{self.harvester_height}',
-            f'--user-data-dir="{self.profile_path}"',
+            f'--user-data-dir="{profile_path}"',
             '--disable-infobars',
             '--disable-menubar',
             '--disable-toolbar',
             '--log-level=3',
-            f'--load-extension="{self.extension_path}"',
         ]
 
         if self.proxy:
+            chrome_args.append(f'--proxy-server={self.proxy.server}')
             if self.use_proxy_extension:
-                chrome_args.append('--proxy-server=' + self.proxy.split(':')[0] + ':' + self.proxy.split(':')[1])
-                chrome_args.append(f'--load-extension="{self.extension_path}","{self.proxy_auth_extension_path}"')
-            else:
-                chrome_args.append('--proxy-server=' + self.proxy)
+                extensions.append(f'"{self.proxy_auth_extension_path}"')
+
+        chrome_args.append(f'--load-extension={",".join(extensions)}')
 
         command = ''
         for arg in chrome_args:
@@ -266,19 +370,36 @@ class Harvester(Browser):
             return
         if self.is_set:
             return
+        self.inject()
 
+    def inject(self) -> None:
+        """Replace the page with the harvester markup and render the captcha"""
         captcha_js = "(function(){var w=window,C='___grecaptcha_cfg',cfg=w[C]=w[C]||{},N='grecaptcha';var gr=w[N]=w[N]||{};gr.ready=gr.ready||function(f){(cfg['fns']=cfg['fns']||[]).push(f);};w['__recaptcha_api']='https://www.google.com/recaptcha/api2/';(cfg['render']=cfg['render']||[]).push('onload');w['__google_recaptcha_client']=true;var d=document,po=d.createElement('script');po.type='text/javascript';po.async=true;po.src='https://www.gstatic.com/recaptcha/releases/-FJgYf1d3dZ_QPcZP7bd85hc/recaptcha__en.js';po.crossOrigin='anonymous';po.integrity='sha384-w2lIrXdcsRgXIRsq1Y2C2rGrB0G3iE5CLYGxlFzUAbix3gGjUFYcQavOqddMOp1u';var e=d.querySelector('script[nonce]'),n=e&&(e['nonce']||e.getAttribute('nonce'));if(n){po.setAttribute('nonce',n);}var s=d.getElementsByTagName('script')[0];s.parentNode.insertBefore(po, s);})();"
 
         harvester_title = f'Harvester {self.id}'
-        if self.proxy:
-            if len(self.proxy.split(':')) >= 4:
-                options.append(f'--proxy-server={self.proxy.split(":")[0]}:{self.proxy.split(":")[1]}')
-                self.setup_proxy_auth(self.proxy)
-                options.append(f'--load-extension={self.proxy_auth_extension_path}')
-            else:
-                options.append(f'--proxy-server={self.proxy}')
+        html = (
+            f'<div class="{self.control_element}"></div>'
+            f'<div class="g-recaptcha" data-sitekey="{self.sitekey}" data-callback="{self.callback_name}"></div>'
+        )
 
-        return options
+        endpoint = None
+        if self.push_capture:
+            if not self.token_listener:
+                self.token_listener = TokenListener.shared()
+            endpoint = self.token_listener.register(self)
+
+        self.solve_started = time.monotonic()
+        self.execute_script(
+            SETUP_JS,
+            harvester_title,
+            html,
+            self.callback_name,
+            self.pending_key,
+            endpoint,
+            captcha_js if self.download_js else None,
+            TRACE.enabled,
+        )
+        TRACE.emit(EVENT_RENDERED, self.id, self.sitekey, at=self.solve_started)
 
     def create_experimental_options(self) -> dict:
         """Create experimental options for Chrome"""
@@ -292,83 +413,83 @@ class Harvester(Browser):
             'useAutomationExtension': False
         }
 
-    def setup_proxy_auth(self, proxy: str) -> None:
-        """Setup proxy authentication if needed"""
-        proxy_parts = proxy.split(':')
-        if len(proxy_parts) >= 4:
-            manifest_json = '''{
-                "version": "1.0.0",
-                "manifest_version": 2,
-                "name": "Chrome Proxy",
-                "permissions": [
-                    "proxy",
-                    "tabs",
-                    "unlimitedStorage",
-                    "storage",
-                    "<all_urls>",
-                    "webRequest",
-                    "webRequestBlocking"
-                ],
-                "background": {
-                    "scripts": ["background.js"]
-                }
-            }'''
-
-            background_js = f'''
-                var config = {{
-                    mode: "fixed_servers",
-                    rules: {{
-                        singleProxy: {{
-                            scheme: "http",
-                            host: "{proxy_parts[0]}",
-                            port: parseInt({proxy_parts[1]})
-                        }},
-                        bypassList: ["localhost"]
-                    }}
-                }};
-
-                chrome.proxy.settings.set({{value: config, scope: "regular"}}, function() {{}});
-
-                function callbackFn(details) {{
-                    return {{
-                        authCredentials: {{
-                            username: "{proxy_parts[2]}",
-                            password: "{proxy_parts[3]}"
-                        }}
-                    }};
-                }}
-
-                chrome.webRequest.onAuthRequired.addListener(
-                    callbackFn,
-                    {{urls: ["<all_urls>"]}},
-                    ['blocking']
-                );
-            '''
-
-            with open(self.proxy_auth_extension_path / 'manifest.json', 'w') as f:
-                f.write(manifest_json)
-            with open(self.proxy_auth_extension_path / 'background.js', 'w') as f:
-                f.write(background_js)
+    def setup_proxy_auth(self, proxy: Union[str, Proxy]) -> Optional[pathlib.Path]:
+        """
+        Setup proxy authentication if needed
 
-    def setup_paths(self):
-        """Setup all required directories and paths"""
-        self.PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+        Returns:
+            Path: Shared proxy auth extension directory, None for proxies without credentials
+        """
+        proxy = Proxy.parse(proxy)
+        if not proxy.has_auth:
+            return None
+        return proxy.auth_extension(self.provisioner)
 
-        self.profile_path = self.PROFILES_DIR / str(Harvester.harvester_count)
-        self.extension_path = self.profile_path / 'extension'
-        self.proxy_auth_extension_path = self.profile_path / 'proxy_auth_extension'
+    def start(self, url: str = None) -> None:
+        """Launch Chrome and open the harvester's page, marking it ready once loaded"""
+        url = url or self.url
+        try:
+            if self.proxy_pool:
+                self._use_pooled_proxy()
+            loaded = super().start(url)
+        except Exception:
+            self.closed = True
+            raise
+        if self._pooled_proxy:
+            # A dead proxy shows Chrome's error page, a slow one times out
+            self.proxy_pool.report(self._pooled_proxy, loaded, error=None if loaded else 'page load timed out')
+        self.ready = bool(url)
+
+    def _use_pooled_proxy(self) -> None:
+        # Swaps in the best proxy of the pool, the options are only rebuilt when it changed
+        if self._pooled_proxy:
+            self.proxy_pool.release(self._pooled_proxy)
+            self._pooled_proxy = None
+        proxy = self.proxy_pool.acquire()
+        if proxy is None:
+            raise RuntimeError("No proxy left in the pool")
+        self._pooled_proxy = proxy
+        if proxy != self.proxy:
+            self.proxy = proxy
+            self.configure_options(self.create_chrome_options(), self.create_experimental_options())
+
+    def restart(self) -> None:
+        """Relaunch a closed or hung browser into the same profile, slot and page"""
+        self.generation += 1
+        try:
+            self.quit()
+        except Exception:
+            pass
+
+        self.control_element = f'controlElement{random.randint(0, 10**10)}'
+        self.callback_name = f'{self.control_element}Callback'
+        self.pending_key = f'{self.control_element}Pending'
+        self.is_youtube_setup = False
+        self.page_state = None
+        self.ticking = False
+        self.closed = False
+        self.start()
 
-        self.profile_path.mkdir(parents=True, exist_ok=True)
-        self.extension_path.mkdir(parents=True, exist_ok=True)
-        self.proxy_auth_extension_path.mkdir(parents=True, exist_ok=True)
+    def assign(self, url: str, sitekey: str) -> None:
+        """
+        Point a running harvester at a new page and sitekey
 
-        if self.EXTENSION_BLUEPRINT_DIR.exists():
-            copy_tree(str(self.EXTENSION_BLUEPRINT_DIR), str(self.extension_path))
-        else:
-            logging.error(f"Extension blueprint directory not found at: {self.EXTENSION_BLUEPRINT_DIR}")
-            raise FileNotFoundError(f"Extension directory not found: {self.EXTENSION_BLUEPRINT_DIR}")
+        Args:
+            url: Page to harvest on
+            sitekey: Sitekey of the page
+        """
+        self.ready = False
+        self.url = url
+        self.sitekey = sitekey
+        self.control_element = f'controlElement{random.randint(0, 10**10)}'
+        self.callback_name = f'{self.control_element}Callback'
+        self.pending_key = f'{self.control_element}Pending'
+        self.is_youtube_setup = False
+        self.page_state = None
 
-        return {}
+        self.get(url)
+        self.wait_for_ready_state()
+        self.ready = True
 
     def reset_harvester(self) -> None:
         """Reset the captcha for a new solve"""
@@ -377,6 +498,8 @@ class Harvester(Browser):
 
         try:
             self.execute_script('grecaptcha.reset();')
+            self.solve_started = time.monotonic()
+            TRACE.emit(EVENT_RENDERED, self.id, self.sitekey, at=self.solve_started)
         except Exception as e:
             logging.error(f"Failed to reset harvester: {e}")
 
@@ -394,7 +517,7 @@ class Harvester(Browser):
 
     def setup_youtube(self) -> None:
         """Setup YouTube window for solving assistance"""
-        if not self.is_open or self.is_youtube_setup or not self.open_youtube:
+        if self.is_youtube_setup or not self.open_youtube or not self.is_open:
             return
 
         try:
@@ -422,40 +545,164 @@ class Harvester(Browser):
 
     def tick(self) -> None:
         """Main update loop for the harvester"""
+        generation = self.generation
         self.ticking = True
+        self.tick_started = time.monotonic()
+        self.ticks += 1
+        round_trips = self.round_trips
 
         try:
-            self.setup()
-            self.setup_youtube()
-            self.response_check()
-            self.window_size_check()
+            if self.batched_tick:
+                self.batched_update()
+            else:
+                self.setup()
+                self.setup_youtube()
+                if self.poll_due:
+                    self.response_check()
+                self.window_size_check()
         except Exception as e:
+            if generation != self.generation:
+                return
             logging.error(f"Harvester tick failed: {e}")
             self.closed = True
 
-        self.ticking = False
+        if generation == self.generation:
+            TICK_SECONDS.observe(time.monotonic() - self.tick_started)
+            self.tick_round_trips += self.round_trips - round_trips
+            self.ticking = False
+
+    def batched_update(self) -> None:
+        """
+        Tick using one script call for the page state
+
+        While tokens are pushed and the page was set up on the last read, ticks
+        between fallback polls make no calls at all.
+        """
+        if self.page_state and self.page_state.is_set and not self.poll_due:
+            return
+
+        self._last_poll = time.monotonic()
+        try:
+            self.page_state = PageState(*self.execute_script(PAGE_STATE_JS, self.pending_key, self.control_element))
+        except JavascriptException as e:
+            # Navigation in progress, try again next tick
+            logging.error(f"Failed to read harvester page state: {e}")
+            self.page_state = None
+            return
+
+        state = self.page_state
+        self._trace_page(state.trace)
+        for response in state.tokens:
+            self.add_response(response)
+
+        if not state.is_set and state.ready_state == 'complete':
+            self.inject()
+
+        if state.width != self.harvester_width or state.height != self.harvester_height:
+            self.set_window_size(self.harvester_width, self.harvester_height)
+
+        self.setup_youtube()
+
+    @property
+    def round_trips_per_tick(self) -> float:
+        """Average number of chromedriver round trips per tick"""
+        return self.tick_round_trips / self.ticks if self.ticks else 0.0
+
+    @property
+    def poll_due(self) -> bool:
+        """Whether the page should be polled for tokens on this tick"""
+        if not self.push_capture:
+            return True
+        return time.monotonic() - self._last_poll >= self.fallback_poll_interval
 
     def response_check(self) -> None:
         """Check for and handle new captcha responses"""
-        response = self.get_response()
-        if response:
-            self.reset_harvester()
-            self.response_queue.append(response)
+        self._last_poll = time.monotonic()
+        if TRACE.enabled:
+            try:
+                self._trace_page(self.execute_script(TRACE_DRAIN_JS, self.pending_key) or [])
+            except Exception as e:
+                logging.error(f"Failed to read harvester trace events: {e}")
+        for response in self.get_response():
+            self.add_response(response)
+
+    def _trace_page(self, events: Sequence[list]) -> None:
+        # Page events carry their wall clock time in milliseconds, then the token key if any
+        for event in events:
+            TRACE.emit(
+                event[0], self.id, self.sitekey, event[2] if len(event) > 2 else None,
+                at=monotonic_from_wall(event[1] / 1000)
+            )
+
+    def get_response(self) -> list:
+        """Drain tokens issued by the page since the last check"""
+        try:
+            return self.execute_script(DRAIN_JS, self.pending_key) or []
+        except Exception as e:
+            logging.error(f"Failed to read harvester response: {e}")
+            return []
+
+    def push_response(self, response: str) -> None:
+        """Accept a token relayed by the TokenListener"""
+        self.add_response(response, via='push')
+
+    def add_response(self, response: str, via: str = 'poll') -> bool:
+        """
+        Queue a solved token, ignoring tokens already delivered by the other capture path
+
+        Args:
+            response: reCAPTCHA response token
+            via: Capture path, 'push' or 'poll', recorded in the trace log
+
+        Returns:
+            bool: True if the token was new
+        """
+        with self._response_lock:
+            if response in self._seen_responses:
+                return False
+            self._seen_responses.append(response)
+
+        token = Token(response, sitekey=self.sitekey, url=self.url, harvester_id=self.id)
+        TOKENS_HARVESTED.labels(self.id).inc()
+        if self.solve_started is not None:
+            SOLVE_SECONDS.observe(token.captured_at - self.solve_started)
+        # The widget resets itself after every solve
+        self.solve_started = token.captured_at
+        TRACE.emit_token(EVENT_CAPTURED, token, at=token.captured_at, via=via)
+
+        if self.on_response:
+            self.on_response(token)
+        else:
+            with self._response_lock:
+                self.response_queue.append(token)
+        return True
+
+    def quit(self) -> None:
+        """Close the browser and stop receiving pushed tokens"""
+        self.ready = False
+        if self._pooled_proxy:
+            self.proxy_pool.release(self._pooled_proxy)
+            self._pooled_proxy = None
+        if self.token_listener:
+            self.token_listener.unregister(self)
+        super().quit()
 
     @property
     def is_set(self) -> bool:
         """Check if harvester is properly configured"""
         try:
-            return bool(self.find_elements(By.CLASS_NAME, self.control_element))
+            return bool(self.execute_script(IS_SET_JS, self.control_element))
         except Exception:
             return False
 
     def pull_response_queue(self) -> list:
         """Get and clear all responses"""
-        responses = self.response_queue.copy()
-        self.response_queue.clear()
+        with self._response_lock:
+            responses = self.response_queue.copy()
+            self.response_queue.clear()
         return responses
 
-    def pull_response(self) -> dict:
+    def pull_response(self) -> Optional[Token]:
         """Get and remove oldest response"""
-        return self.response_queue.pop(0) if self.response_queue else {}
+        with self._response_lock:
+            return self.response_queue.pop(0) if self.response_queue else None
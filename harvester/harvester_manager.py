@@ -1,41 +1,209 @@
-from .harvester import Harvester
+from .scheduler import TickScheduler
+from .fleet import FleetLauncher
+from .token_pool import TokenPool, Token, Domain, POLICY_OLDEST
+from .journal import TokenJournal
+from .metrics import REGISTRY, TOKENS_CONSUMED, TOKENS_EXPIRED, TOKEN_AGE_SECONDS
+from .trace import TRACE, EVENT_POOLED, EVENT_HANDED, EVENT_RETURNED, EVENT_EXPIRED
 import time
-import datetime
 import logging
-from threading import Thread, Lock
-from typing import Optional, Callable, List, Dict, Any
+import weakref
+from threading import Thread, Lock, Condition
+from collections import deque
+from typing import Optional, Callable, List, Dict, Any, Deque, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # Importing Harvester pulls in Selenium, only load it when a browser is needed
+    from .harvester import Harvester
+    from .autoscaler import Autoscaler
+    from .planner import DropPlanner
 
 class HarvesterManager:
-    def __init__(self, delay: float = 0.1, response_callback: Optional[Callable] = None):
+    def __init__(self, delay: float = 0.1, response_callback: Optional[Callable] = None,
+                 workers: Optional[int] = None, tick_deadline: float = 5.0,
+                 stuck_timeout: float = 30.0, pull_policy: str = POLICY_OLDEST,
+                 closed_callback: Optional[Callable] = None, journal: Optional[TokenJournal] = None):
         """
         Initialize the harvester manager
 
         Args:
             delay: Time between tick updates
             response_callback: Optional callback for new responses
+            workers: Run ticks on a fixed pool of this many threads instead of a thread per tick
+            tick_deadline: Seconds after which a pooled tick is reported as overdue
+            stuck_timeout: Seconds after which the worker of a hung tick is replaced
+            pull_policy: Default token pull policy, 'oldest' or 'freshest'
+            closed_callback: Optional callback called with each closed harvester after it is dropped
+            journal: Optional journal queued responses are kept in, its tokens are loaded into the pool
         """
         self.delay = delay
         self.response_callback = response_callback
+        self.closed_callback = closed_callback
+        # Set by an Autoscaler, which may open harvesters while none are managed
+        self.autoscaler: Optional['Autoscaler'] = None
+        # Set by a DropPlanner, which opens harvesters ahead of scheduled releases
+        self.planner: Optional['DropPlanner'] = None
+
+        self.scheduler: Optional[TickScheduler] = None
+        if workers:
+            self.scheduler = TickScheduler(
+                workers=workers,
+                tick_deadline=tick_deadline,
+                stuck_timeout=stuck_timeout
+            )
 
-        self.harvesters: List[Harvester] = []
-        self.response_queue: List[Dict[str, Any]] = []
+        self.harvesters: List['Harvester'] = []
+        self.response_queue = TokenPool(policy=pull_policy)
+        self.response_listeners: List[Callable] = []
+        self.quotas: Dict[Domain, int] = {}
+        self.domain_stats: Dict[Domain, Dict[str, int]] = {}
         self.looping = False
         self._lock = Lock()
+        # Blocked acquire calls by (url, sitekey) filter, None in either place accepts any.
+        # A filter's deque is dropped with its last waiter
+        self._waiters: Dict[Domain, Deque[_Waiter]] = {}
+        # Responses handed out that may still come back through return_token, in hand out order
+        self._outstanding: Dict[str, Token] = {}
+        self._outstanding_order: Deque[Token] = deque()
+
+        self.journal = journal
+        if journal:
+            restored = journal.load()
+            self.response_queue.extend(restored)
+            if restored:
+                logging.info(f"Restored {len(restored)} responses from {journal.path}")
+
+        # Gauges hold a weak reference so a dropped manager is not kept alive by the registry
+        ref = weakref.ref(self)
+        REGISTRY.gauge(
+            'harvester_tokens_queued', 'Tokens waiting in the pool, per sitekey',
+            lambda: ref().token_counts() if ref() else {}, 'sitekey'
+        )
+        REGISTRY.gauge(
+            'harvester_harvesters', 'Harvesters managed',
+            lambda: len(ref().harvesters) if ref() else 0
+        )
+
+    def create_harvester(self, url: str, sitekey: str, **harvester_kwargs) -> 'Harvester':
+        """
+        Build a harvester for this manager, neither added nor started
+
+        Args:
+            url: Url of the page to harvest on
+            sitekey: Sitekey of the captcha
+            harvester_kwargs: Remaining Harvester arguments
 
-    def add_harvester(self, harvester: Harvester) -> None:
-        """Add a new harvester to manage"""
+        Returns:
+            Harvester: New harvester
+        """
+        from .harvester import Harvester
+        return Harvester(url=url, sitekey=sitekey, **harvester_kwargs)
+
+    def add_harvester(self, harvester: 'Harvester') -> bool:
+        """
+        Add a new harvester to manage
+
+        Returns:
+            bool: False if the harvester's domain already has its quota of harvesters
+        """
+        domain = (harvester.url, harvester.sitekey)
         with self._lock:
+            quota = self.quotas.get(domain)
+            if quota is not None and self._domain_harvester_count(domain) >= quota:
+                logging.warning(f"Harvester quota of {quota} reached for {harvester.url}")
+                return False
             self.harvesters.append(harvester)
+            self._stats(domain)
+        harvester.on_response = self.push_response
+        return True
+
+    def set_quota(self, url: str, sitekey: str, max_harvesters: Optional[int]) -> None:
+        """
+        Limit the number of harvesters solving for one domain
 
-    def remove_harvester(self, harvester: Harvester) -> None:
+        Args:
+            url: Url of the domain
+            sitekey: Sitekey of the domain
+            max_harvesters: Harvester limit, None removes the limit
+        """
+        with self._lock:
+            if max_harvesters is None:
+                self.quotas.pop((url, sitekey), None)
+            else:
+                self.quotas[(url, sitekey)] = max_harvesters
+
+    def domains(self) -> List[Domain]:
+        """Domains that have harvesters or tokens"""
+        with self._lock:
+            return list(self.domain_stats)
+
+    def domain_status(self) -> Dict[Domain, Dict[str, Any]]:
+        """Harvesters, quota, queued tokens and token counters of every domain"""
+        with self._lock:
+            status = {}
+            for domain, stats in self.domain_stats.items():
+                status[domain] = dict(
+                    stats,
+                    harvesters=self._domain_harvester_count(domain),
+                    quota=self.quotas.get(domain),
+                    tokens=self.response_queue.count(domain[1], url=domain[0]),
+                )
+            return status
+
+    def _domain_harvester_count(self, domain: Domain) -> int:
+        return sum(1 for harvester in self.harvesters if (harvester.url, harvester.sitekey) == domain)
+
+    def _consumed(self, token: Token) -> None:
+        # Must be called with the lock held
+        self._forget_expired_leases()
+        self._outstanding[token.response] = token
+        self._outstanding_order.append(token)
+        self._stats(token.domain)['consumed'] += 1
+        TOKENS_CONSUMED.labels(token.sitekey).inc()
+        TOKEN_AGE_SECONDS.observe(time.monotonic() - token.captured_at)
+        TRACE.emit_token(EVENT_HANDED, token, to='consumer')
+        if self.journal:
+            self.journal.remove(token)
+
+    def _journal(self, tokens: List[Token]) -> None:
+        # Must be called with the lock held. Tokens handed straight to a waiter never hit the journal
+        if self.journal:
+            for token in tokens:
+                self.journal.append(token)
+
+    def _stats(self, domain: Domain) -> Dict[str, int]:
+        stats = self.domain_stats.get(domain)
+        if stats is None:
+            stats = self.domain_stats[domain] = {'harvested': 0, 'consumed': 0, 'returned': 0, 'expired': 0}
+        return stats
+
+    def remove_harvester(self, harvester: 'Harvester') -> None:
         """Remove a harvester from management"""
         with self._lock:
             if harvester in self.harvesters:
                 self.harvesters.remove(harvester)
+        harvester.on_response = None
 
-    def start_harvesters(self, use_threads: bool = True) -> None:
-        """Start all managed harvesters"""
-        if use_threads:
+    def start_harvesters(self, use_threads: bool = True, concurrency: Optional[int] = None,
+                         ready_callback: Optional[Callable] = None, wait: bool = True) -> None:
+        """
+        Start all managed harvesters
+
+        Args:
+            use_threads: Start harvesters in parallel
+            concurrency: Launch at most this many browsers at once
+            ready_callback: Optional callback called with (harvester, ok, seconds) as each one comes up
+            wait: Wait for every launch to finish, otherwise harvesters join the tick loop as they come up
+        """
+        if concurrency or ready_callback or not wait:
+            launcher = FleetLauncher(concurrency or len(self.harvesters) or 1, ready_callback)
+            with self._lock:
+                harvesters = [harvester for harvester in self.harvesters if not harvester.ready]
+            if wait:
+                launcher.launch_and_wait(harvesters)
+            else:
+                launcher.launch(harvesters)
+            launcher.shutdown()
+        elif use_threads:
             threads = []
             for harvester in self.harvesters:
                 thread = Thread(target=harvester.start, daemon=True)
@@ -57,7 +225,8 @@ class HarvesterManager:
         while self.looping:
             try:
                 self.tick()
-                if not self.harvesters:
+                # With a closed callback, an autoscaler or a planner harvesters may come back, keep looping for them
+                if not self.harvesters and not self.closed_callback and not self.autoscaler and not self.planner:
                     break
                 time.sleep(self.delay)
             except Exception as e:
@@ -71,38 +240,342 @@ class HarvesterManager:
         self.pull_responses_from_harvesters()
         self.response_queue_check()
 
+        if self.scheduler:
+            self.scheduler.start()
+
+        closed = []
         with self._lock:
             for harvester in self.harvesters[:]:  # Copy list to avoid modification during iteration
                 if harvester.closed:
                     self.harvesters.remove(harvester)
+                    closed.append(harvester)
+                    continue
+
+                if not harvester.ready:
                     continue
 
-                if not harvester.ticking:
+                if self.scheduler:
+                    self.scheduler.submit(harvester)
+                elif not harvester.ticking:
                     Thread(target=harvester.tick, daemon=True).start()
 
-    def response_queue_check(self) -> None:
+        if self.scheduler:
+            self.scheduler.check_stuck()
+
+        self._notify_closed(closed)
+
+    def _notify_closed(self, closed: List['Harvester']) -> None:
+        if self.closed_callback:
+            for harvester in closed:
+                try:
+                    self.closed_callback(harvester)
+                except Exception as e:
+                    logging.error(f"Closed callback failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of the fleet, the token pool and the collected metrics
+
+        Returns:
+            dict: harvesters, ready, tokens, domains, scheduler, journal and metrics
+        """
+        with self._lock:
+            harvesters = list(self.harvesters)
+            tokens = len(self.response_queue)
+        domains = {
+            f'{url} {sitekey}': status for (url, sitekey), status in self.domain_status().items()
+        }
+        return {
+            'harvesters': len(harvesters),
+            'ready': sum(1 for harvester in harvesters if harvester.ready and not harvester.closed),
+            'tokens': tokens,
+            'domains': domains,
+            'scheduler': self.scheduler_stats(),
+            'journal': self.journal.stats() if self.journal else None,
+            'metrics': REGISTRY.snapshot(),
+        }
+
+    def scheduler_stats(self) -> Dict[str, Any]:
+        """Worker pool saturation and queue depth, empty when not using the pool"""
+        return self.scheduler.stats() if self.scheduler else {}
+
+    def response_queue_check(self) -> List[Token]:
         """Remove expired responses"""
-        now = datetime.datetime.now()
         with self._lock:
-            self.response_queue = [
-                response for response in self.response_queue
-                if (now - response['timestamp']).seconds < 120
-            ]
+            expired = self.response_queue.evict_expired()
+            for token in expired:
+                self._stats(token.domain)['expired'] += 1
+                TOKENS_EXPIRED.labels(token.sitekey).inc()
+                TRACE.emit_token(EVENT_EXPIRED, token)
+                if self.journal:
+                    self.journal.remove(token)
+        return expired
 
     def pull_responses_from_harvesters(self) -> None:
         """Collect responses from all harvesters"""
+        queued, handed = [], []
+        callback = self.response_callback
         with self._lock:
             for harvester in self.harvesters:
                 responses = harvester.pull_response_queue()
-                if self.response_callback:
-                    for response in responses:
-                        self.response_callback(response)
+                for response in responses:
+                    self._stats(response.domain)['harvested'] += 1
+                if callback:
+                    handed.extend(responses)
                 else:
+                    for response in responses:
+                        TRACE.emit_token(EVENT_POOLED, response)
                     self.response_queue.extend(responses)
+                    queued.extend(responses)
+            queued = self._hand_off(queued)
+            self._journal(queued)
+
+        if handed:
+            self._call_response_callback(callback, handed)
+        if queued:
+            self.notify_response_listeners(queued)
+
+    def push_response(self, response: Token) -> None:
+        """Accept a response pushed by a harvester as soon as it was captured"""
+        callback = self.response_callback
+        with self._lock:
+            self._stats(response.domain)['harvested'] += 1
+            if not callback:
+                TRACE.emit_token(EVENT_POOLED, response)
+                self.response_queue.add(response)
+                queued = self._hand_off([response])
+                self._journal(queued)
+
+        if callback:
+            self._call_response_callback(callback, [response])
+        elif queued:
+            self.notify_response_listeners(queued)
+
+    def _call_response_callback(self, callback: Callable, responses: List[Token]) -> None:
+        # Called without the lock, so the callback may use the manager. It runs on the
+        # TokenListener thread for pushed responses, an exception must not kill it
+        for response in responses:
+            TRACE.emit_token(EVENT_HANDED, response, to='callback')
+            try:
+                callback(response)
+            except Exception as e:
+                logging.error(f"Response callback failed: {e}")
+
+    def take_response(self, sitekey: Optional[str] = None, min_ttl: float = 0.0,
+                      policy: Optional[str] = None, url: Optional[str] = None) -> Optional[Token]:
+        """
+        Remove and return a queued response without blocking
+
+        Args:
+            sitekey: Only take a response harvested for this sitekey
+            min_ttl: Seconds of validity the response must have left
+            policy: Pull policy overriding the manager default
+            url: Only take a response harvested on this url
+
+        Returns:
+            Token: Response or None if the queue has no matching response
+        """
+        with self._lock:
+            return self._pull(sitekey, min_ttl, policy, url)
+
+    def acquire(self, timeout: Optional[float] = None, min_ttl: float = 0.0,
+                sitekey: Optional[str] = None, policy: Optional[str] = None,
+                url: Optional[str] = None) -> Optional[Token]:
+        """
+        Block until a response is available and take it
+
+        Args:
+            timeout: Seconds to wait, forever when None
+            min_ttl: Seconds of validity the response must have left
+            sitekey: Only take a response harvested for this sitekey
+            policy: Pull policy overriding the manager default
+            url: Only take a response harvested on this url
+
+        Returns:
+            Token: Response or None if the timeout passed first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            token = self._pull(sitekey, min_ttl, policy, url)
+            if token:
+                return token
+
+            waiter = _Waiter(Condition(self._lock), min_ttl)
+            key = (url, sitekey)
+            self._waiters.setdefault(key, deque()).append(waiter)
+            try:
+                while waiter.token is None:
+                    remaining = None
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                    waiter.condition.wait(remaining)
+            finally:
+                if waiter.token is None:
+                    # Timed out or interrupted, the deque may have been replaced meanwhile
+                    waiters = self._waiters.get(key)
+                    if waiters is not None and waiter in waiters:
+                        waiters.remove(waiter)
+                        if not waiters:
+                            del self._waiters[key]
+
+            return waiter.token
+
+    def claim(self, token: Token) -> bool:
+        """
+        Take a specific response out of the pool
+
+        Returns:
+            bool: False if the response is no longer queued
+        """
+        with self._lock:
+            if not self.response_queue.remove(token):
+                return False
+            self._consumed(token)
+            return True
+
+    def _pull(self, sitekey: Optional[str], min_ttl: float, policy: Optional[str],
+              url: Optional[str]) -> Optional[Token]:
+        # Must be called with the lock held
+        token = self.response_queue.pull(sitekey, min_ttl, policy, url)
+        if token:
+            self._consumed(token)
+        return token
+
+    def lease(self, timeout: Optional[float] = None, min_ttl: float = 0.0,
+              sitekey: Optional[str] = None, policy: Optional[str] = None,
+              url: Optional[str] = None) -> Optional['TokenLease']:
+        """
+        Acquire a response that goes back to the pool unless it is consumed
+
+        Args:
+            timeout: Seconds to wait, forever when None
+            min_ttl: Seconds of validity the response must have left
+            sitekey: Only take a response harvested for this sitekey
+            policy: Pull policy overriding the manager default
+            url: Only take a response harvested on this url
+
+        Returns:
+            TokenLease: Lease on the response or None if the timeout passed first
+        """
+        token = self.acquire(timeout, min_ttl, sitekey, policy, url)
+        return TokenLease(self, token) if token else None
+
+    def return_token(self, token: Token) -> bool:
+        """
+        Put an unused response back into the pool
+
+        Args:
+            token: Response previously taken from this manager
+
+        Returns:
+            bool: False if the response already expired, was already returned or
+                was never handed out by this manager
+        """
+        with self._lock:
+            if self._outstanding.get(token.response) is not token:
+                logging.warning(f"Refusing to return a response that is not handed out: {token!r}")
+                return False
+            del self._outstanding[token.response]
+            if token.expired:
+                return False
+            self.response_queue.add(token)
+            stats = self._stats(token.domain)
+            stats['returned'] += 1
+            stats['consumed'] -= 1
+            TRACE.emit_token(EVENT_RETURNED, token)
+            queued = self._hand_off([token])
+            self._journal(queued)
+
+        if queued:
+            self.notify_response_listeners(queued)
+        return True
+
+    def _hand_off(self, tokens: List[Token]) -> List[Token]:
+        # Must be called with the lock held. Gives each new token straight to one blocked
+        # acquire call, preferring the most specific filter it matches, so a waiter is
+        # never woken for a token another consumer then takes. Returns the tokens left
+        # in the pool.
+        if not self._waiters:
+            return tokens
+
+        queued = []
+        for token in tokens:
+            waiter = self._find_waiter(token)
+            if waiter is None:
+                queued.append(token)
+                continue
+
+            self.response_queue.remove(token)
+            self._consumed(token)
+            waiter.token = token
+            waiter.condition.notify()
+        return queued
+
+    def _find_waiter(self, token: Token) -> Optional['_Waiter']:
+        ttl = token.ttl()
+        for key in ((token.url, token.sitekey), (None, token.sitekey), (token.url, None), (None, None)):
+            waiters = self._waiters.get(key)
+            if not waiters:
+                continue
+            for index, waiter in enumerate(waiters):
+                if waiter.min_ttl <= ttl:
+                    del waiters[index]
+                    if not waiters:
+                        # Keeps the empty check in _hand_off meaningful
+                        del self._waiters[key]
+                    return waiter
+        return None
+
+    def _forget_expired_leases(self) -> None:
+        # Must be called with the lock held. Expired responses cannot be returned anyway,
+        # and ones that came back or were handed out again are skipped
+        order = self._outstanding_order
+        now = time.monotonic()
+        while order and order[0].expires_at <= now:
+            token = order.popleft()
+            if self._outstanding.get(token.response) is token:
+                del self._outstanding[token.response]
+
+    def token_counts(self, min_ttl: float = 0.0) -> Dict[Optional[str], int]:
+        """Number of queued responses per sitekey"""
+        with self._lock:
+            pool = self.response_queue
+            return {sitekey: pool.count(sitekey, min_ttl) for sitekey in pool.sitekeys()}
+
+    def token_count(self, sitekey: Optional[str] = None, min_ttl: float = 0.0, url: Optional[str] = None) -> int:
+        """Number of queued responses matching a sitekey and url with at least min_ttl seconds left"""
+        with self._lock:
+            return self.response_queue.count(sitekey, min_ttl, url)
+
+    def token_ttls(self, sitekey: Optional[str] = None, url: Optional[str] = None) -> List[float]:
+        """Seconds left on every queued response matching a sitekey and url"""
+        with self._lock:
+            return self.response_queue.ttls(sitekey, url)
+
+    def add_response_listener(self, listener: Callable) -> None:
+        """Register a callable invoked with the list of newly queued responses"""
+        self.response_listeners.append(listener)
+
+    def remove_response_listener(self, listener: Callable) -> None:
+        """Unregister a response listener"""
+        if listener in self.response_listeners:
+            self.response_listeners.remove(listener)
+
+    def notify_response_listeners(self, responses: List[Token]) -> None:
+        """Tell listeners that new responses are waiting in the queue"""
+        for listener in self.response_listeners[:]:
+            try:
+                listener(responses)
+            except Exception as e:
+                logging.error(f"Response listener failed: {e}")
 
     def stop(self) -> None:
         """Stop the manager and all harvesters"""
         self.looping = False
+        if self.scheduler:
+            self.scheduler.stop()
         with self._lock:
             for harvester in self.harvesters:
                 try:
@@ -111,3 +584,55 @@ class HarvesterManager:
                     pass
             self.harvesters.clear()
             self.response_queue.clear()
+        if self.journal:
+            # Queued responses stay in the journal for the next manager
+            self.journal.close()
+
+
+class _Waiter:
+    """Blocked acquire call waiting for a token to be handed to it"""
+    __slots__ = ('condition', 'min_ttl', 'token')
+
+    def __init__(self, condition: Condition, min_ttl: float):
+        self.condition = condition
+        self.min_ttl = min_ttl
+        self.token: Optional[Token] = None
+
+
+class TokenLease:
+    """
+    Response taken from a HarvesterManager that can be handed back if it goes unused.
+
+    Used as a context manager the token is consumed when the block exits normally
+    and returned to the pool when it raises, e.g. because the checkout was aborted.
+    """
+
+    def __init__(self, manager: HarvesterManager, token: Token):
+        self.manager = manager
+        self.token = token
+        self.done = False
+
+    def consume(self) -> None:
+        """Mark the response as used"""
+        self.done = True
+
+    def release(self) -> bool:
+        """
+        Hand the response back to the pool
+
+        Returns:
+            bool: False if it was already consumed, released or expired
+        """
+        if self.done:
+            return False
+        self.done = True
+        return self.manager.return_token(self.token)
+
+    def __enter__(self) -> 'TokenLease':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.consume()
+        else:
+            self.release()
@@ -0,0 +1,184 @@
+from .token_pool import Token, TOKEN_LIFETIME
+from .trace import TRACE, EVENT_INJECTED, token_key
+from typing import Optional, Union, Dict, Any
+import random
+
+# Installs the control box above the captcha on first use, expires injected tokens
+# and refreshes the box, returning the state a consumer needs in the same call
+SYNC_JS = """
+var key = arguments[0], queued = arguments[1];
+var state = window[key];
+if (!state || !document.getElementById(key)) {
+    var anchor = document.getElementsByClassName('g-recaptcha')[0];
+    if (!anchor) {
+        return null;
+    }
+    var box = document.createElement('div');
+    box.id = key;
+    box.style.cssText = 'border:2px solid #333;border-radius:20px;height:27px;margin-bottom:5px;padding:0;overflow:hidden';
+    var button = document.createElement('input');
+    button.type = 'button';
+    button.style.cssText = 'box-sizing:border-box;border-radius:20px;margin:0;padding:5px;cursor:pointer;background-color:#333;color:white;border:none';
+    var description = document.createElement('span');
+    description.style.marginLeft = '5px';
+    box.appendChild(button);
+    box.appendChild(description);
+    anchor.insertAdjacentElement('beforebegin', box);
+    state = window[key] = {clicked: false, expiresAt: 0, box: box, button: button, description: description};
+    button.onclick = function () {
+        if (!state.expiresAt) {
+            state.clicked = true;
+        }
+    };
+}
+
+var field = document.querySelector('textarea.g-recaptcha-response, textarea[name="g-recaptcha-response"]');
+var response = field ? field.value : '';
+var now = Date.now();
+if (state.expiresAt && now >= state.expiresAt) {
+    if (field) {
+        field.value = '';
+    }
+    response = '';
+    state.expiresAt = 0;
+}
+
+var injected = Boolean(state.expiresAt && response);
+var expiresIn = injected ? Math.max(Math.round((state.expiresAt - now) / 1000), 0) : null;
+var color = injected ? 'green' : '#333';
+state.box.style.borderColor = color;
+state.button.style.backgroundColor = color;
+state.button.style.cursor = injected ? 'default' : 'pointer';
+if (injected) {
+    state.button.value = 'Captcha injected';
+    state.description.textContent = 'Captcha expires in ' + expiresIn + ' seconds';
+} else if (response) {
+    state.button.value = 'Captcha solved';
+    state.description.textContent = '';
+} else {
+    state.button.value = state.clicked ? 'Waiting for captcha' : 'Click to inject captcha';
+    state.description.textContent = 'Captchas harvested: ' + queued;
+}
+return {clicked: state.clicked, solved: Boolean(response), injected: injected, expires_in: expiresIn};
+"""
+
+# Fills the response fields with the token passed as an argument and calls the
+# callback the site registered with the widget, so the form is ready to submit
+INJECT_JS = """
+var key = arguments[0], token = arguments[1], ttl = arguments[2];
+var fields = document.querySelectorAll('textarea.g-recaptcha-response, textarea[name="g-recaptcha-response"]');
+for (var i = 0; i < fields.length; i++) {
+    fields[i].value = token;
+    fields[i].innerHTML = token;
+}
+
+var state = window[key];
+if (state) {
+    state.expiresAt = Date.now() + ttl * 1000;
+    state.clicked = false;
+}
+
+function resolve(path) {
+    var target = window, parts = path.split('.');
+    for (var i = 0; i < parts.length && target; i++) {
+        target = target[parts[i]];
+    }
+    return target;
+}
+
+function findCallback(node, depth) {
+    if (!node || typeof node !== 'object' || depth > 5) {
+        return null;
+    }
+    for (var name in node) {
+        if (!Object.prototype.hasOwnProperty.call(node, name)) {
+            continue;
+        }
+        var value = node[name];
+        if (name === 'callback' && (typeof value === 'function' || typeof value === 'string')) {
+            return value;
+        }
+        if (value && typeof value === 'object' && !(value instanceof Node)) {
+            var found = findCallback(value, depth + 1);
+            if (found) {
+                return found;
+            }
+        }
+    }
+    return null;
+}
+
+var widget = document.querySelector('.g-recaptcha[data-callback]');
+var callback = widget ? widget.getAttribute('data-callback') : null;
+if (!callback && window.___grecaptcha_cfg) {
+    callback = findCallback(window.___grecaptcha_cfg.clients, 0);
+}
+if (typeof callback === 'string') {
+    callback = resolve(callback);
+}
+
+var called = false;
+if (typeof callback === 'function') {
+    callback(token);
+    called = true;
+}
+return {fields: fields.length, callback: called};
+"""
+
+
+class TokenInjector:
+    """
+    Puts harvested tokens into a consumer browser's page.
+
+    The control box and its state live in the page, so a consumer's tick is one
+    sync() call and handing over a token is one inject() call. Tokens travel as
+    script arguments, never as generated source, and expiry is counted in the page
+    from the token's remaining ttl.
+    """
+
+    def __init__(self, driver, control_element: Optional[str] = None):
+        """
+        Initialize the injector
+
+        Args:
+            driver: WebDriver of the consumer browser
+            control_element: Id of the control box, random by default
+        """
+        self.driver = driver
+        self.control_element = control_element or f'controlElement{random.randint(0, 10**10)}'
+
+    def sync(self, queued: int = 0) -> Optional[Dict[str, Any]]:
+        """
+        Install the control box if needed, expire a stale token and read the page state
+
+        Args:
+            queued: Number of tokens waiting, shown in the control box
+
+        Returns:
+            dict: clicked, solved, injected and expires_in, None if the page has no captcha
+        """
+        return self.driver.execute_script(SYNC_JS, self.control_element, queued)
+
+    def inject(self, token: Union[Token, str], ttl: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Fill in a token and trigger the site's captcha callback
+
+        Args:
+            token: Token or raw response string
+            ttl: Seconds the token stays valid, taken from the token when omitted
+
+        Returns:
+            dict: Number of response fields filled and whether a callback was called
+        """
+        if isinstance(token, Token):
+            response = token.response
+            ttl = token.ttl() if ttl is None else ttl
+        else:
+            response = token
+            ttl = TOKEN_LIFETIME if ttl is None else ttl
+        result = self.driver.execute_script(INJECT_JS, self.control_element, response, ttl)
+        if isinstance(token, Token):
+            TRACE.emit_token(EVENT_INJECTED, token)
+        else:
+            TRACE.emit(EVENT_INJECTED, token=token_key(response))
+        return result
@@ -0,0 +1,307 @@
+from .token_pool import Token
+from threading import Thread, Lock, Event
+from typing import Optional, Dict, List, Any, Tuple
+import datetime
+import pathlib
+import time
+import os
+import re
+import logging
+
+DEFAULT_JOURNAL_FILE = pathlib.Path.home() / '.cache' / 'captcha-harvester' / 'tokens.journal'
+
+FSYNC_ALWAYS = 'always'
+FSYNC_INTERVAL = 'interval'
+FSYNC_NEVER = 'never'
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER)
+
+RECORD_ADD = 'A'
+RECORD_DELETE = 'D'
+
+_ESCAPES = (('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r'))
+_UNESCAPES = {escaped[1]: char for char, escaped in _ESCAPES}
+_ESCAPE_PATTERN = re.compile(r'\\(.)')
+
+
+def _escape(value: Optional[str]) -> str:
+    # Tokens and sitekeys never need escaping, so the common case is four scans
+    if value is None:
+        return ''
+    if '\t' in value or '\n' in value or '\\' in value or '\r' in value:
+        for char, escaped in _ESCAPES:
+            value = value.replace(char, escaped)
+    return value
+
+
+def _unescape(value: str) -> Optional[str]:
+    if not value:
+        return None
+    if '\\' in value:
+        value = _ESCAPE_PATTERN.sub(lambda match: _UNESCAPES.get(match.group(1), match.group(1)), value)
+    return value
+
+
+class TokenJournal:
+    """
+    Append-only file of queued tokens, so a restarted manager keeps them.
+
+    Every token entering the pool is written as one tab separated line and every
+    token leaving it, consumed or expired, as a short tombstone line. Lines go
+    straight to the OS with a single write on an O_APPEND descriptor, so a crash
+    of the process loses nothing; the fsync policy decides what survives a crash
+    of the machine:
+
+        always    fsync after every write, slow
+        interval  fsync from a background thread every fsync_interval seconds
+        never     leave it to the OS
+
+    Expiry is stored as wall clock time since monotonic time does not survive a
+    restart. Once tombstoned lines make up most of the file it is rewritten with
+    only the live tokens, in the background. One journal file serves one manager.
+    """
+
+    def __init__(self, path: Optional[pathlib.Path] = None, fsync: str = FSYNC_INTERVAL,
+                 fsync_interval: float = 1.0, compact_ratio: float = 0.5, compact_min: int = 1024):
+        """
+        Initialize the journal
+
+        Args:
+            path: Journal file, HARVESTER_TOKEN_JOURNAL or ~/.cache by default
+            fsync: Durability policy, 'always', 'interval' or 'never'
+            fsync_interval: Seconds between background fsyncs with the 'interval' policy
+            compact_ratio: Fraction of dead lines at which the file is rewritten
+            compact_min: Dead lines below which the file is never rewritten
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+
+        self.path = pathlib.Path(path or os.environ.get('HARVESTER_TOKEN_JOURNAL') or DEFAULT_JOURNAL_FILE)
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_ratio = compact_ratio
+        self.compact_min = compact_min
+
+        self.writes = 0
+        self.syncs = 0
+        self.compactions = 0
+        self.corrupt_lines = 0
+
+        # Journal id -> (wall clock expiry, line) of every live token
+        self._live: Dict[int, Tuple[float, bytes]] = {}
+        self._ids: Dict[str, int] = {}
+        self._next_id = 0
+        self._lines = 0
+        self._dirty = False
+        self._warned = False
+        self._fd: Optional[int] = None
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._closed = Event()
+        self._thread: Optional[Thread] = None
+
+    def load(self) -> List[Token]:
+        """
+        Read the journal, compact it and open it for writing
+
+        Returns:
+            list: Tokens that are still valid, oldest first
+        """
+        with self._lock:
+            if self._fd is not None:
+                return []
+
+            records: Dict[int, Tuple[float, bytes, List[str]]] = {}
+            try:
+                with open(self.path, 'rb') as f:
+                    for line in f:
+                        self._replay(line, records)
+            except FileNotFoundError:
+                pass
+
+            now_wall, now = time.time(), time.monotonic()
+            tokens = []
+            for journal_id, (expires, line, record) in sorted(records.items()):
+                if expires <= now_wall:
+                    continue
+                _, _, captured, lifetime, harvester_id, sitekey, url, response = record
+                captured = float(captured)
+                token = Token(
+                    _unescape(response), sitekey=_unescape(sitekey), url=_unescape(url),
+                    harvester_id=int(harvester_id) if harvester_id else None, lifetime=float(lifetime),
+                    captured_at=now - (now_wall - captured), timestamp=datetime.datetime.fromtimestamp(captured)
+                )
+                tokens.append(token)
+                self._live[journal_id] = (expires, line)
+                self._ids[token.response] = journal_id
+            self._next_id = max(records, default=-1) + 1
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._rewrite()
+            self._warned = False
+
+        self._closed.clear()
+        self._thread = Thread(target=self._run, daemon=True, name='token-journal')
+        self._thread.start()
+        return tokens
+
+    def append(self, token: Token) -> None:
+        """Record a token entering the pool, ignored with a warning until load opens the journal"""
+        now_wall = time.time()
+        captured = now_wall - (time.monotonic() - token.captured_at)
+        lifetime = token.expires_at - token.captured_at
+
+        with self._lock:
+            if self._fd is None:
+                # Opening here would throw away the tokens load restores, and compaction
+                # would then drop them from the file too
+                if not self._warned:
+                    self._warned = True
+                    logging.warning(f"Token journal {self.path} is not open, tokens are not journaled until load()")
+                return
+            if token.response in self._ids:
+                return
+            journal_id = self._next_id
+            self._next_id += 1
+            harvester_id = '' if token.harvester_id is None else token.harvester_id
+            line = (
+                f'{RECORD_ADD}\t{journal_id}\t{captured:.3f}\t{lifetime!r}\t{harvester_id}\t'
+                f'{_escape(token.sitekey)}\t{_escape(token.url)}\t{_escape(token.response)}\n'
+            ).encode('utf-8')
+            self._live[journal_id] = (captured + lifetime, line)
+            self._ids[token.response] = journal_id
+            self._write(line)
+
+    def remove(self, token: Token) -> None:
+        """Record a token leaving the pool, tokens never appended are ignored"""
+        with self._lock:
+            journal_id = self._ids.pop(token.response, None)
+            if journal_id is None or self._fd is None:
+                return
+            del self._live[journal_id]
+            self._write(f'{RECORD_DELETE}\t{journal_id}\n'.encode('ascii'))
+            if self._compaction_due():
+                self._wakeup.set()
+
+    def compact(self) -> None:
+        """Rewrite the file with only the live tokens"""
+        with self._lock:
+            if self._fd is not None:
+                self._rewrite()
+
+    def sync(self) -> None:
+        """Flush written lines to disk now"""
+        with self._lock:
+            self._sync()
+
+    def close(self) -> None:
+        """Sync and close the file, the tokens in it are reloaded by the next load"""
+        self._closed.set()
+        self._wakeup.set()
+        with self._lock:
+            if self._fd is None:
+                return
+            if self.fsync != FSYNC_NEVER:
+                self._sync()
+            os.close(self._fd)
+            self._fd = None
+            self._live.clear()
+            self._ids.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Live tokens, lines in the file and write counters"""
+        with self._lock:
+            return {
+                'path': str(self.path),
+                'fsync': self.fsync,
+                'live': len(self._live),
+                'lines': self._lines,
+                'writes': self.writes,
+                'syncs': self.syncs,
+                'compactions': self.compactions,
+                'corrupt_lines': self.corrupt_lines,
+            }
+
+    def _replay(self, line: bytes, records: Dict[int, Tuple[float, bytes, List[str]]]) -> None:
+        try:
+            if not line.endswith(b'\n'):
+                # Cut short by a crash, it was never acknowledged
+                raise ValueError('incomplete line')
+            record = line[:-1].decode('utf-8').split('\t')
+            if record[0] == RECORD_ADD and len(record) == 8:
+                records[int(record[1])] = (float(record[2]) + float(record[3]), line, record)
+            elif record[0] == RECORD_DELETE and len(record) == 2:
+                records.pop(int(record[1]), None)
+            else:
+                raise ValueError(record[0])
+        except (ValueError, UnicodeDecodeError):
+            self.corrupt_lines += 1
+
+    def _write(self, line: bytes) -> None:
+        # Must be called with the lock held
+        os.write(self._fd, line)
+        self._lines += 1
+        self.writes += 1
+        if self.fsync == FSYNC_ALWAYS:
+            self._sync()
+        else:
+            self._dirty = True
+
+    def _sync(self) -> None:
+        # Must be called with the lock held
+        if self._fd is None:
+            return
+        getattr(os, 'fdatasync', os.fsync)(self._fd)
+        self._dirty = False
+        self.syncs += 1
+
+    def _compaction_due(self) -> bool:
+        dead = self._lines - len(self._live)
+        return dead >= self.compact_min and dead >= self.compact_ratio * self._lines
+
+    def _rewrite(self) -> None:
+        # Must be called with the lock held. Writes the live tokens to a new file and
+        # swaps it in, so a crash leaves either the old or the new file.
+        now_wall = time.time()
+        for journal_id, (expires, _) in list(self._live.items()):
+            if expires <= now_wall:
+                del self._live[journal_id]
+        self._ids = {response: journal_id for response, journal_id in self._ids.items() if journal_id in self._live}
+
+        tmp = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as f:
+            for _, line in self._live.values():
+                f.write(line)
+            f.flush()
+            if self.fsync != FSYNC_NEVER:
+                os.fsync(f.fileno())
+
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        os.replace(tmp, self.path)
+        if self.fsync != FSYNC_NEVER and hasattr(os, 'O_DIRECTORY'):
+            directory = os.open(self.path.parent, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o600)
+        self._lines = len(self._live)
+        self._dirty = False
+        self.compactions += 1
+
+    def _run(self) -> None:
+        while not self._closed.is_set():
+            self._wakeup.wait(self.fsync_interval)
+            self._wakeup.clear()
+            try:
+                with self._lock:
+                    if self._fd is None:
+                        return
+                    if self._compaction_due():
+                        self._rewrite()
+                    elif self._dirty and self.fsync == FSYNC_INTERVAL:
+                        self._sync()
+            except OSError as e:
+                logging.error(f"Token journal {self.path} maintenance failed: {e}")
@@ -0,0 +1,297 @@
+from bisect import bisect_left
+from threading import Lock
+from typing import Optional, Dict, List, Tuple, Callable, Any, Sequence, Union
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SOLVE_BUCKETS = (1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+AGE_BUCKETS = (1.0, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock', '_registry')
+
+    def __init__(self, registry: 'Registry'):
+        self.value = 0.0
+        self._lock = Lock()
+        self._registry = registry
+
+    def inc(self, amount: float = 1.0) -> None:
+        if self._registry.enabled:
+            with self._lock:
+                self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'count', '_lock', '_registry')
+
+    def __init__(self, registry: 'Registry', bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = Lock()
+        self._registry = registry
+
+    def observe(self, value: float) -> None:
+        if self._registry.enabled:
+            index = bisect_left(self.bounds, value)
+            with self._lock:
+                self.counts[index] += 1
+                self.sum += value
+                self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q quantile, None without samples"""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, registry: 'Registry', name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        # Children by the label values exactly as passed, e.g. int harvester ids
+        self._aliases: Dict[Tuple[Any, ...], Any] = {}
+        self._lock = Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values: Any):
+        """Child metric for one combination of label values"""
+        # Look the values up as passed, converting them only the first time they are seen
+        child = self._aliases.get(values)
+        if child is None:
+            key = tuple(str(value) for value in values)
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._child()
+                self._aliases[values] = child
+        return child
+
+    def remove(self, *values: Any) -> None:
+        """Drop the child for one combination of label values"""
+        with self._lock:
+            child = self._children.pop(tuple(str(value) for value in values), None)
+            if child is not None:
+                self._aliases = {alias: other for alias, other in self._aliases.items() if other is not child}
+
+    def _child(self):
+        raise NotImplementedError
+
+    def _items(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        with self._lock:
+            return list(self._children.items())
+
+
+class Counter(_Metric):
+    """Monotonic count, e.g. tokens harvested"""
+    kind = 'counter'
+
+    def _child(self) -> _CounterChild:
+        return _CounterChild(self.registry)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+    def render(self) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}'
+                for key, child in self._items()]
+
+    def snapshot(self) -> Union[float, Dict[str, float]]:
+        if not self.labelnames:
+            return self._default.value
+        return {','.join(key): child.value for key, child in self._items()}
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in fixed buckets, e.g. tick durations"""
+    kind = 'histogram'
+
+    def __init__(self, registry: 'Registry', name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(registry, name, documentation, labelnames)
+
+    def _child(self) -> _HistogramChild:
+        return _HistogramChild(self.registry, self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, child in self._items():
+            cumulative = 0
+            for bound, count in zip(child.bounds + (float('inf'),), child.counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(child.sum)}')
+            lines.append(f'{self.name}_count{labels} {child.count}')
+        return lines
+
+    def snapshot(self) -> Dict[str, Any]:
+        def summary(child: _HistogramChild) -> Dict[str, Any]:
+            return {
+                'count': child.count,
+                'sum': round(child.sum, 6),
+                'p50': child.quantile(0.5),
+                'p95': child.quantile(0.95),
+            }
+
+        if not self.labelnames:
+            return summary(self._default)
+        return {','.join(key): summary(child) for key, child in self._items()}
+
+
+class Gauge:
+    """Value read from a callback at collection time, e.g. queued tokens"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], Union[float, Dict[str, float]]],
+                 labelname: Optional[str] = None):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelname = labelname
+
+    def render(self) -> List[str]:
+        value = self.callback()
+        if isinstance(value, dict):
+            return [f'{self.name}{_format_labels((self.labelname,), (key,))} {_format_value(item)}'
+                    for key, item in value.items()]
+        return [f'{self.name} {_format_value(value)}']
+
+    def snapshot(self) -> Union[float, Dict[str, float]]:
+        return self.callback()
+
+
+class Registry:
+    """
+    Set of metrics rendered together.
+
+    Counters and histograms take one uncontended lock per update and no
+    allocation once a label combination exists, so they stay on in production.
+    Setting enabled to False turns every update into a single attribute check.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: Dict[str, Any] = {}
+        self._lock = Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Get or create a counter"""
+        return self._register(name, lambda: Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Get or create a histogram"""
+        return self._register(name, lambda: Histogram(self, name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, callback: Callable, labelname: Optional[str] = None) -> Gauge:
+        """Register a gauge, replacing an earlier one with the same name"""
+        gauge = Gauge(name, documentation, callback, labelname)
+        with self._lock:
+            self._metrics[name] = gauge
+        return gauge
+
+    def unregister(self, name: str) -> None:
+        """Remove a metric"""
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self._all():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f'# {metric.name} failed: {_escape(e)}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current values keyed by metric name, histograms summarised"""
+        snapshot = {}
+        for metric in self._all():
+            try:
+                snapshot[metric.name] = metric.snapshot()
+            except Exception:
+                continue
+        return snapshot
+
+    def _register(self, name: str, factory: Callable):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def _all(self) -> List[Any]:
+        with self._lock:
+            return list(self._metrics.values())
+
+
+REGISTRY = Registry()
+
+TOKENS_HARVESTED = REGISTRY.counter(
+    'harvester_tokens_harvested_total', 'Tokens captured, per harvester', ('harvester',)
+)
+SOLVE_SECONDS = REGISTRY.histogram(
+    'harvester_solve_seconds', 'Time from the captcha being rendered or reset to it being solved',
+    buckets=SOLVE_BUCKETS
+)
+TICK_SECONDS = REGISTRY.histogram('harvester_tick_seconds', 'Duration of harvester ticks')
+WEBDRIVER_SECONDS = REGISTRY.histogram(
+    'harvester_webdriver_seconds', 'Latency of chromedriver round trips, per command', ('command',),
+    buckets=LATENCY_BUCKETS
+)
+DEVTOOLS_SECONDS = REGISTRY.histogram(
+    'harvester_devtools_seconds', 'Latency of DevTools protocol commands, per method', ('method',),
+    buckets=LATENCY_BUCKETS
+)
+TOKENS_CONSUMED = REGISTRY.counter('harvester_tokens_consumed_total', 'Tokens handed to consumers, per sitekey', ('sitekey',))
+TOKENS_EXPIRED = REGISTRY.counter(
+    'harvester_tokens_expired_total', 'Tokens that expired in the pool unused, per sitekey', ('sitekey',)
+)
+TOKEN_AGE_SECONDS = REGISTRY.histogram(
+    'harvester_token_age_seconds', 'Age of tokens when they were consumed', buckets=AGE_BUCKETS
+)
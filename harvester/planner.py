@@ -0,0 +1,417 @@
+from .harvester_manager import HarvesterManager
+from .token_pool import Domain, TOKEN_LIFETIME
+from .fleet import FleetLauncher
+from .metrics import SOLVE_SECONDS
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Lock, Event
+from typing import Optional, Dict, List, Any, Callable, Union, TYPE_CHECKING
+import datetime
+import math
+import time
+import logging
+
+if TYPE_CHECKING:
+    from .harvester import Harvester
+
+STATE_SCHEDULED = 'scheduled'
+STATE_OPENING = 'opening'
+STATE_SOLVING = 'solving'
+STATE_RELEASED = 'released'
+STATE_DONE = 'done'
+STATE_CANCELLED = 'cancelled'
+
+# Solves measured before the global solve time histogram is trusted over the default
+MIN_SOLVE_SAMPLES = 5
+
+
+class DropPlan:
+    """
+    When to open harvesters, reset widgets and nudge the operator for one release.
+
+    Tokens solved more than lifetime - min_ttl seconds before the release are
+    worthless at checkout, and every second earlier costs a second of TTL. So the
+    plan opens just enough harvesters to solve the demand inside that window, and
+    starts solving as late as that allows: the pool peaks at release, holding
+    tokens that have on average lifetime - harvest_seconds / 2 seconds left.
+    Offsets are in seconds relative to the release, negative before it.
+    """
+
+    def __init__(self, name: str, url: str, sitekey: str, release_at: float, demand: int, min_ttl: float,
+                 solve_time: float, max_harvesters: int, launch_time: float, nudge_lead: float,
+                 linger: float, lifetime: float = TOKEN_LIFETIME):
+        """
+        Compute the plan
+
+        Args:
+            name: Name of the drop, for logs and reports
+            url: Url harvested on
+            sitekey: Sitekey harvested for
+            release_at: Wall clock time of the release, seconds since the epoch
+            demand: Tokens needed at release
+            min_ttl: Seconds a token needs left at release to be usable
+            solve_time: Seconds one harvester takes per token
+            max_harvesters: Harvesters never exceeded
+            launch_time: Seconds a harvester takes to open
+            nudge_lead: Seconds before solving starts that the operator is told to get ready
+            linger: Seconds after the release the harvesters stay open
+            lifetime: Seconds a token stays valid
+        """
+        window = lifetime - min_ttl
+        if window <= 0:
+            raise ValueError(f"min_ttl {min_ttl} leaves no time to solve in, tokens only live {lifetime}s")
+        if demand <= 0:
+            raise ValueError(f"demand must be positive, got {demand}")
+
+        self.name = name
+        self.url = url
+        self.sitekey = sitekey
+        self.release_at = release_at
+        self.demand = demand
+        self.min_ttl = min_ttl
+        self.solve_time = solve_time
+        self.lifetime = lifetime
+
+        self.harvesters = min(max(math.ceil(demand * solve_time / window), 1), max_harvesters)
+        self.harvest_seconds = min(window, demand * solve_time / self.harvesters)
+        self.expected_tokens = min(demand, math.floor(self.harvesters * self.harvest_seconds / solve_time + 1e-9))
+        self.shortfall = demand - self.expected_tokens
+
+        self.solve_offset = -self.harvest_seconds
+        self.open_offset = self.solve_offset - launch_time
+        self.nudge_offset = self.solve_offset - nudge_lead
+        self.close_offset = linger
+
+        self.state = STATE_SCHEDULED
+        self.nudged = False
+        self.opened: List['Harvester'] = []
+        # (offset, queued tokens, tokens usable at checkout)
+        self.samples: List[tuple] = []
+        self.at_release: Optional[Dict[str, Any]] = None
+        self.measured_solve_time: Optional[float] = None
+        self.harvested_at_solve: Optional[int] = None
+        self.live_at_solve = 0
+        # Monotonic time the widgets were actually reset, passes can run late
+        self.solving_started: Optional[float] = None
+        self._release = time.monotonic() + (release_at - time.time())
+
+    @property
+    def domain(self) -> Domain:
+        return self.url, self.sitekey
+
+    def offset(self, now: Optional[float] = None) -> float:
+        """Seconds since the release, negative before it"""
+        return (time.monotonic() if now is None else now) - self._release
+
+    def planned(self, offset: float) -> float:
+        """
+        Tokens the plan expects in the pool at an offset: none before solving starts,
+        then rising linearly to expected_tokens at release, and none after it since the
+        release takes them all
+        """
+        if offset < self.solve_offset:
+            return 0.0
+        if offset <= 0:
+            return min(float(self.expected_tokens), self.harvesters * (offset - self.solve_offset) / self.solve_time)
+        return 0.0
+
+    def report(self) -> Dict[str, Any]:
+        """The schedule, the planned versus actual pool curve and the pool at release"""
+        return {
+            'name': self.name,
+            'url': self.url,
+            'sitekey': self.sitekey,
+            'state': self.state,
+            'release_at': datetime.datetime.fromtimestamp(self.release_at).isoformat(),
+            'demand': self.demand,
+            'min_ttl': self.min_ttl,
+            'solve_time': round(self.solve_time, 3),
+            'measured_solve_time': None if self.measured_solve_time is None else round(self.measured_solve_time, 3),
+            'harvesters': self.harvesters,
+            'expected_tokens': self.expected_tokens,
+            'shortfall': self.shortfall,
+            'schedule': {
+                'nudge': round(self.nudge_offset, 1),
+                'open': round(self.open_offset, 1),
+                'solve': round(self.solve_offset, 1),
+                'close': round(self.close_offset, 1),
+            },
+            'at_release': self.at_release,
+            'curve': [
+                {'offset': round(offset, 1), 'planned': round(self.planned(offset), 1), 'tokens': tokens, 'usable': usable}
+                for offset, tokens, usable in self.samples
+            ],
+        }
+
+
+class DropPlanner:
+    """
+    Ramps harvesting up ahead of scheduled releases so the pool peaks at release.
+
+    Each scheduled drop becomes a DropPlan. A background pass tells the operator
+    to get ready, opens the plan's harvesters launch_time before solving should
+    start, resets their widgets and nudges the operator again when it does,
+    records the pool at release and closes the harvesters it opened linger
+    seconds later. The pool is sampled every pass from opening to closing for
+    the planned versus actual curve in DropPlan.report.
+
+    Solve times come, in order, from the schedule call, from earlier drops on
+    the same domain, from the solve time histogram, or from default_solve_time.
+    """
+
+    def __init__(self, manager: HarvesterManager, interval: float = 1.0, default_solve_time: float = 30.0,
+                 launch_time: float = 20.0, nudge_lead: float = 60.0, linger: float = 30.0,
+                 concurrency: int = 2, nudge_callback: Optional[Callable[[DropPlan, str], None]] = None,
+                 **harvester_kwargs: Any):
+        """
+        Initialize the planner
+
+        Args:
+            manager: Manager the harvesters are opened in and the pool is read from
+            interval: Seconds between passes, and between samples of the pool
+            default_solve_time: Seconds per token per harvester assumed without history
+            launch_time: Seconds a harvester takes to open
+            nudge_lead: Seconds before solving starts that the operator is told to get ready
+            linger: Seconds after a release the opened harvesters stay open
+            concurrency: Maximum number of browsers launching at once
+            nudge_callback: Optional callback called with (plan, message) instead of logging it
+            harvester_kwargs: Arguments for new harvesters
+        """
+        self.manager = manager
+        self.interval = interval
+        self.default_solve_time = default_solve_time
+        self.launch_time = launch_time
+        self.nudge_lead = nudge_lead
+        self.linger = linger
+        self.nudge_callback = nudge_callback
+        self.harvester_kwargs = harvester_kwargs
+
+        # Solve time measured on the last drop of each domain
+        self.solve_times: Dict[Domain, float] = {}
+        self._plans: List[DropPlan] = []
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread: Optional[Thread] = None
+        self._launcher = FleetLauncher(concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='harvester-planner')
+
+        manager.planner = self
+
+    def schedule(self, url: str, sitekey: str, release_at: Union[float, datetime.datetime], demand: int,
+                 min_ttl: float = 10.0, solve_time: Optional[float] = None, max_harvesters: int = 8,
+                 name: Optional[str] = None) -> DropPlan:
+        """
+        Plan harvesting for a release
+
+        Args:
+            url: Url to harvest on
+            sitekey: Sitekey to harvest for
+            release_at: Time of the release, a datetime or seconds since the epoch
+            demand: Tokens needed at release
+            min_ttl: Seconds a token needs left at release to be usable
+            solve_time: Seconds one harvester takes per token, measured when None
+            max_harvesters: Harvesters never exceeded
+            name: Name of the drop, for logs and reports
+
+        Returns:
+            DropPlan: The plan, its report fills in as the drop runs
+        """
+        if isinstance(release_at, datetime.datetime):
+            release_at = release_at.timestamp()
+        plan = DropPlan(
+            name or f'{url} {datetime.datetime.fromtimestamp(release_at):%H:%M:%S}', url, sitekey, release_at,
+            demand, min_ttl, solve_time or self.solve_time(url, sitekey), max_harvesters, self.launch_time,
+            self.nudge_lead, self.linger,
+        )
+        if plan.offset() > plan.open_offset:
+            logging.warning(
+                f"Drop {plan.name} is too close to plan fully, harvesting should have started "
+                f"{plan.offset() - plan.solve_offset:.0f}s ago"
+            )
+        if plan.shortfall:
+            logging.warning(
+                f"Drop {plan.name}: {plan.harvesters} harvesters can only solve {plan.expected_tokens} "
+                f"of {demand} tokens with {min_ttl:.0f}s left at release"
+            )
+        with self._lock:
+            self._plans.append(plan)
+        return plan
+
+    def cancel(self, plan: DropPlan) -> None:
+        """Drop a plan, harvesters it opened are closed"""
+        with self._lock:
+            if plan.state in (STATE_DONE, STATE_CANCELLED):
+                return
+            plan.state = STATE_CANCELLED
+        self._close(plan)
+
+    def plans(self) -> List[DropPlan]:
+        """Scheduled, running and finished plans"""
+        with self._lock:
+            return list(self._plans)
+
+    def solve_time(self, url: str, sitekey: str) -> float:
+        """Seconds per token per harvester expected on a domain"""
+        with self._lock:
+            measured = self.solve_times.get((url, sitekey))
+        if measured:
+            return measured
+        solves = SOLVE_SECONDS.snapshot()
+        if solves['count'] >= MIN_SOLVE_SAMPLES:
+            return solves['sum'] / solves['count']
+        return self.default_solve_time
+
+    def start(self) -> None:
+        """Run passes in a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, daemon=True, name='harvester-planner')
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop planning, harvesters opened for running plans stay open"""
+        self._stopped.set()
+        self._launcher.shutdown()
+        self._executor.shutdown(wait=False)
+        if self.manager.planner is self:
+            self.manager.planner = None
+
+    def check(self) -> None:
+        """Single pass: carry out every step that came due and sample the pool"""
+        now = time.monotonic()
+        for plan in self.plans():
+            if plan.state in (STATE_DONE, STATE_CANCELLED):
+                continue
+            offset = plan.offset(now)
+
+            if not plan.nudged and offset >= plan.nudge_offset:
+                plan.nudged = True
+                self._nudge(plan, f"Drop {plan.name}: get ready, solving starts in {plan.solve_offset - offset:.0f}s")
+
+            if plan.state == STATE_SCHEDULED and offset >= plan.open_offset:
+                plan.state = STATE_OPENING
+                self._open(plan)
+
+            if plan.state == STATE_OPENING and offset >= plan.solve_offset:
+                plan.state = STATE_SOLVING
+                self._start_solving(plan)
+
+            if plan.state == STATE_SOLVING and offset >= 0:
+                plan.state = STATE_RELEASED
+                self._record_release(plan)
+
+            if plan.state in (STATE_OPENING, STATE_SOLVING, STATE_RELEASED):
+                ttls = self.manager.token_ttls(plan.sitekey, plan.url)
+                plan.samples.append((offset, len(ttls), sum(1 for ttl in ttls if ttl >= plan.min_ttl)))
+
+            if plan.state == STATE_RELEASED and offset >= plan.close_offset:
+                plan.state = STATE_DONE
+                self._close(plan)
+
+    def stats(self) -> Dict[str, Any]:
+        """State and key offsets of every plan, reports hold the full detail"""
+        return {
+            'plans': [
+                {
+                    'name': plan.name,
+                    'state': plan.state,
+                    'offset': round(plan.offset(), 1),
+                    'harvesters': plan.harvesters,
+                    'opened': len(plan.opened),
+                    'expected_tokens': plan.expected_tokens,
+                    'shortfall': plan.shortfall,
+                }
+                for plan in self.plans()
+            ],
+            'solve_times': {f'{url} {sitekey}': round(value, 3) for (url, sitekey), value in self.solve_times.items()},
+        }
+
+    def _live(self, plan: DropPlan) -> List['Harvester']:
+        return [
+            harvester for harvester in list(self.manager.harvesters)
+            if (harvester.url, harvester.sitekey) == plan.domain and not harvester.closed
+        ]
+
+    def _open(self, plan: DropPlan) -> None:
+        missing = plan.harvesters - len(self._live(plan))
+        if missing <= 0:
+            return
+        harvesters = [
+            self.manager.create_harvester(plan.url, plan.sitekey, **self.harvester_kwargs) for _ in range(missing)
+        ]
+        # Harvesters over the domain's quota are dropped before their browser ever starts
+        accepted = [harvester for harvester in harvesters if self.manager.add_harvester(harvester)]
+        if len(accepted) < missing:
+            logging.warning(
+                f"Drop {plan.name}: the harvester quota only allowed {len(accepted)} of {missing} more harvesters"
+            )
+        plan.opened.extend(accepted)
+        self._launcher.launch(accepted)
+
+    def _start_solving(self, plan: DropPlan) -> None:
+        plan.solving_started = time.monotonic()
+        live = self._live(plan)
+        for harvester in live:
+            # Widgets solved during warm up would hand out tokens older than planned
+            reset = getattr(harvester, 'reset_harvester', None)
+            if reset:
+                self._executor.submit(reset)
+        plan.live_at_solve = len(live)
+        plan.harvested_at_solve = self.manager.domain_status().get(plan.domain, {}).get('harvested', 0)
+        self._nudge(
+            plan, f"Drop {plan.name}: start solving now, {plan.expected_tokens} tokens on "
+                  f"{len(live)} harvesters in {plan.harvest_seconds:.0f}s"
+        )
+
+    def _record_release(self, plan: DropPlan) -> None:
+        ttls = self.manager.token_ttls(plan.sitekey, plan.url)
+        usable = [ttl for ttl in ttls if ttl >= plan.min_ttl]
+        plan.at_release = {
+            'tokens': len(ttls),
+            'usable': len(usable),
+            'planned': plan.expected_tokens,
+            'mean_ttl': round(sum(usable) / len(usable), 1) if usable else None,
+            'min_ttl': round(min(usable), 1) if usable else None,
+        }
+
+        harvested = self.manager.domain_status().get(plan.domain, {}).get('harvested', 0)
+        solved = harvested - (plan.harvested_at_solve or 0)
+        elapsed = time.monotonic() - plan.solving_started if plan.solving_started is not None else 0.0
+        if solved > 0 and plan.live_at_solve and elapsed > 0:
+            plan.measured_solve_time = plan.live_at_solve * elapsed / solved
+            with self._lock:
+                self.solve_times[plan.domain] = plan.measured_solve_time
+
+        logging.info(
+            f"Drop {plan.name} released with {len(usable)} usable tokens of {plan.demand} needed, "
+            f"{plan.expected_tokens} planned"
+        )
+
+    def _close(self, plan: DropPlan) -> None:
+        opened, plan.opened = plan.opened, []
+        for harvester in opened:
+            self.manager.remove_harvester(harvester)
+            self._executor.submit(self._quit, harvester)
+
+    @staticmethod
+    def _quit(harvester: 'Harvester') -> None:
+        try:
+            harvester.quit()
+        except Exception as e:
+            logging.error(f"Failed to close harvester {harvester.id}: {e}")
+
+    def _nudge(self, plan: DropPlan, message: str) -> None:
+        if self.nudge_callback:
+            try:
+                self.nudge_callback(plan, message)
+            except Exception as e:
+                logging.error(f"Nudge callback failed: {e}")
+        else:
+            logging.warning(message)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logging.error(f"Drop planner pass failed: {e}")
@@ -0,0 +1,275 @@
+from threading import Lock
+from typing import Optional, Dict, Union, Callable, Iterable
+import pathlib
+import hashlib
+import shutil
+import stat
+import json
+import time
+import sys
+import os
+import errno
+import logging
+
+GOLDEN_MARKER = '.harvester-golden.json'
+CLONE_MARKER = '.harvester-clone.json'
+
+# Chrome rebuilds these on demand, cloning them only costs disk and time
+SKIP_NAMES = frozenset({
+    'Cache', 'Code Cache', 'GPUCache', 'ShaderCache', 'GrShaderCache', 'GraphiteDawnCache',
+    'DawnCache', 'Crashpad', 'CacheStorage', 'ScriptCache', 'component_crx_cache',
+    'SingletonLock', 'SingletonSocket', 'SingletonCookie', 'lockfile',
+})
+
+FICLONE = 0x40049409
+
+_reflink_unsupported = set()
+
+
+def _reflink(src: str, dst: str) -> bool:
+    """Copy-on-write clone of a file, False if the filesystem cannot do it"""
+    device = os.stat(src).st_dev
+    if device in _reflink_unsupported:
+        return False
+
+    try:
+        if sys.platform.startswith('linux'):
+            import fcntl
+            with open(src, 'rb') as source, open(dst, 'wb') as target:
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            return True
+        if sys.platform == 'darwin':
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            if libc.clonefile(src.encode(), dst.encode(), 0) == 0:
+                return True
+            raise OSError(ctypes.get_errno(), 'clonefile failed')
+    except OSError as e:
+        if os.path.exists(dst):
+            os.remove(dst)
+        if e.errno in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS):
+            _reflink_unsupported.add(device)
+            return False
+        raise
+    _reflink_unsupported.add(device)
+    return False
+
+
+def clone_tree(src: pathlib.Path, dst: pathlib.Path, skip: Iterable[str] = SKIP_NAMES) -> Dict[str, int]:
+    """
+    Clone a directory, reflinking files where the filesystem supports it
+
+    Profile files are not hardlinked: Chrome rewrites its SQLite databases in
+    place, so a hardlink would share cookies and history between clones.
+
+    Args:
+        src: Directory to clone
+        dst: Destination, created if missing
+        skip: File and directory names left out of the clone
+
+    Returns:
+        dict: Number of files reflinked and copied, and bytes actually copied
+    """
+    skip = frozenset(skip)
+    stats = {'reflinked': 0, 'copied': 0, 'bytes_copied': 0}
+
+    for root, dirs, files in os.walk(src):
+        dirs[:] = [name for name in dirs if name not in skip]
+        target_root = dst / os.path.relpath(root, src)
+        target_root.mkdir(parents=True, exist_ok=True)
+
+        for name in files:
+            if name in skip or name in (GOLDEN_MARKER, CLONE_MARKER):
+                continue
+            source = os.path.join(root, name)
+            target = str(target_root / name)
+            if os.path.islink(source):
+                continue
+            if _reflink(source, target):
+                stats['reflinked'] += 1
+            else:
+                shutil.copyfile(source, target)
+                stats['copied'] += 1
+                stats['bytes_copied'] += os.path.getsize(source)
+
+    return stats
+
+
+class ProfileProvisioner:
+    """
+    Builds one golden Chrome profile and clones it per harvester.
+
+    The golden profile is set up once, optionally logged in to Google, and each
+    harvester slot gets a copy-on-write clone of it. A slot is only re-cloned when
+    the golden profile was rebuilt since, so restarting a harvester keeps its
+    profile. Extensions are written once per distinct content to a shared,
+    read-only directory instead of being copied into every profile.
+    """
+
+    def __init__(self, root: pathlib.Path, extension_blueprint: Optional[pathlib.Path] = None):
+        """
+        Initialize the provisioner
+
+        Args:
+            root: Directory holding the golden profile, slots and shared extensions
+            extension_blueprint: Directory of the bundled harvester extension
+        """
+        self.root = pathlib.Path(root)
+        self.golden_path = self.root / 'golden'
+        self.slots_dir = self.root / 'harvester'
+        self.extensions_dir = self.root / 'extensions'
+        self.extension_blueprint = extension_blueprint
+
+        self.clone_times: Dict[int, float] = {}
+        self.clone_stats: Dict[str, int] = {'reflinked': 0, 'copied': 0, 'bytes_copied': 0}
+        self._blueprint_path: Optional[pathlib.Path] = None
+        self._lock = Lock()
+        self._golden_lock = Lock()
+
+    def golden_state(self) -> Dict:
+        """Contents of the golden profile marker, generation 0 if it was never built"""
+        try:
+            with open(self.golden_path / GOLDEN_MARKER) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'generation': 0, 'logged_in': False}
+
+    def ensure_golden(self, builder: Optional[Callable[[pathlib.Path], None]] = None, logged_in: bool = False) -> None:
+        """
+        Build the golden profile if it is missing or lacks a login
+
+        Concurrent callers wait for the first build instead of starting their own.
+
+        Args:
+            builder: Called with the golden profile path to populate it, e.g. by logging in
+            logged_in: Whether the built profile should be logged in
+        """
+        with self._golden_lock:
+            state = self.golden_state()
+            if self.golden_path.is_dir() and (state.get('logged_in') or not logged_in):
+                return
+
+            self.golden_path.mkdir(parents=True, exist_ok=True)
+            if builder:
+                builder(self.golden_path)
+            self._write_json(self.golden_path / GOLDEN_MARKER, {
+                'generation': state.get('generation', 0) + 1,
+                'logged_in': logged_in,
+                'built': time.time(),
+            })
+
+    def clone(self, slot: int) -> pathlib.Path:
+        """
+        Profile directory for a harvester slot, cloned from the golden profile when stale
+
+        Args:
+            slot: Harvester slot number
+
+        Returns:
+            Path: Profile directory
+        """
+        self.ensure_golden()
+        generation = self.golden_state().get('generation', 0)
+        dest = self.slots_dir / str(slot)
+
+        if dest.is_dir():
+            marker = dest / CLONE_MARKER
+            if not marker.exists():
+                # Profile from before golden cloning, keep its state
+                self._write_json(marker, {'generation': generation})
+                return dest
+            try:
+                with open(marker) as f:
+                    if json.load(f).get('generation') == generation:
+                        return dest
+            except (OSError, ValueError):
+                pass
+
+        started = time.monotonic()
+        tmp = self.slots_dir / f'.{slot}.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        stats = clone_tree(self.golden_path, tmp)
+        self._write_json(tmp / CLONE_MARKER, {'generation': generation})
+
+        shutil.rmtree(dest, ignore_errors=True)
+        os.replace(tmp, dest)
+
+        with self._lock:
+            self.clone_times[slot] = time.monotonic() - started
+            for key, value in stats.items():
+                self.clone_stats[key] += value
+        return dest
+
+    def remove(self, slot: int) -> None:
+        """Delete a slot's profile"""
+        shutil.rmtree(self.slots_dir / str(slot), ignore_errors=True)
+
+    def blueprint_files(self) -> Dict[str, bytes]:
+        """Files of the bundled extension, keyed by relative path"""
+        if not self.extension_blueprint or not self.extension_blueprint.exists():
+            logging.error(f"Extension blueprint directory not found at: {self.extension_blueprint}")
+            raise FileNotFoundError(f"Extension directory not found: {self.extension_blueprint}")
+
+        files = {}
+        for path in sorted(self.extension_blueprint.rglob('*')):
+            if path.is_file():
+                files[path.relative_to(self.extension_blueprint).as_posix()] = path.read_bytes()
+        return files
+
+    def blueprint_extension(self) -> pathlib.Path:
+        """Shared copy of the bundled extension, written once per process and content"""
+        with self._lock:
+            if self._blueprint_path and self._blueprint_path.is_dir():
+                return self._blueprint_path
+        path = self.extension_dir('harvester', self.blueprint_files())
+        with self._lock:
+            self._blueprint_path = path
+        return path
+
+    def extension_dir(self, name: str, files: Dict[str, Union[str, bytes]]) -> pathlib.Path:
+        """
+        Shared read-only extension directory for the given content
+
+        Identical content maps to the same directory, so any number of harvesters
+        load one copy.
+
+        Args:
+            name: Prefix of the directory name
+            files: File contents keyed by relative path
+
+        Returns:
+            Path: Extension directory
+        """
+        encoded = {path: data.encode('utf-8') if isinstance(data, str) else data for path, data in files.items()}
+        digest = hashlib.sha256()
+        for path in sorted(encoded):
+            digest.update(path.encode('utf-8') + b'\0' + hashlib.sha256(encoded[path]).digest())
+
+        dest = self.extensions_dir / f'{name}-{digest.hexdigest()[:16]}'
+        if dest.is_dir():
+            return dest
+
+        tmp = self.extensions_dir / f'.{dest.name}.{os.getpid()}.{id(files)}.tmp'
+        for path, data in encoded.items():
+            target = tmp / path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(data)
+            if os.name != 'nt':
+                os.chmod(target, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+        try:
+            os.replace(tmp, dest)
+        except OSError:
+            # Another harvester wrote the same extension first
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not dest.is_dir():
+                raise
+        return dest
+
+    @staticmethod
+    def _write_json(path: pathlib.Path, data: Dict) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
@@ -0,0 +1,174 @@
+from threading import Thread, Lock, current_thread
+from queue import Queue
+from typing import Optional, Callable, Dict, List, Any
+import time
+import logging
+
+
+class TickScheduler:
+    """
+    Fixed size worker pool running harvester ticks.
+
+    Every harvester is queued or in flight at most once, so a slow harvester cannot
+    pile up ticks and no threads are created per tick. A tick running longer than
+    the deadline is reported as stuck; once it passes the stuck timeout its worker
+    is written off and a replacement is started so the pool keeps its capacity.
+    """
+
+    def __init__(self, workers: int = 8, tick_deadline: float = 5.0, stuck_timeout: float = 30.0,
+                 max_replacements: int = 8, stuck_callback: Optional[Callable] = None):
+        """
+        Initialize the scheduler
+
+        Args:
+            workers: Number of worker threads
+            tick_deadline: Seconds after which a running tick counts as overdue
+            stuck_timeout: Seconds after which the worker running a tick is replaced
+            max_replacements: Maximum number of written off workers alive at once
+            stuck_callback: Optional callback called with a harvester when its tick gets stuck
+        """
+        self.workers = workers
+        self.tick_deadline = tick_deadline
+        self.stuck_timeout = stuck_timeout
+        self.max_replacements = max_replacements
+        self.stuck_callback = stuck_callback
+
+        self._queue: Queue = Queue()
+        self._scheduled: set = set()
+        self._in_flight: Dict[int, Dict[str, Any]] = {}
+        self._lock = Lock()
+        self._threads: List[Thread] = []
+        self._abandoned: set = set()
+        self._running = False
+
+        self.ticks = 0
+        self.overruns = 0
+        self.replaced_workers = 0
+
+    def start(self) -> None:
+        """Start the worker threads"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            for _ in range(self.workers):
+                self._spawn_worker()
+
+    def stop(self) -> None:
+        """Stop the workers once they finish their current tick"""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            threads = len(self._threads)
+
+        for _ in range(threads):
+            self._queue.put(None)
+
+    def submit(self, harvester) -> bool:
+        """
+        Queue a tick for a harvester
+
+        Args:
+            harvester: Harvester to tick
+
+        Returns:
+            bool: False if the harvester is already queued or in flight
+        """
+        with self._lock:
+            if not self._running or id(harvester) in self._scheduled:
+                return False
+            self._scheduled.add(id(harvester))
+
+        self._queue.put(harvester)
+        return True
+
+    def check_stuck(self) -> List[Any]:
+        """
+        Find ticks running past the deadline, replacing workers stuck past the timeout
+
+        Returns:
+            list: Harvesters whose tick is overdue
+        """
+        now = time.monotonic()
+        overdue = []
+        with self._lock:
+            for entry in self._in_flight.values():
+                elapsed = now - entry['started']
+                if elapsed < self.tick_deadline:
+                    continue
+
+                overdue.append(entry['harvester'])
+                if not entry['overdue']:
+                    entry['overdue'] = True
+                    self.overruns += 1
+                    logging.warning(f"Harvester tick overdue after {elapsed:.1f}s")
+
+                if (elapsed >= self.stuck_timeout and entry['thread'] not in self._abandoned
+                        and len(self._abandoned) < self.max_replacements and self._running):
+                    self._abandoned.add(entry['thread'])
+                    self.replaced_workers += 1
+                    self._spawn_worker()
+                    logging.error(f"Harvester tick stuck for {elapsed:.1f}s, replacing its worker")
+                    if self.stuck_callback:
+                        self.stuck_callback(entry['harvester'])
+
+        return overdue
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of pool saturation and queue depth"""
+        with self._lock:
+            busy = len(self._in_flight)
+            live_workers = len(self._threads) - len(self._abandoned)
+            return {
+                'workers': live_workers,
+                'busy': busy,
+                'saturation': min(busy, live_workers) / live_workers if live_workers else 1.0,
+                'queue_depth': self._queue.qsize(),
+                'scheduled': len(self._scheduled),
+                'overdue': sum(1 for entry in self._in_flight.values() if entry['overdue']),
+                'abandoned_workers': len(self._abandoned),
+                'ticks': self.ticks,
+                'overruns': self.overruns,
+                'replaced_workers': self.replaced_workers,
+            }
+
+    def _spawn_worker(self) -> None:
+        thread = Thread(target=self._worker, daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def _worker(self) -> None:
+        me = current_thread()
+        while True:
+            harvester = self._queue.get()
+            if harvester is None:
+                break
+
+            with self._lock:
+                self._in_flight[id(harvester)] = {
+                    'harvester': harvester,
+                    'started': time.monotonic(),
+                    'thread': me,
+                    'overdue': False,
+                }
+
+            try:
+                harvester.tick()
+            except Exception as e:
+                logging.error(f"Harvester tick raised: {e}")
+            finally:
+                with self._lock:
+                    self._in_flight.pop(id(harvester), None)
+                    self._scheduled.discard(id(harvester))
+                    self.ticks += 1
+                    abandoned = me in self._abandoned
+
+            if abandoned:
+                # A replacement already took this worker's place
+                break
+
+        with self._lock:
+            self._abandoned.discard(me)
+            if me in self._threads:
+                self._threads.remove(me)
@@ -0,0 +1,304 @@
+from .harvester_manager import HarvesterManager
+from .async_manager import AsyncHarvesterManager
+from . import websocket
+from .metrics import REGISTRY, CONTENT_TYPE
+from urllib.parse import urlsplit, parse_qs
+from typing import Optional, Union, Dict, Any, Tuple
+import asyncio
+import json
+import math
+import logging
+
+REASONS = {
+    101: 'Switching Protocols',
+    200: 'OK',
+    204: 'No Content',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    503: 'Service Unavailable',
+}
+
+
+class TokenServer:
+    """
+    Local HTTP/WebSocket endpoint serving harvested tokens to other processes.
+
+    Endpoints:
+        GET /token?sitekey=...&url=...&min_ttl=...&timeout=...  long-poll for one token
+        GET /tokens?sitekey=...&url=...&min_ttl=...             WebSocket stream, one token per message
+        GET /status                                     pool and fleet status
+        GET /metrics                                    Prometheus metrics
+
+    Everything runs on one asyncio loop: connections are kept alive, waiting
+    requests are parked futures rather than threads, and the number of open
+    connections is capped.
+    """
+
+    def __init__(self, manager: Union[HarvesterManager, AsyncHarvesterManager], host: str = '127.0.0.1',
+                 port: int = 8765, max_connections: int = 1024, max_wait: float = 60.0,
+                 keep_alive: float = 75.0):
+        """
+        Initialize the server
+
+        Args:
+            manager: Manager whose tokens are served
+            host: Interface to bind, loopback by default
+            port: Port to bind, 0 picks a free one
+            max_connections: Connections served at once, further ones get 503
+            max_wait: Longest long-poll a client may request, in seconds
+            keep_alive: Seconds an idle keep-alive connection is held open
+        """
+        if isinstance(manager, AsyncHarvesterManager):
+            self.async_manager = manager
+        else:
+            self.async_manager = AsyncHarvesterManager(manager)
+        self.manager = self.async_manager.manager
+
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.max_wait = max_wait
+        self.keep_alive = keep_alive
+
+        self.connections = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        """Bind the socket and start accepting connections"""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        """Start if needed and serve until cancelled"""
+        if not self._server:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self) -> None:
+        """Stop accepting connections"""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def run(self) -> None:
+        """Serve on a new event loop, blocking the calling thread"""
+        asyncio.run(self.serve_forever())
+
+    def status(self) -> Dict[str, Any]:
+        """Pool and fleet status"""
+        counts = self.manager.token_counts()
+        domains = [
+            dict(stats, url=domain[0], sitekey=domain[1])
+            for domain, stats in self.manager.domain_status().items()
+        ]
+        return {
+            'tokens': sum(counts.values()),
+            'sitekeys': {str(sitekey): count for sitekey, count in counts.items()},
+            'domains': domains,
+            'harvesters': len(self.manager.harvesters),
+            'connections': self.connections,
+            'scheduler': self.manager.scheduler_stats(),
+        }
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        if self.connections >= self.max_connections:
+            await self._respond(writer, 503, {'error': 'too many connections'}, keep_alive=False)
+            writer.close()
+            return
+
+        self.connections += 1
+        # Bytes of the next request read while a long-poll watched the connection
+        pending = b''
+        try:
+            while True:
+                request = await self._read_request(reader, pending)
+                pending = b''
+                if request is None:
+                    break
+
+                method, path, query, headers = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+
+                if method != 'GET':
+                    await self._respond(writer, 405, {'error': 'method not allowed'}, keep_alive)
+                elif path == '/token':
+                    pending = await self._handle_token(reader, writer, query, keep_alive)
+                    if pending is None:
+                        break
+                elif path == '/tokens' and headers.get('upgrade', '').lower() == 'websocket':
+                    await self._handle_stream(reader, writer, query, headers)
+                    break
+                elif path == '/status':
+                    await self._respond(writer, 200, self.status(), keep_alive)
+                elif path == '/metrics':
+                    await self._respond(writer, 200, REGISTRY.render(), keep_alive, CONTENT_TYPE)
+                else:
+                    await self._respond(writer, 404, {'error': 'not found'}, keep_alive)
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logging.error(f"Token server connection failed: {e}")
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader,
+                            pending: bytes = b'') -> Optional[Tuple[str, str, Dict[str, str], Dict[str, str]]]:
+        try:
+            head = pending + await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.keep_alive)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return None
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            return None
+
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length') or 0)
+        if length:
+            await reader.readexactly(length)
+
+        parts = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(parts.query).items()}
+        return method.upper(), parts.path, query, headers
+
+    async def _handle_token(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                            query: Dict[str, str], keep_alive: bool) -> Optional[bytes]:
+        # Returns bytes of the next request read while waiting, None once the client is gone
+        try:
+            sitekey, url, min_ttl = self._filters(query)
+            timeout = min(float(query.get('timeout', self.max_wait)), self.max_wait)
+        except ValueError:
+            await self._respond(writer, 400, {'error': 'invalid parameters'}, keep_alive)
+            return b''
+
+        getter = asyncio.ensure_future(
+            self.async_manager.get_token(sitekey, timeout=timeout, min_ttl=min_ttl, url=url)
+        )
+        # Watch for a disconnect, the waiter would otherwise take a token nobody receives
+        watcher = asyncio.ensure_future(reader.read(1))
+        await asyncio.wait((getter, watcher), return_when=asyncio.FIRST_COMPLETED)
+        if watcher.done():
+            pending = b'' if watcher.exception() else watcher.result()
+            if not pending:
+                getter.cancel()
+                try:
+                    token = await getter
+                except asyncio.CancelledError:
+                    return None
+                if token is not None:
+                    # Handed over in the same loop iteration the client left
+                    self.manager.return_token(token)
+                return None
+        else:
+            watcher.cancel()
+            pending = b''
+
+        # The client is still there, a pipelined request it sent is kept for the next read
+        token = await getter
+        if token is None:
+            await self._respond(writer, 204, None, keep_alive)
+            return pending
+
+        try:
+            await self._respond(writer, 200, token.as_dict(), keep_alive)
+        except Exception:
+            # The client went away while waiting, the token is still good
+            self.manager.return_token(token)
+            raise
+        return pending
+
+    async def _handle_stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                             query: Dict[str, str], headers: Dict[str, str]) -> None:
+        key = headers.get('sec-websocket-key')
+        if not key:
+            await self._respond(writer, 400, {'error': 'missing Sec-WebSocket-Key'}, keep_alive=False)
+            return
+        # Reject bad filters while a plain HTTP response can still be sent
+        try:
+            sitekey, url, min_ttl = self._filters(query)
+        except ValueError:
+            await self._respond(writer, 400, {'error': 'invalid parameters'}, keep_alive=False)
+            return
+
+        writer.write(
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {websocket.accept_key(key)}\r\n\r\n'.encode('latin-1')
+        )
+        await writer.drain()
+
+        closed = asyncio.ensure_future(self._watch_stream(reader, writer))
+
+        try:
+            while not closed.done():
+                getter = asyncio.ensure_future(self.async_manager.get_token(sitekey, min_ttl=min_ttl, url=url))
+                await asyncio.wait((getter, closed), return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    break
+
+                token = getter.result()
+                try:
+                    writer.write(websocket.encode_frame(json.dumps(token.as_dict()).encode('utf-8')))
+                    await writer.drain()
+                except Exception:
+                    self.manager.return_token(token)
+                    raise
+        finally:
+            closed.cancel()
+
+    @staticmethod
+    def _filters(query: Dict[str, str]) -> Tuple[Optional[str], Optional[str], float]:
+        # sitekey, url and min_ttl of a token request, ValueError on bad values
+        sitekey = query.get('sitekey')
+        url = query.get('url')
+        min_ttl = float(query.get('min_ttl', 0))
+        if not math.isfinite(min_ttl) or min_ttl < 0:
+            raise ValueError(f"invalid min_ttl {min_ttl}")
+        return sitekey, url, min_ttl
+
+    async def _watch_stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Answers pings and returns once the client closes the stream
+        try:
+            while True:
+                opcode, payload = await websocket.read_frame(reader)
+                if opcode == websocket.OP_CLOSE:
+                    writer.write(websocket.encode_frame(payload[:2], websocket.OP_CLOSE))
+                    await writer.drain()
+                    return
+                if opcode == websocket.OP_PING:
+                    writer.write(websocket.encode_frame(payload, websocket.OP_PONG))
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            return
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, body: Union[Dict[str, Any], str, None],
+                       keep_alive: bool, content_type: str = 'application/json') -> None:
+        if isinstance(body, str):
+            payload = body.encode('utf-8')
+        else:
+            payload = json.dumps(body).encode('utf-8') if body is not None else b''
+        head = (
+            f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\n'
+            f'Content-Length: {len(payload)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n'
+        )
+        if payload:
+            head += f'Content-Type: {content_type}\r\n'
+        writer.write(head.encode('latin-1') + b'\r\n' + payload)
+        await writer.drain()
@@ -0,0 +1,485 @@
+from .harvester_manager import HarvesterManager
+from .token_pool import Token
+from .trace import TRACE
+from threading import Thread, Lock, Event
+from typing import Optional, Dict, List, Any, Set, TYPE_CHECKING
+import multiprocessing
+import itertools
+import datetime
+import time
+import os
+import logging
+
+if TYPE_CHECKING:
+    from multiprocessing.connection import Connection
+    from .harvester import Harvester
+
+# Broker -> shard commands
+CMD_CREATE = 'create'
+CMD_ATTACH = 'attach'
+CMD_DETACH = 'detach'
+CMD_START = 'start'
+CMD_QUIT = 'quit'
+CMD_STOP = 'stop'
+
+# Shard -> broker messages
+MSG_TOKEN = 'token'
+MSG_STATE = 'state'
+MSG_STARTED = 'started'
+
+# Seconds between harvester state reports of a shard
+STATE_INTERVAL = 0.5
+
+
+class RemoteHarvester:
+    """
+    Stand-in, in the broker process, for a harvester living in a shard process.
+
+    Carries the attributes the manager, supervisor and autoscaler read (id, url,
+    sitekey, ready, closed, ticking, tick_started, ticks, generation), mirrored
+    from the shard every STATE_INTERVAL, and forwards start, restart and quit to
+    the shard. start and restart block until the shard reports the browser up,
+    like they do on a Harvester. Built by ShardedHarvesterManager.create_harvester.
+    """
+
+    def __init__(self, shard: '_Shard', harvester_id: int, url: str, sitekey: str,
+                 harvester_kwargs: Dict[str, Any], launch_timeout: float):
+        self.shard = shard
+        self.id = harvester_id
+        self.url = url
+        self.sitekey = sitekey
+        self.harvester_kwargs = harvester_kwargs
+        self.launch_timeout = launch_timeout
+        self.on_response = None
+
+        self.ready = False
+        self.closed = False
+        self.ticking = False
+        self.tick_started = 0.0
+        self.ticks = 0
+        self.generation = 0
+
+        self.launching = False
+        self._started = Event()
+        self._error: Optional[str] = None
+
+    def start(self) -> None:
+        """Launch Chrome in the shard and wait until the page is loaded"""
+        self._launch(False)
+
+    def restart(self) -> None:
+        """Relaunch the browser in the shard into the same profile, slot and page"""
+        self.generation += 1
+        self._launch(True)
+
+    def quit(self) -> None:
+        """Close the browser, the shard keeps the harvester for a later restart"""
+        self.ready = False
+        self.ticking = False
+        self.shard.send((CMD_QUIT, self.id), spawn=False)
+
+    def pull_response_queue(self) -> List[Token]:
+        # Tokens arrive through the broker, never through the stand-in
+        return []
+
+    def _launch(self, restart: bool) -> None:
+        self.launching = True
+        self.ready = False
+        self._error = None
+        self._started.clear()
+        try:
+            if not self.shard.send((CMD_START, self.id, restart)):
+                self._error = f"shard {self.shard.index} is not running"
+            elif not self._started.wait(self.launch_timeout):
+                self._error = f"no answer from shard {self.shard.index} within {self.launch_timeout:.0f}s"
+        finally:
+            self.launching = False
+
+        if self._error:
+            self.closed = True
+            raise RuntimeError(f"Harvester {self.id} failed to start: {self._error}")
+
+    def _on_started(self, error: Optional[str]) -> None:
+        self._error = error
+        self.ready = error is None
+        self.closed = error is not None
+        self.ticking = False
+        self._started.set()
+
+    def __repr__(self) -> str:
+        return f'RemoteHarvester(id={self.id}, shard={self.shard.index}, url={self.url!r})'
+
+
+class _Shard:
+    """Shard process as seen from the broker, spawned on first use and again after it dies"""
+
+    def __init__(self, index: int, manager: 'ShardedHarvesterManager'):
+        self.index = index
+        self.manager = manager
+        self.harvesters: Dict[int, RemoteHarvester] = {}
+        self.process: Optional[multiprocessing.Process] = None
+        self.connection: Optional['Connection'] = None
+        self.spawns = 0
+        self.tokens = 0
+        self.stopped = False
+        self._lock = Lock()
+
+    def send(self, message: tuple, spawn: bool = True) -> bool:
+        """
+        Send a command, spawning the process first if it is not running
+
+        Returns:
+            bool: False if the shard is not running and may not be spawned
+        """
+        with self._lock:
+            if self.connection is None:
+                if not spawn or self.stopped:
+                    return False
+                self._spawn()
+            try:
+                self.connection.send(message)
+                return True
+            except (OSError, ValueError) as e:
+                logging.error(f"Harvester shard {self.index} unreachable: {e}")
+                return False
+
+    def stop(self, timeout: float) -> None:
+        """Let the process quit its browsers and exit, killing it after timeout seconds"""
+        self.send((CMD_STOP,), spawn=False)
+        with self._lock:
+            self.stopped = True
+            process = self.process
+        if process is None:
+            return
+        process.join(timeout)
+        if process.is_alive():
+            logging.error(f"Harvester shard {self.index} did not exit, terminating it")
+            process.terminate()
+            process.join(1.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            process = self.process
+            return {
+                'pid': process.pid if process else None,
+                'alive': self.connection is not None,
+                'harvesters': len(self.harvesters),
+                'tokens': self.tokens,
+                'spawns': self.spawns,
+            }
+
+    def _spawn(self) -> None:
+        # Must be called with the lock held
+        context = multiprocessing.get_context('spawn')
+        connection, child = context.Pipe()
+        # Each shard traces to its own file next to the broker's, e.g. trace.shard0.jsonl
+        trace_path = None
+        if TRACE.enabled:
+            trace_path = str(TRACE.path.with_name(f'{TRACE.path.stem}.shard{self.index}{TRACE.path.suffix}'))
+        process = context.Process(
+            target=_run_shard, args=(child, self.manager.shard_delay, self.manager.shard_workers, trace_path),
+            name=f'harvester-shard-{self.index}', daemon=True
+        )
+        process.start()
+        child.close()
+        self.process = process
+        self.connection = connection
+        self.spawns += 1
+        # A respawned shard starts empty, recreate the harvesters placed on it
+        for harvester in self.harvesters.values():
+            connection.send((CMD_CREATE, harvester.id, harvester.url, harvester.sitekey, harvester.harvester_kwargs))
+        Thread(target=self._read, args=(connection,), daemon=True, name=f'harvester-shard-{self.index}').start()
+
+    def _read(self, connection: 'Connection') -> None:
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                break
+            try:
+                self.manager._on_message(self, message)
+            except Exception as e:
+                logging.error(f"Harvester shard {self.index} message failed: {e}")
+
+        with self._lock:
+            if self.connection is not connection:
+                return
+            self.connection = None
+            connection.close()
+            process = self.process
+        process.join(1.0)
+        self.manager._on_exit(self, process.exitcode)
+
+
+class ShardedHarvesterManager(HarvesterManager):
+    """
+    HarvesterManager whose harvesters run in worker processes.
+
+    Each shard process owns a share of the harvesters and runs its own
+    HarvesterManager tick loop, so ticks on different shards never contend for
+    one GIL or one manager lock, and a wedged chromedriver only holds up its
+    own shard. Shards stream captured tokens to this process over a pipe, where
+    they land in the usual token pool, so take_response, acquire, lease, the
+    listeners, the journal and a TokenServer all work unchanged.
+
+    Harvesters are built with create_harvester, which places them on the shard
+    with the fewest harvesters and returns a RemoteHarvester. A shard process
+    that dies takes its browsers with it: its harvesters are reported closed,
+    for a HarvesterSupervisor to restart like any crashed browser, and the
+    shard is spawned again when one of them is.
+
+    Shards use the 'spawn' start method, so scripts need the usual
+    `if __name__ == '__main__':` guard and harvester arguments must pickle.
+    Tick and WebDriver metrics are collected inside the shards.
+    """
+
+    def __init__(self, shards: Optional[int] = None, delay: float = 0.1, workers: Optional[int] = None,
+                 launch_timeout: float = 120.0, stop_timeout: float = 30.0, **manager_kwargs):
+        """
+        Initialize the broker
+
+        Args:
+            shards: Number of shard processes, one per CPU by default
+            delay: Time between tick updates, in the broker and in every shard
+            workers: Tick each shard's harvesters on a pool of this many threads
+            launch_timeout: Seconds a start or restart waits for its shard
+            stop_timeout: Seconds stop waits for each shard to quit its browsers
+            manager_kwargs: Remaining HarvesterManager arguments, used by the broker
+        """
+        super().__init__(delay=delay, **manager_kwargs)
+        self.shard_delay = delay
+        self.shard_workers = workers
+        self.launch_timeout = launch_timeout
+        self.stop_timeout = stop_timeout
+        self.shards = [_Shard(index, self) for index in range(shards or os.cpu_count() or 1)]
+        self._ids = itertools.count()
+        self._stopping = False
+
+    def create_harvester(self, url: str, sitekey: str, **harvester_kwargs) -> RemoteHarvester:
+        """
+        Place a new harvester on the least loaded shard, neither added nor started
+
+        Args:
+            url: Url of the page to harvest on
+            sitekey: Sitekey of the captcha
+            harvester_kwargs: Remaining Harvester arguments
+
+        Returns:
+            RemoteHarvester: Stand-in for the harvester
+        """
+        with self._lock:
+            shard = min(self.shards, key=lambda shard: len(shard.harvesters))
+            harvester = RemoteHarvester(shard, next(self._ids), url, sitekey, harvester_kwargs, self.launch_timeout)
+        with shard._lock:
+            shard.harvesters[harvester.id] = harvester
+        shard.send((CMD_CREATE, harvester.id, url, sitekey, harvester_kwargs))
+        return harvester
+
+    def add_harvester(self, harvester: RemoteHarvester) -> bool:
+        """
+        Add a harvester built by create_harvester, its shard ticks it once it is ready
+
+        Returns:
+            bool: False if the harvester's domain already has its quota of harvesters
+        """
+        if not super().add_harvester(harvester):
+            return False
+        harvester.shard.send((CMD_ATTACH, harvester.id))
+        return True
+
+    def remove_harvester(self, harvester: RemoteHarvester) -> None:
+        """Remove a harvester from management, its shard stops ticking it"""
+        super().remove_harvester(harvester)
+        harvester.shard.send((CMD_DETACH, harvester.id), spawn=False)
+
+    def tick(self) -> None:
+        """Single update tick, the shards tick the harvesters themselves"""
+        self.response_queue_check()
+
+        closed = []
+        with self._lock:
+            for harvester in self.harvesters[:]:
+                if harvester.closed:
+                    self.harvesters.remove(harvester)
+                    closed.append(harvester)
+
+        self._notify_closed(closed)
+
+    def stats(self) -> Dict[str, Any]:
+        """HarvesterManager.stats with the process, harvesters and tokens of every shard"""
+        stats = super().stats()
+        stats['shards'] = [shard.stats() for shard in self.shards]
+        return stats
+
+    def stop(self) -> None:
+        """Stop the manager, all harvesters and the shard processes"""
+        self._stopping = True
+        super().stop()
+        for shard in self.shards:
+            shard.stop(self.stop_timeout)
+
+    def _on_message(self, shard: _Shard, message: tuple) -> None:
+        kind = message[0]
+        if kind == MSG_TOKEN:
+            _, harvester_id, response, sitekey, url, captured_at, lifetime, timestamp = message
+            shard.tokens += 1
+            # The monotonic clock is system wide, so capture times carry over between processes
+            self.push_response(Token(
+                response, sitekey=sitekey, url=url, harvester_id=harvester_id, lifetime=lifetime,
+                captured_at=captured_at, timestamp=datetime.datetime.fromtimestamp(timestamp)
+            ))
+        elif kind == MSG_STATE:
+            for harvester_id, closed, ticking, tick_started, ticks in message[1]:
+                harvester = shard.harvesters.get(harvester_id)
+                if harvester is None or harvester.launching:
+                    continue
+                harvester.ticking = ticking
+                harvester.tick_started = tick_started
+                harvester.ticks = ticks
+                if closed and harvester.ready:
+                    harvester.ready = False
+                    harvester.closed = True
+        elif kind == MSG_STARTED:
+            _, harvester_id, error = message
+            harvester = shard.harvesters.get(harvester_id)
+            if harvester is not None:
+                harvester._on_started(error)
+
+    def _on_exit(self, shard: _Shard, exitcode: Optional[int]) -> None:
+        if self._stopping:
+            return
+        with shard._lock:
+            harvesters = list(shard.harvesters.values())
+        logging.error(
+            f"Harvester shard {shard.index} exited with code {exitcode}, "
+            f"closing its {len(harvesters)} harvesters"
+        )
+        for harvester in harvesters:
+            if harvester.launching:
+                harvester._on_started(f"shard {shard.index} exited")
+            elif harvester.ready:
+                harvester.ready = False
+                harvester.closed = True
+
+
+class _ShardWorker:
+    """Runs in a shard process: a HarvesterManager fed by commands from the broker"""
+
+    def __init__(self, connection: 'Connection', delay: float, workers: Optional[int]):
+        self.connection = connection
+        self.manager = HarvesterManager(delay=delay, workers=workers, response_callback=self.forward)
+        self.harvesters: Dict[int, 'Harvester'] = {}
+        # Harvesters the broker manages, ticked whenever they are up
+        self.attached: Set[int] = set()
+        self.stopped = Event()
+        self._send_lock = Lock()
+
+    def run(self) -> None:
+        Thread(target=self.loop, daemon=True, name='harvester-shard-loop').start()
+        while not self.stopped.is_set():
+            try:
+                message = self.connection.recv()
+            except (EOFError, OSError):
+                # Broker gone
+                break
+            try:
+                self.handle(message)
+            except Exception as e:
+                logging.error(f"Harvester shard command {message[0]} failed: {e}")
+        self.stop()
+
+    def handle(self, message: tuple) -> None:
+        from .harvester import Harvester
+        kind = message[0]
+        if kind == CMD_CREATE:
+            _, harvester_id, url, sitekey, harvester_kwargs = message
+            if harvester_id not in self.harvesters:
+                # Ids come from the broker, so profile slots stay unique across shards
+                Harvester.harvester_count = harvester_id
+                self.harvesters[harvester_id] = Harvester(url=url, sitekey=sitekey, **harvester_kwargs)
+        elif kind == CMD_ATTACH:
+            self.attached.add(message[1])
+            self.attach(self.harvesters[message[1]])
+        elif kind == CMD_DETACH:
+            self.attached.discard(message[1])
+            self.manager.remove_harvester(self.harvesters[message[1]])
+        elif kind == CMD_START:
+            _, harvester_id, restart = message
+            Thread(target=self.start, args=(self.harvesters[harvester_id], restart), daemon=True).start()
+        elif kind == CMD_QUIT:
+            harvester = self.harvesters[message[1]]
+            self.manager.remove_harvester(harvester)
+            Thread(target=self.quit, args=(harvester,), daemon=True).start()
+        elif kind == CMD_STOP:
+            self.stopped.set()
+
+    def attach(self, harvester: 'Harvester') -> None:
+        if harvester.id in self.attached and harvester.ready and not harvester.closed \
+                and harvester not in self.manager.harvesters:
+            self.manager.add_harvester(harvester)
+
+    def start(self, harvester: 'Harvester', restart: bool) -> None:
+        error = None
+        try:
+            if restart:
+                harvester.restart()
+            else:
+                harvester.start()
+            if not harvester.ready:
+                error = 'page not loaded'
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        if error is None:
+            self.attach(harvester)
+        self.send((MSG_STARTED, harvester.id, error))
+
+    def quit(self, harvester: 'Harvester') -> None:
+        try:
+            harvester.quit()
+        except Exception as e:
+            logging.error(f"Failed to close harvester {harvester.id}: {e}")
+
+    def forward(self, token: Token) -> None:
+        self.send((
+            MSG_TOKEN, token.harvester_id, token.response, token.sitekey, token.url,
+            token.captured_at, token.expires_at - token.captured_at, token.timestamp.timestamp()
+        ))
+
+    def send(self, message: tuple) -> None:
+        with self._send_lock:
+            try:
+                self.connection.send(message)
+            except (OSError, ValueError):
+                pass
+
+    def loop(self) -> None:
+        reported = 0.0
+        while not self.stopped.wait(self.manager.delay):
+            try:
+                self.manager.tick()
+                now = time.monotonic()
+                if now - reported >= STATE_INTERVAL:
+                    reported = now
+                    self.send((MSG_STATE, [
+                        (harvester.id, harvester.closed, harvester.ticking, harvester.tick_started, harvester.ticks)
+                        for harvester in list(self.harvesters.values())
+                    ]))
+            except Exception as e:
+                logging.error(f"Harvester shard loop error: {e}")
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.manager.stop()
+        # Started but not managed by the broker, so the manager did not close them
+        for harvester in self.harvesters.values():
+            if harvester.ready:
+                self.quit(harvester)
+        self.connection.close()
+        TRACE.close()
+
+
+def _run_shard(connection: 'Connection', delay: float, workers: Optional[int], trace_path: Optional[str]) -> None:
+    # Entry point of a shard process
+    if trace_path:
+        TRACE.open(trace_path)
+    _ShardWorker(connection, delay, workers).run()
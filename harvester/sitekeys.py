@@ -0,0 +1,308 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Optional, Dict, List, Iterable, Tuple, Any
+from html.parser import HTMLParser
+import pathlib
+import codecs
+import requests
+from requests.adapters import HTTPAdapter
+import json
+import time
+import os
+import re
+import logging
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+DEFAULT_CACHE_FILE = pathlib.Path.home() / '.cache' / 'captcha-harvester' / 'sitekeys.json'
+
+TYPE_V2 = 'v2'
+TYPE_INVISIBLE = 'invisible'
+TYPE_V3 = 'v3'
+
+SITEKEY = r"([0-9A-Za-z\-_]{20,})"
+WIDGET_PATTERN = re.compile(r"<[^>]*class=['\"][^'\"]*\bg-recaptcha\b[^>]*>", re.IGNORECASE)
+DATA_SITEKEY_PATTERN = re.compile(r"data-sitekey=['\"]" + SITEKEY + r"['\"]", re.IGNORECASE)
+INVISIBLE_PATTERN = re.compile(r"data-size=['\"]invisible['\"]", re.IGNORECASE)
+RENDER_PATTERN = re.compile(r"recaptcha/(?:api|enterprise)\.js\?[^'\"]*render=" + SITEKEY)
+EXECUTE_PATTERN = re.compile(r"grecaptcha(?:\.enterprise)?\.execute\(\s*['\"]" + SITEKEY + r"['\"]")
+SCRIPT_SITEKEY_PATTERN = re.compile(r"sitekey['\"]?\s*:\s*['\"]" + SITEKEY + r"['\"]")
+
+# Characters of the previous chunk scanned again with the next one, so a match
+# split across a chunk boundary is still found
+SCAN_OVERLAP = 4096
+SCAN_CHUNK_SIZE = 16384
+
+
+def find_sitekey(html: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Find the reCAPTCHA sitekey in a page and guess its type
+
+    Args:
+        html: Page source
+
+    Returns:
+        tuple: (sitekey, type) where type is 'v2', 'invisible' or 'v3', (None, None) if not found
+    """
+    for widget in WIDGET_PATTERN.finditer(html):
+        match = DATA_SITEKEY_PATTERN.search(widget.group(0))
+        if match:
+            return match.group(1), TYPE_INVISIBLE if INVISIBLE_PATTERN.search(widget.group(0)) else TYPE_V2
+
+    for pattern in (RENDER_PATTERN, EXECUTE_PATTERN):
+        match = pattern.search(html)
+        if match and match.group(1) != 'explicit':
+            return match.group(1), TYPE_V3
+
+    for pattern in (DATA_SITEKEY_PATTERN, SCRIPT_SITEKEY_PATTERN):
+        match = pattern.search(html)
+        if match:
+            return match.group(1), TYPE_V2
+
+    return None, None
+
+
+class _SitekeyParser(HTMLParser):
+    """DOM level fallback catching markup the patterns miss, e.g. unquoted attributes"""
+
+    def __init__(self):
+        super().__init__()
+        self.sitekey: Optional[str] = None
+        self.type: Optional[str] = None
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if self.sitekey:
+            return
+        attributes = dict(attrs)
+        sitekey = attributes.get('data-sitekey')
+        if sitekey:
+            self.sitekey = sitekey
+            self.type = TYPE_INVISIBLE if attributes.get('data-size') == 'invisible' else TYPE_V2
+
+
+def scan_stream(chunks: Iterable[bytes], encoding: Optional[str] = None,
+                dom_fallback: bool = True) -> Tuple[Optional[str], Optional[str], int]:
+    """
+    Scan a page for its sitekey while it downloads, stopping at the first match
+
+    Args:
+        chunks: Body of the page in chunks
+        encoding: Charset of the page, utf-8 by default
+        dom_fallback: Parse the whole page as HTML when no pattern matched
+
+    Returns:
+        tuple: (sitekey, type, bytes read)
+    """
+    decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+    seen: List[str] = []
+    tail = ''
+    read = 0
+
+    for chunk in chunks:
+        read += len(chunk)
+        text = decoder.decode(chunk)
+        if dom_fallback:
+            seen.append(text)
+        window = tail + text
+        sitekey, captcha_type = find_sitekey(window)
+        if sitekey:
+            return sitekey, captcha_type, read
+        tail = window[-SCAN_OVERLAP:]
+
+    if dom_fallback:
+        parser = _SitekeyParser()
+        parser.feed(''.join(seen) + decoder.decode(b'', final=True))
+        return parser.sitekey, parser.type, read
+    return None, None, read
+
+
+def scan_response(response: requests.Response, chunk_size: int = SCAN_CHUNK_SIZE) -> Tuple[Optional[str], Optional[str], int]:
+    """
+    Scan a streamed response for its sitekey and close it as soon as one is found
+
+    Returns:
+        tuple: (sitekey, type, bytes read)
+    """
+    try:
+        return scan_stream(response.iter_content(chunk_size), response.encoding)
+    finally:
+        response.close()
+
+
+class SitekeyDiscovery:
+    """
+    Finds sitekeys for many urls at once and remembers them on disk.
+
+    Pages are fetched concurrently over one pooled session and streamed through
+    the pattern scanner, so a download stops as soon as the sitekey turns up.
+    Results, including
+    pages without a captcha, are cached per url with a ttl; once it passes the
+    page is revalidated with If-None-Match / If-Modified-Since so an unchanged
+    page costs a 304 instead of a full download.
+    """
+    _shared: Optional['SitekeyDiscovery'] = None
+    _shared_lock = Lock()
+
+    def __init__(self, cache_file: Optional[pathlib.Path] = None, ttl: float = 86400.0,
+                 negative_ttl: float = 600.0, workers: int = 16, timeout: float = 10.0,
+                 session: Optional[requests.Session] = None):
+        """
+        Initialize the discovery service
+
+        Args:
+            cache_file: Cache location, HARVESTER_SITEKEY_CACHE or ~/.cache by default
+            ttl: Seconds a found sitekey is trusted before the page is revalidated
+            negative_ttl: Seconds a page without a sitekey is trusted
+            workers: Pages fetched at once
+            timeout: Request timeout in seconds
+            session: Session to fetch with, a pooled one by default
+        """
+        self.cache_file = pathlib.Path(
+            cache_file or os.environ.get('HARVESTER_SITEKEY_CACHE') or DEFAULT_CACHE_FILE
+        )
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.workers = workers
+        self.timeout = timeout
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['User-Agent'] = USER_AGENT
+        self.session = session
+
+        self.fetches = 0
+        self.revalidations = 0
+        self.bytes_read = 0
+        self._lock = Lock()
+        self._cache: Dict[str, Dict[str, Any]] = self._load_cache()
+
+    @classmethod
+    def shared(cls) -> 'SitekeyDiscovery':
+        """Process wide instance using the default cache"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def get(self, url: str, refresh: bool = False) -> Optional[str]:
+        """
+        Sitekey of a single page
+
+        Returns:
+            str: Sitekey if found, None otherwise
+        """
+        entry = self.discover([url], refresh)[url]
+        return entry['sitekey'] if entry else None
+
+    def discover(self, urls: Iterable[str], refresh: bool = False) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Sitekeys of many pages
+
+        Args:
+            urls: Pages to look at
+            refresh: Revalidate every page even if its cache entry is fresh
+
+        Returns:
+            dict: Per url an entry with sitekey, type and fetched time, None if the page could not be fetched
+        """
+        urls = list(dict.fromkeys(urls))
+        results: Dict[str, Optional[Dict[str, Any]]] = {}
+        stale: List[str] = []
+
+        now = time.time()
+        with self._lock:
+            for url in urls:
+                entry = self._cache.get(url)
+                if entry and not refresh and now - entry['fetched'] < self._entry_ttl(entry):
+                    results[url] = dict(entry)
+                else:
+                    stale.append(url)
+
+        if stale:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(stale))) as executor:
+                for url, entry in zip(stale, executor.map(self._fetch, stale)):
+                    results[url] = entry
+            self._store()
+
+        return {url: results[url] for url in urls}
+
+    def clear(self) -> None:
+        """Forget all cached results"""
+        with self._lock:
+            self._cache.clear()
+        self._store()
+
+    def _entry_ttl(self, entry: Dict[str, Any]) -> float:
+        return self.ttl if entry.get('sitekey') else self.negative_ttl
+
+    def _fetch(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cached = self._cache.get(url)
+
+        headers = {}
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout, stream=True)
+        except requests.RequestException as e:
+            logging.error(f"Request failed for URL {url}: {str(e)}")
+            return dict(cached) if cached else None
+
+        if response.status_code == 304 and cached:
+            response.close()
+            entry = dict(cached, fetched=time.time())
+            with self._lock:
+                self.revalidations += 1
+                self._cache[url] = entry
+            return dict(entry)
+
+        if not response.ok:
+            response.close()
+            logging.error(f"Failed to fetch URL: {url}, status code: {response.status_code}")
+            return dict(cached) if cached else None
+
+        try:
+            sitekey, captcha_type, read = scan_response(response)
+        except requests.RequestException as e:
+            logging.error(f"Request failed for URL {url}: {str(e)}")
+            return dict(cached) if cached else None
+        if not sitekey:
+            logging.warning(f"No sitekey found at URL: {url}")
+
+        entry = {
+            'sitekey': sitekey,
+            'type': captcha_type,
+            'fetched': time.time(),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        with self._lock:
+            self.fetches += 1
+            self.bytes_read += read
+            self._cache[url] = entry
+        return dict(entry)
+
+    def _load_cache(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.cache_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _store(self) -> None:
+        with self._lock:
+            data = json.dumps(self._cache, indent=2)
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_file.with_name(f'{self.cache_file.name}.{os.getpid()}.tmp')
+            with open(tmp, 'w') as f:
+                f.write(data)
+            os.replace(tmp, self.cache_file)
+        except OSError as e:
+            logging.warning(f"Failed to write sitekey cache {self.cache_file}: {e}")
@@ -0,0 +1,293 @@
+from .harvester_manager import HarvesterManager
+from .token_pool import Domain
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Lock, Event
+from collections import deque
+from typing import Optional, Dict, List, Any, Deque, TYPE_CHECKING
+import time
+import logging
+
+if TYPE_CHECKING:
+    from .harvester import Harvester
+
+
+class _Slot:
+    """Restart state of one harvester"""
+    __slots__ = ('harvester', 'failures', 'down_since', 'restart_at', 'restarting', 'started_at')
+
+    def __init__(self, harvester: 'Harvester'):
+        self.harvester = harvester
+        self.failures = 0
+        self.down_since: Optional[float] = None
+        self.restart_at: Optional[float] = None
+        self.restarting = False
+        self.started_at = time.monotonic()
+
+    @property
+    def domain(self) -> Domain:
+        return self.harvester.url, self.harvester.sitekey
+
+
+class HarvesterSupervisor:
+    """
+    Keeps a HarvesterManager's fleet alive.
+
+    Harvesters the manager drops as closed, and harvesters whose tick hangs, are
+    relaunched into the same profile and slot. Each slot backs off exponentially
+    between attempts and the backoff resets once a harvester stays up. When a
+    domain crashes too often within a window its breaker opens and it is left
+    alone for a cooldown instead of relaunching Chrome in a loop. Domains with a
+    target get fresh harvesters whenever fewer than the target are alive.
+    """
+
+    def __init__(self, manager: HarvesterManager, base_backoff: float = 1.0, max_backoff: float = 60.0,
+                 crash_limit: int = 5, crash_window: float = 300.0, breaker_cooldown: float = 300.0,
+                 hang_timeout: float = 60.0, healthy_after: float = 60.0, interval: float = 1.0,
+                 concurrency: int = 2, **harvester_kwargs: Any):
+        """
+        Initialize the supervisor
+
+        Args:
+            manager: Manager whose harvesters are supervised
+            base_backoff: Seconds before the first restart of a slot
+            max_backoff: Longest wait between restarts
+            crash_limit: Crashes of one domain within crash_window that open its breaker
+            crash_window: Seconds over which crashes are counted
+            breaker_cooldown: Seconds a domain is left alone once its breaker opened
+            hang_timeout: Seconds a tick may run before the browser is considered hung
+            healthy_after: Seconds a harvester has to stay up for its backoff to reset
+            interval: Seconds between supervision passes
+            concurrency: Maximum number of browsers relaunching at once
+            harvester_kwargs: Arguments for harvesters started to reach a target
+        """
+        self.manager = manager
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.crash_limit = crash_limit
+        self.crash_window = crash_window
+        self.breaker_cooldown = breaker_cooldown
+        self.hang_timeout = hang_timeout
+        self.healthy_after = healthy_after
+        self.interval = interval
+        self.harvester_kwargs = harvester_kwargs
+
+        self.targets: Dict[Domain, int] = {}
+        self.restarts = 0
+        self.failed_restarts = 0
+        self.hangs = 0
+        self.lost_seconds: Dict[Domain, float] = {}
+
+        self._slots: Dict[int, _Slot] = {}
+        self._crashes: Dict[Domain, Deque[float]] = {}
+        self._breakers: Dict[Domain, float] = {}
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread: Optional[Thread] = None
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='harvester-restart')
+
+        manager.closed_callback = self.on_closed
+
+    def set_target(self, url: str, sitekey: str, count: Optional[int]) -> None:
+        """
+        Keep a number of live harvesters for a domain
+
+        Args:
+            url: Url of the domain
+            sitekey: Sitekey of the domain
+            count: Harvesters to keep alive, None stops starting new ones
+        """
+        with self._lock:
+            if count is None:
+                self.targets.pop((url, sitekey), None)
+            else:
+                self.targets[(url, sitekey)] = count
+
+    def start(self) -> None:
+        """Run supervision passes in a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, daemon=True, name='harvester-supervisor')
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop supervising, harvesters already relaunching finish in the background"""
+        self._stopped.set()
+        self._executor.shutdown(wait=False)
+        if self.manager.closed_callback == self.on_closed:
+            self.manager.closed_callback = None
+
+    def on_closed(self, harvester: 'Harvester') -> None:
+        """Schedule a restart for a harvester the manager dropped"""
+        now = time.monotonic()
+        with self._lock:
+            slot = self._slots.get(harvester.id)
+            if slot is None:
+                slot = self._slots[harvester.id] = _Slot(harvester)
+            if slot.restarting:
+                return
+
+            if slot.down_since is None:
+                slot.down_since = now
+            if now - slot.started_at >= self.healthy_after:
+                slot.failures = 0
+            slot.failures += 1
+            slot.restart_at = now + min(self.base_backoff * 2 ** (slot.failures - 1), self.max_backoff)
+
+            domain = slot.domain
+            crashes = self._crashes.setdefault(domain, deque())
+            crashes.append(now)
+            while crashes and crashes[0] < now - self.crash_window:
+                crashes.popleft()
+            if len(crashes) >= self.crash_limit and domain not in self._breakers:
+                self._breakers[domain] = now + self.breaker_cooldown
+                logging.error(
+                    f"{len(crashes)} harvester crashes for {domain[0]} within {self.crash_window:.0f}s, "
+                    f"pausing restarts for {self.breaker_cooldown:.0f}s"
+                )
+
+    def check(self) -> None:
+        """Single supervision pass: detect hung browsers, relaunch due slots, fill targets"""
+        now = time.monotonic()
+
+        for harvester in list(self.manager.harvesters):
+            if harvester.ticking and not harvester.closed and now - harvester.tick_started > self.hang_timeout:
+                logging.error(f"Harvester {harvester.id} tick hung for {now - harvester.tick_started:.0f}s")
+                self.hangs += 1
+                # The manager drops it on its next tick and hands it back through on_closed
+                harvester.closed = True
+
+        with self._lock:
+            for domain, until in list(self._breakers.items()):
+                if until <= now:
+                    del self._breakers[domain]
+                    self._crashes.pop(domain, None)
+
+            live = self._live_counts()
+            due = []
+            for harvester_id, slot in list(self._slots.items()):
+                if slot.restarting or slot.restart_at is None or slot.restart_at > now:
+                    continue
+                domain = slot.domain
+                if domain in self._breakers:
+                    continue
+                target = self.targets.get(domain)
+                if target is not None and live.get(domain, 0) > target:
+                    # Target lowered while it was down, retire the slot
+                    del self._slots[harvester_id]
+                    self._account_downtime(slot, now)
+                    live[domain] -= 1
+                    continue
+                slot.restarting = True
+                due.append(slot)
+
+            spawn = []
+            for domain, target in self.targets.items():
+                if domain in self._breakers:
+                    continue
+                for _ in range(target - live.get(domain, 0)):
+                    harvester = self.manager.create_harvester(domain[0], domain[1], **self.harvester_kwargs)
+                    slot = self._slots[harvester.id] = _Slot(harvester)
+                    slot.restarting = True
+                    spawn.append(slot)
+
+        for slot in due:
+            self._executor.submit(self._relaunch, slot, True)
+        for slot in spawn:
+            self._executor.submit(self._relaunch, slot, False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Restart counters, capacity lost to downtime and live versus target harvesters per domain"""
+        now = time.monotonic()
+        with self._lock:
+            lost = dict(self.lost_seconds)
+            down = {}
+            for slot in self._slots.values():
+                if slot.down_since is not None:
+                    lost[slot.domain] = lost.get(slot.domain, 0.0) + now - slot.down_since
+                    down[slot.domain] = down.get(slot.domain, 0) + 1
+
+            live = self._live_counts()
+            domains = set(live) | set(self.targets) | set(lost)
+            return {
+                'restarts': self.restarts,
+                'failed_restarts': self.failed_restarts,
+                'hangs': self.hangs,
+                'capacity_lost_seconds': round(sum(lost.values()), 3),
+                'domains': {
+                    domain: {
+                        'live': live.get(domain, 0) - down.get(domain, 0),
+                        'down': down.get(domain, 0),
+                        'target': self.targets.get(domain),
+                        'capacity_lost_seconds': round(lost.get(domain, 0.0), 3),
+                        'breaker_open': domain in self._breakers,
+                    }
+                    for domain in domains
+                },
+            }
+
+    def _live_counts(self) -> Dict[Domain, int]:
+        # Must be called with the lock held. Every managed harvester has a slot and slots
+        # that are down count as live, so a target is refilled by restarting them rather
+        # than by new harvesters. Slots of harvesters removed from the manager on purpose
+        # are dropped.
+        managed = {harvester.id: harvester for harvester in list(self.manager.harvesters)}
+        for harvester_id, harvester in managed.items():
+            if harvester_id not in self._slots:
+                self._slots[harvester_id] = _Slot(harvester)
+
+        counts: Dict[Domain, int] = {}
+        for harvester_id, slot in list(self._slots.items()):
+            down = slot.restarting or slot.restart_at is not None or slot.harvester.closed
+            if not down and harvester_id not in managed:
+                del self._slots[harvester_id]
+                continue
+            counts[slot.domain] = counts.get(slot.domain, 0) + 1
+        return counts
+
+    def _account_downtime(self, slot: _Slot, now: float) -> None:
+        if slot.down_since is not None:
+            self.lost_seconds[slot.domain] = self.lost_seconds.get(slot.domain, 0.0) + now - slot.down_since
+            slot.down_since = None
+
+    def _relaunch(self, slot: _Slot, restart: bool) -> None:
+        harvester = slot.harvester
+        try:
+            if restart:
+                harvester.restart()
+            else:
+                harvester.start()
+            ok = harvester.ready
+        except Exception as e:
+            logging.error(f"Failed to relaunch harvester {harvester.id}: {e}")
+            ok = False
+
+        # Added before the slot stops counting as restarting, so check() never sees it missing
+        added = ok and self.manager.add_harvester(harvester)
+
+        now = time.monotonic()
+        with self._lock:
+            slot.restarting = False
+            if ok:
+                self._account_downtime(slot, now)
+                slot.restart_at = None
+                slot.started_at = now
+                if restart:
+                    self.restarts += 1
+                if not added:
+                    # Over the manager's quota
+                    self._slots.pop(harvester.id, None)
+            else:
+                self.failed_restarts += 1
+
+        if not ok:
+            self.on_closed(harvester)
+        elif not added:
+            harvester.quit()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logging.error(f"Supervisor pass failed: {e}")
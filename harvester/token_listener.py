@@ -0,0 +1,126 @@
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+from typing import Optional, Dict, Any
+import secrets
+import logging
+
+
+class _TokenRequestHandler(BaseHTTPRequestHandler):
+    """Accepts tokens POSTed by the harvester extension"""
+
+    def do_POST(self) -> None:
+        parts = self.path.strip('/').split('/')
+        harvester = None
+        if len(parts) == 2 and parts[0] == 'token':
+            harvester = self.server.listener.get_harvester(parts[1])
+
+        length = int(self.headers.get('Content-Length') or 0)
+        token = self.rfile.read(length).decode('utf-8', 'replace').strip() if length else ''
+
+        if harvester is None or not token:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        self.send_response(204)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+
+        try:
+            harvester.push_response(token)
+        except Exception as e:
+            logging.error(f"Failed to deliver pushed token: {e}")
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class TokenListener:
+    """
+    Loopback HTTP endpoint receiving tokens the moment a harvester page issues them.
+
+    A single listener thread serves every registered harvester, so idle harvesters
+    cost nothing beyond a blocked socket. Each harvester gets an unguessable path
+    which the page hands to the bundled extension together with the token.
+    """
+    _shared: Optional['TokenListener'] = None
+    _shared_lock = Lock()
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        """
+        Initialize the listener
+
+        Args:
+            host: Interface to bind, loopback by default
+            port: Port to bind, 0 picks a free one
+        """
+        self.host = host
+        self.port = port
+
+        self._harvesters: Dict[str, Any] = {}
+        self._keys: Dict[int, str] = {}
+        self._lock = Lock()
+        self._server: Optional[HTTPServer] = None
+        self._thread: Optional[Thread] = None
+
+    @classmethod
+    def shared(cls) -> 'TokenListener':
+        """Get the process wide listener, starting it on first use"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+                cls._shared.start()
+            return cls._shared
+
+    def start(self) -> None:
+        """Bind the socket and start serving in a background thread"""
+        if self._server:
+            return
+
+        self._server = HTTPServer((self.host, self.port), _TokenRequestHandler)
+        self._server.listener = self
+        self.port = self._server.server_address[1]
+
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop serving and release the socket"""
+        if not self._server:
+            return
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        self._thread = None
+
+    def register(self, harvester) -> str:
+        """
+        Register a harvester to receive pushed tokens
+
+        Args:
+            harvester: Harvester exposing push_response(token)
+
+        Returns:
+            str: Endpoint the page should relay tokens to
+        """
+        with self._lock:
+            key = self._keys.get(id(harvester))
+            if key is None:
+                key = secrets.token_urlsafe(16)
+                self._keys[id(harvester)] = key
+                self._harvesters[key] = harvester
+
+        return f'http://{self.host}:{self.port}/token/{key}'
+
+    def unregister(self, harvester) -> None:
+        """Stop delivering tokens to a harvester"""
+        with self._lock:
+            key = self._keys.pop(id(harvester), None)
+            if key:
+                self._harvesters.pop(key, None)
+
+    def get_harvester(self, key: str):
+        """Look up the harvester registered under a key"""
+        with self._lock:
+            return self._harvesters.get(key)
@@ -0,0 +1,432 @@
+from bisect import bisect_left, bisect_right
+from typing import Optional, Dict, List, Iterator, Any, Tuple
+import datetime
+import time
+
+TOKEN_LIFETIME = 120.0
+
+# (url, sitekey) pair a token is valid for
+Domain = Tuple[Optional[str], Optional[str]]
+
+POLICY_OLDEST = 'oldest'
+POLICY_FRESHEST = 'freshest'
+POLICIES = (POLICY_OLDEST, POLICY_FRESHEST)
+
+
+class Token:
+    """
+    Solved captcha response.
+
+    Expiry is tracked on the monotonic clock so wall clock changes cannot resurrect
+    or kill tokens. Item access is kept so code written against the old response
+    dicts (token['response'], token['timestamp']) keeps working.
+    """
+    __slots__ = ('response', 'sitekey', 'url', 'harvester_id', 'timestamp', 'captured_at', 'expires_at')
+
+    def __init__(self, response: str, sitekey: Optional[str] = None, url: Optional[str] = None,
+                 harvester_id: Optional[int] = None, lifetime: float = TOKEN_LIFETIME,
+                 captured_at: Optional[float] = None, timestamp: Optional[datetime.datetime] = None):
+        """
+        Initialize the token
+
+        Args:
+            response: reCAPTCHA response string
+            sitekey: Sitekey the token was solved for
+            url: Page the token was solved on
+            harvester_id: Id of the harvester that captured the token
+            lifetime: Seconds the token stays valid after capture
+            captured_at: Monotonic capture time, now by default
+            timestamp: Wall clock capture time, for display only
+        """
+        self.response = response
+        self.sitekey = sitekey
+        self.url = url
+        self.harvester_id = harvester_id
+        self.captured_at = time.monotonic() if captured_at is None else captured_at
+        self.expires_at = self.captured_at + lifetime
+        self.timestamp = timestamp or datetime.datetime.now()
+
+    @property
+    def domain(self) -> Domain:
+        return self.url, self.sitekey
+
+    def ttl(self, now: Optional[float] = None) -> float:
+        """Seconds of validity left"""
+        return self.expires_at - (time.monotonic() if now is None else now)
+
+    @property
+    def expired(self) -> bool:
+        return self.ttl() <= 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        """JSON friendly representation"""
+        return {
+            'response': self.response,
+            'sitekey': self.sitekey,
+            'url': self.url,
+            'harvester_id': self.harvester_id,
+            'timestamp': self.timestamp.isoformat(),
+            'ttl': round(self.ttl(), 3),
+        }
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+    def __repr__(self) -> str:
+        return f'Token(sitekey={self.sitekey!r}, ttl={self.ttl():.1f}, response={self.response[:16]!r}...)'
+
+
+class _Bucket:
+    """
+    Tokens of one domain kept sorted by expiry.
+
+    Taken and expired tokens leave a None tombstone in their slot so nothing
+    shifts, and a Fenwick tree over the slots counts the live ones. Counting and
+    finding the next live token are O(log n) that way, and the tombstones are
+    dropped in one pass once they outnumber the live tokens.
+    """
+    __slots__ = ('domain', 'expiries', 'tokens', 'head', 'size', '_tree')
+
+    def __init__(self, domain: Domain = (None, None)):
+        self.domain = domain
+        self.expiries: List[float] = []
+        self.tokens: List[Optional[Token]] = []
+        # Every slot before head is dead
+        self.head = 0
+        self.size = 0
+        # 1-based Fenwick tree of live slots, _tree[0] is unused
+        self._tree: List[int] = [0]
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, token: Token) -> None:
+        expires_at = token.expires_at
+        if not self.expiries or expires_at >= self.expiries[-1]:
+            # Tokens are captured in order, so this is the common case
+            self.expiries.append(expires_at)
+            self.tokens.append(token)
+            self._tree_append(1)
+            self.size += 1
+            return
+
+        index = bisect_right(self.expiries, expires_at, self.head)
+        # A returned token lands next to the slot it was taken from, reuse a free neighbour
+        for slot in (index - 1, index):
+            if 0 <= slot < len(self.tokens) and self.tokens[slot] is None:
+                self.expiries[slot] = expires_at
+                self.tokens[slot] = token
+                self._tree_update(slot, 1)
+                self.size += 1
+                self.head = min(self.head, slot)
+                return
+
+        # Only a token older than live neighbours on both sides shifts the slots
+        self.expiries.insert(index, expires_at)
+        self.tokens.insert(index, token)
+        self.size += 1
+        self._rebuild()
+
+    def evict(self, now: float) -> List[Token]:
+        index = bisect_right(self.expiries, now, self.head)
+        expired = []
+        for slot in range(self.head, index):
+            token = self.tokens[slot]
+            if token is not None:
+                expired.append(token)
+                self.tokens[slot] = None
+                self._tree_update(slot, -1)
+        self.size -= len(expired)
+        self.head = index
+        self._advance()
+        return expired
+
+    def candidate(self, threshold: float, policy: str) -> int:
+        """Index of the token to pull, -1 if none has enough ttl left"""
+        if not self.size:
+            return -1
+        if policy == POLICY_FRESHEST:
+            index = len(self.tokens) - 1
+            if self.tokens[index] is None:
+                index = self._find(self.size)
+            return index if self.expiries[index] >= threshold else -1
+
+        index = bisect_left(self.expiries, threshold, self.head)
+        if index < len(self.tokens) and self.tokens[index] is not None:
+            return index
+        # Landed on a tombstone, the tree finds the next live slot
+        before = self._prefix(index)
+        return self._find(before + 1) if before < self.size else -1
+
+    def take(self, index: int) -> Token:
+        token = self.tokens[index]
+        self.tokens[index] = None
+        self._tree_update(index, -1)
+        self.size -= 1
+        if index == self.head:
+            self._advance()
+        else:
+            self._compact()
+        return token
+
+    def index(self, token: Token) -> int:
+        """Position of a token, -1 if it is not in the bucket"""
+        index = bisect_left(self.expiries, token.expires_at, self.head)
+        while index < len(self.tokens) and self.expiries[index] == token.expires_at:
+            if self.tokens[index] is token:
+                return index
+            index += 1
+        return -1
+
+    def count(self, threshold: float) -> int:
+        return self.size - self._prefix(bisect_left(self.expiries, threshold, self.head))
+
+    def live(self) -> List[Token]:
+        return [token for token in self.tokens[self.head:] if token is not None]
+
+    def _advance(self) -> None:
+        while self.head < len(self.tokens) and self.tokens[self.head] is None:
+            self.head += 1
+        self._compact()
+
+    def _compact(self) -> None:
+        dead = len(self.tokens) - self.size
+        if not self.size:
+            self.expiries.clear()
+            self.tokens.clear()
+            self.head = 0
+            self._tree = [0]
+        elif dead > 64 and dead > self.size:
+            # Each pass is paid for by the removals that left the tombstones behind
+            live = [slot for slot in range(self.head, len(self.tokens)) if self.tokens[slot] is not None]
+            self.expiries = [self.expiries[slot] for slot in live]
+            self.tokens = [self.tokens[slot] for slot in live]
+            self.head = 0
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        tree = [0] + [0 if token is None else 1 for token in self.tokens]
+        for position in range(1, len(tree)):
+            parent = position + (position & -position)
+            if parent < len(tree):
+                tree[parent] += tree[position]
+        self._tree = tree
+
+    def _tree_append(self, value: int) -> None:
+        # The new node covers the slots after position - lowbit(position) up to itself,
+        # which its children already sum up
+        tree = self._tree
+        position = len(tree)
+        low = position - (position & -position)
+        child = position - 1
+        while child > low:
+            value += tree[child]
+            child &= child - 1
+        tree.append(value)
+
+    def _tree_update(self, slot: int, delta: int) -> None:
+        tree = self._tree
+        size = len(tree)
+        position = slot + 1
+        while position < size:
+            tree[position] += delta
+            position += position & -position
+
+    def _prefix(self, slots: int) -> int:
+        # Live tokens in the first slots slots
+        total = 0
+        while slots:
+            total += self._tree[slots]
+            slots &= slots - 1
+        return total
+
+    def _find(self, rank: int) -> int:
+        # Slot of the rank-th live token, counting from 1
+        position, step = 0, 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            if position + step < len(self._tree) and self._tree[position + step] < rank:
+                position += step
+                rank -= self._tree[position]
+            step >>= 1
+        return position
+
+
+class TokenPool:
+    """
+    Solved tokens indexed by domain and expiry.
+
+    A domain is the (url, sitekey) pair a token was solved for. Each domain keeps
+    its tokens sorted by monotonic expiry, so pulling, counting and evicting are
+    O(log n) per token, amortised over the occasional compaction. Pulling by
+    domain is a single dict lookup, pulling by sitekey alone goes through a
+    sitekey index, and domains are forgotten once their last token is gone. The pool is not thread safe on its own, the owning
+    HarvesterManager guards it with its lock.
+    """
+
+    def __init__(self, policy: str = POLICY_OLDEST):
+        """
+        Initialize the pool
+
+        Args:
+            policy: Default pull policy, 'oldest' to use tokens before they expire
+                or 'freshest' to hand out tokens with the most ttl left
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown pull policy: {policy}")
+
+        self.policy = policy
+        self._buckets: Dict[Domain, _Bucket] = {}
+        self._by_sitekey: Dict[Optional[str], List[Domain]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self._buckets.values())
+
+    def __bool__(self) -> bool:
+        return any(len(bucket) for bucket in self._buckets.values())
+
+    def __iter__(self) -> Iterator[Token]:
+        """Iterate over all tokens, ordered by expiry within each domain"""
+        for bucket in list(self._buckets.values()):
+            yield from bucket.live()
+
+    def add(self, token: Token) -> None:
+        """Add a token to the pool"""
+        domain = token.domain
+        bucket = self._buckets.get(domain)
+        if bucket is None:
+            bucket = self._buckets[domain] = _Bucket(domain)
+            self._by_sitekey.setdefault(token.sitekey, []).append(domain)
+        bucket.add(token)
+
+    def extend(self, tokens: List[Token]) -> None:
+        """Add several tokens to the pool"""
+        for token in tokens:
+            self.add(token)
+
+    def pull(self, sitekey: Optional[str] = None, min_ttl: float = 0.0,
+             policy: Optional[str] = None, url: Optional[str] = None) -> Optional[Token]:
+        """
+        Remove and return a token
+
+        Args:
+            sitekey: Only pull a token for this sitekey, any sitekey when None
+            min_ttl: Seconds of validity the token must have left
+            policy: Pull policy overriding the pool default
+            url: Only pull a token solved on this url, any url when None
+
+        Returns:
+            Token: Pulled token or None if no token qualifies
+        """
+        policy = policy or self.policy
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown pull policy: {policy}")
+
+        threshold = time.monotonic() + max(min_ttl, 0.0)
+
+        best_bucket, best_index, best_expiry = None, -1, None
+        for bucket in self._select(sitekey, url):
+            index = bucket.candidate(threshold, policy)
+            if index < 0:
+                continue
+            expiry = bucket.expiries[index]
+            if (best_expiry is None
+                    or (policy == POLICY_OLDEST and expiry < best_expiry)
+                    or (policy == POLICY_FRESHEST and expiry > best_expiry)):
+                best_bucket, best_index, best_expiry = bucket, index, expiry
+
+        if not best_bucket:
+            return None
+        token = best_bucket.take(best_index)
+        self._drop_if_empty(best_bucket)
+        return token
+
+    def remove(self, token: Token) -> bool:
+        """
+        Remove a specific token
+
+        Returns:
+            bool: False if the token is not in the pool
+        """
+        bucket = self._buckets.get(token.domain)
+        if not bucket:
+            return False
+        index = bucket.index(token)
+        if index < 0:
+            return False
+        bucket.take(index)
+        self._drop_if_empty(bucket)
+        return True
+
+    def evict_expired(self, now: Optional[float] = None) -> List[Token]:
+        """
+        Drop expired tokens
+
+        Args:
+            now: Monotonic time to evict against, now by default
+
+        Returns:
+            list: Evicted tokens
+        """
+        now = time.monotonic() if now is None else now
+        expired = []
+        for bucket in list(self._buckets.values()):
+            if bucket.head < len(bucket.tokens) and bucket.expiries[bucket.head] <= now:
+                expired.extend(bucket.evict(now))
+                self._drop_if_empty(bucket)
+        return expired
+
+    def count(self, sitekey: Optional[str] = None, min_ttl: float = 0.0, url: Optional[str] = None) -> int:
+        """Number of tokens with at least min_ttl seconds left"""
+        threshold = time.monotonic() + max(min_ttl, 0.0)
+        return sum(bucket.count(threshold) for bucket in self._select(sitekey, url))
+
+    def ttls(self, sitekey: Optional[str] = None, url: Optional[str] = None) -> List[float]:
+        """Seconds left on every live token matching a sitekey and url"""
+        now = time.monotonic()
+        return [
+            token.expires_at - now for bucket in self._select(sitekey, url)
+            for token in bucket.live() if token.expires_at > now
+        ]
+
+    def sitekeys(self) -> List[Optional[str]]:
+        """Sitekeys that currently have tokens"""
+        return [
+            sitekey for sitekey, domains in self._by_sitekey.items()
+            if any(len(self._buckets[domain]) for domain in domains)
+        ]
+
+    def domains(self) -> List[Domain]:
+        """Domains that currently have tokens"""
+        return [domain for domain, bucket in self._buckets.items() if len(bucket)]
+
+    def clear(self) -> None:
+        """Remove all tokens"""
+        self._buckets.clear()
+        self._by_sitekey.clear()
+
+    def _drop_if_empty(self, bucket: _Bucket) -> None:
+        # Pools that see many domains would otherwise keep a bucket for each forever
+        if bucket.size:
+            return
+        domain = bucket.domain
+        del self._buckets[domain]
+        domains = self._by_sitekey[domain[1]]
+        domains.remove(domain)
+        if not domains:
+            del self._by_sitekey[domain[1]]
+
+    def _select(self, sitekey: Optional[str], url: Optional[str]) -> List[_Bucket]:
+        if sitekey is not None and url is not None:
+            bucket = self._buckets.get((url, sitekey))
+            return [bucket] if bucket else []
+        if sitekey is not None:
+            return [self._buckets[domain] for domain in self._by_sitekey.get(sitekey, ())]
+        if url is not None:
+            return [bucket for domain, bucket in self._buckets.items() if domain[0] == url]
+        return list(self._buckets.values())
@@ -0,0 +1,521 @@
+from threading import Thread, Lock, Event
+from typing import Optional, Dict, List, Any, Iterator, Iterable, Tuple, TYPE_CHECKING
+from array import array
+import argparse
+import datetime
+import heapq
+import itertools
+import json
+import pathlib
+import time
+import os
+import sys
+import logging
+
+if TYPE_CHECKING:
+    from .token_pool import Token
+
+EVENT_OPEN = 'open'
+EVENT_RENDERED = 'rendered'
+EVENT_CHALLENGE = 'challenge'
+EVENT_SOLVED = 'solved'
+EVENT_CAPTURED = 'captured'
+EVENT_POOLED = 'pooled'
+EVENT_HANDED = 'handed'
+EVENT_RETURNED = 'returned'
+EVENT_INJECTED = 'injected'
+EVENT_EXPIRED = 'expired'
+
+# Characters of a response identifying its token in the trace, the page uses the same slice
+TOKEN_KEY_LENGTH = 16
+
+
+def token_key(response: str) -> str:
+    """Short id of a response, enough to tell tokens apart without logging them"""
+    return response[-TOKEN_KEY_LENGTH:]
+
+
+def monotonic_from_wall(wall: float) -> float:
+    """Monotonic time of a wall clock time, for events timestamped in a page"""
+    return time.monotonic() - (time.time() - wall)
+
+
+class TraceLog:
+    """
+    Append-only JSON lines log of every token's life, from render to checkout.
+
+    emit only appends a tuple to a list; a background thread formats the
+    buffered events and writes them every flush_interval seconds, or as soon as
+    buffer_size are waiting. Once the file grows past max_bytes it is rotated to
+    path.1 .. path.<backups>. Timestamps are time.monotonic(), which processes on
+    one machine share, and each file starts with an 'open' line giving the wall
+    clock time to match them to. Disabled until opened, emit is then a single
+    attribute check.
+    """
+
+    def __init__(self, max_bytes: int = 64 << 20, backups: int = 5, flush_interval: float = 1.0,
+                 buffer_size: int = 4096):
+        """
+        Initialize the log, it is written once opened
+
+        Args:
+            max_bytes: Size at which the file is rotated
+            backups: Rotated files kept
+            flush_interval: Seconds between writes of buffered events
+            buffer_size: Buffered events that trigger a write right away
+        """
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+
+        self.enabled = False
+        self.path: Optional[pathlib.Path] = None
+        self.events = 0
+        self.written = 0
+        self.rotations = 0
+
+        self._buffer: List[Tuple] = []
+        self._lock = Lock()
+        # Held while writing so flush and rotation never interleave, emit never takes it
+        self._write_lock = Lock()
+        self._file = None
+        self._size = 0
+        self._wakeup = Event()
+        self._closed = Event()
+        self._thread: Optional[Thread] = None
+
+    def open(self, path: pathlib.Path) -> None:
+        """Start recording to a file, appending to it if it exists"""
+        self.close()
+        with self._write_lock:
+            self.path = pathlib.Path(path)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._open_file()
+        self._closed.clear()
+        self._thread = Thread(target=self._run, daemon=True, name='harvester-trace')
+        self._thread.start()
+        self.enabled = True
+
+    def emit(self, event: str, harvester_id: Optional[int] = None, sitekey: Optional[str] = None,
+             token: Optional[str] = None, at: Optional[float] = None, **fields: Any) -> None:
+        """
+        Record an event
+
+        Args:
+            event: Event name, one of the EVENT_ constants
+            harvester_id: Harvester the event happened in
+            sitekey: Sitekey involved
+            token: Key of the token involved, see token_key
+            at: Monotonic time of the event, now when omitted
+            fields: Extra values written with the event
+        """
+        if not self.enabled:
+            return
+        record = (time.monotonic() if at is None else at, event, harvester_id, sitekey, token, fields)
+        with self._lock:
+            self._buffer.append(record)
+            self.events += 1
+            full = len(self._buffer) >= self.buffer_size
+        if full:
+            self._wakeup.set()
+
+    def emit_token(self, event: str, token: 'Token', **fields: Any) -> None:
+        """Record an event of a token"""
+        if self.enabled:
+            self.emit(event, token.harvester_id, token.sitekey, token_key(token.response), **fields)
+
+    def flush(self) -> None:
+        """Write buffered events now"""
+        with self._lock:
+            records, self._buffer = self._buffer, []
+        if not records:
+            return
+        with self._write_lock:
+            if self._file is None:
+                return
+            lines = []
+            for at, event, harvester_id, sitekey, token, fields in records:
+                record = {'t': round(at, 6), 'e': event}
+                if harvester_id is not None:
+                    record['h'] = harvester_id
+                if sitekey is not None:
+                    record['s'] = sitekey
+                if token is not None:
+                    record['k'] = token
+                if fields:
+                    record.update(fields)
+                lines.append(json.dumps(record, separators=(',', ':')))
+            data = ('\n'.join(lines) + '\n').encode('utf-8')
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+            self.written += len(records)
+            if self._size >= self.max_bytes:
+                self._rotate()
+
+    def close(self) -> None:
+        """Write buffered events and stop recording"""
+        self.enabled = False
+        self._closed.set()
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(self.flush_interval + 1.0)
+        self.flush()
+        with self._write_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def files(self) -> List[pathlib.Path]:
+        """The log file and its rotated backups, oldest first"""
+        return trace_files(self.path) if self.path else []
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            buffered = len(self._buffer)
+        return {
+            'enabled': self.enabled,
+            'path': str(self.path) if self.path else None,
+            'events': self.events,
+            'written': self.written,
+            'buffered': buffered,
+            'rotations': self.rotations,
+        }
+
+    def _open_file(self) -> None:
+        # Must be called with the write lock held
+        self._file = open(self.path, 'ab', buffering=1 << 16)
+        self._size = self._file.tell()
+        header = json.dumps({
+            't': round(time.monotonic(), 6), 'e': EVENT_OPEN, 'wall': round(time.time(), 6), 'pid': os.getpid(),
+        }, separators=(',', ':')).encode('utf-8') + b'\n'
+        self._file.write(header)
+        self._size += len(header)
+
+    def _rotate(self) -> None:
+        # Must be called with the write lock held
+        self._file.close()
+        self._file = None
+        try:
+            if self.backups > 0:
+                for number in range(self.backups - 1, 0, -1):
+                    older = self.path.with_name(f'{self.path.name}.{number}')
+                    if older.exists():
+                        os.replace(older, self.path.with_name(f'{self.path.name}.{number + 1}'))
+                os.replace(self.path, self.path.with_name(f'{self.path.name}.1'))
+            else:
+                self.path.unlink()
+        except OSError as e:
+            logging.error(f"Failed to rotate trace log {self.path}: {e}")
+        self.rotations += 1
+        self._open_file()
+
+    def _run(self) -> None:
+        while not self._closed.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except (OSError, ValueError) as e:
+                logging.error(f"Failed to write trace log {self.path}: {e}")
+
+
+TRACE = TraceLog()
+
+
+def trace_files(path: pathlib.Path) -> List[pathlib.Path]:
+    """A trace file and its rotated backups, oldest first"""
+    path = pathlib.Path(path)
+    backups = []
+    for number in itertools.count(1):
+        backup = path.with_name(f'{path.name}.{number}')
+        if not backup.exists():
+            break
+        backups.append(backup)
+    return backups[::-1] + ([path] if path.exists() else [])
+
+
+def read_trace(path: pathlib.Path) -> Iterator[Dict[str, Any]]:
+    """Stream the events of a trace file and its backups, skipping lines cut short by a crash"""
+    for file in trace_files(path):
+        with open(file, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and 't' in record and 'e' in record:
+                    yield record
+
+
+class _Durations:
+    """Durations of one stage, stored compactly for percentiles"""
+    __slots__ = ('values',)
+
+    def __init__(self):
+        self.values = array('d')
+
+    def add(self, start: Optional[float], end: Optional[float]) -> None:
+        if start is not None and end is not None and end >= start:
+            self.values.append(end - start)
+
+    def summary(self) -> Dict[str, Any]:
+        values = sorted(self.values)
+        if not values:
+            return {'count': 0, 'p50': None, 'p95': None, 'mean': None}
+        return {
+            'count': len(values),
+            'p50': round(values[len(values) // 2], 3),
+            'p95': round(values[min(int(len(values) * 0.95), len(values) - 1)], 3),
+            'mean': round(sum(values) / len(values), 3),
+        }
+
+
+# Stage name, event it starts at, event it ends at
+STAGES = (
+    ('waiting for operator', EVENT_RENDERED, EVENT_CHALLENGE),
+    ('solving challenge', EVENT_CHALLENGE, EVENT_SOLVED),
+    ('render to solve', EVENT_RENDERED, EVENT_SOLVED),
+    ('solve to capture', EVENT_SOLVED, EVENT_CAPTURED),
+    ('capture to pool', EVENT_CAPTURED, EVENT_POOLED),
+    ('queued in pool', EVENT_POOLED, EVENT_HANDED),
+    ('hand-off to inject', EVENT_HANDED, EVENT_INJECTED),
+    ('solve to checkout', EVENT_SOLVED, EVENT_INJECTED),
+    ('capture to hand-off', EVENT_CAPTURED, EVENT_HANDED),
+)
+
+
+class TraceAnalysis:
+    """
+    Latency breakdown, waste and per-harvester throughput of a trace.
+
+    Events are fed one at a time and a token is only held in memory until no
+    event of it was seen for settle seconds, so traces far larger than memory
+    can be streamed through.
+    """
+
+    def __init__(self, settle: float = 600.0):
+        """
+        Args:
+            settle: Seconds without events after which a token is counted as done
+        """
+        self.settle = settle
+        self.events = 0
+        self.first: Optional[float] = None
+        self.last: Optional[float] = None
+        self.wall_offset: Optional[float] = None
+        self.stages = {name: _Durations() for name, _, _ in STAGES}
+        self.outcomes = {'captured': 0, 'handed': 0, 'expired': 0, 'unused': 0, 'returned': 0, 'injected': 0}
+        self.harvesters: Dict[Any, Dict[str, Any]] = {}
+        # Token key -> {event: time, 'h': harvester, 's': sitekey}
+        self._tokens: Dict[str, Dict[str, Any]] = {}
+        # Harvester id -> when its widget was last rendered and its challenge opened
+        self._widgets: Dict[Any, Dict[str, Optional[float]]] = {}
+        self._swept = 0
+
+    def feed(self, record: Dict[str, Any]) -> None:
+        """Account for one event"""
+        at, event = record['t'], record['e']
+        self.events += 1
+        if event == EVENT_OPEN:
+            if self.wall_offset is None and 'wall' in record:
+                self.wall_offset = record['wall'] - at
+            return
+        self.first = at if self.first is None else min(self.first, at)
+        self.last = at if self.last is None else max(self.last, at)
+        harvester_id = record.get('h')
+
+        if event in (EVENT_RENDERED, EVENT_CHALLENGE):
+            widget = self._widgets.setdefault(harvester_id, {EVENT_RENDERED: None, EVENT_CHALLENGE: None})
+            widget[event] = at
+            if event == EVENT_RENDERED:
+                widget[EVENT_CHALLENGE] = None
+            return
+
+        key = record.get('k')
+        if key is None:
+            return
+        token = self._tokens.get(key)
+        if token is None:
+            token = self._tokens[key] = {}
+        token['seen'] = at
+        if harvester_id is not None:
+            token.setdefault('h', harvester_id)
+        if record.get('s') is not None:
+            token.setdefault('s', record['s'])
+
+        if event == EVENT_SOLVED:
+            widget = self._widgets.get(harvester_id)
+            if widget:
+                token[EVENT_RENDERED] = widget[EVENT_RENDERED]
+                token[EVENT_CHALLENGE] = widget[EVENT_CHALLENGE]
+                # The widget resets itself after every solve
+                widget[EVENT_RENDERED], widget[EVENT_CHALLENGE] = at, None
+        elif event == EVENT_POOLED and EVENT_HANDED in token:
+            # Handed to a shard's relay callback before reaching the parent's pool
+            del token[EVENT_HANDED]
+        elif event == EVENT_RETURNED:
+            token['returned'] = token.get('returned', 0) + 1
+            token.pop(EVENT_HANDED, None)
+            return
+        token.setdefault(event, at)
+
+        if self.events - self._swept >= 10000:
+            self._sweep(at - self.settle)
+
+    def feed_all(self, records: Iterable[Dict[str, Any]]) -> 'TraceAnalysis':
+        for record in records:
+            self.feed(record)
+        return self
+
+    def report(self) -> Dict[str, Any]:
+        """Everything measured so far, tokens still in flight are counted as done"""
+        self._sweep(float('inf'))
+        captured = self.outcomes['captured']
+
+        def share(count: int) -> Optional[float]:
+            return round(100.0 * count / captured, 1) if captured else None
+
+        span = (self.last - self.first) if self.first is not None else 0.0
+        harvesters = []
+        for harvester_id, counts in sorted(self.harvesters.items(), key=lambda item: (str(type(item[0])), item[0] or 0)):
+            active = counts['last'] - counts['first']
+            harvesters.append({
+                'harvester': harvester_id,
+                'sitekey': counts['sitekey'],
+                'tokens': counts['tokens'],
+                'expired': counts['expired'],
+                'tokens_per_hour': round(counts['tokens'] * 3600 / active, 1) if active > 0 else None,
+                'solve_p50': counts['solve'].summary()['p50'],
+            })
+
+        return {
+            'events': self.events,
+            'started': (
+                datetime.datetime.fromtimestamp(self.first + self.wall_offset).isoformat(timespec='seconds')
+                if self.first is not None and self.wall_offset is not None else None
+            ),
+            'seconds': round(span, 1),
+            'stages': {name: durations.summary() for name, durations in self.stages.items()},
+            'outcomes': dict(self.outcomes),
+            'waste': {
+                'expired_pct': share(self.outcomes['expired']),
+                'unused_pct': share(self.outcomes['unused']),
+                'returned_pct': share(self.outcomes['returned']),
+            },
+            'harvesters': harvesters,
+        }
+
+    def _sweep(self, before: float) -> None:
+        self._swept = self.events
+        done = [key for key, token in self._tokens.items() if token['seen'] < before]
+        for key in done:
+            self._finish(self._tokens.pop(key))
+
+    def _finish(self, token: Dict[str, Any]) -> None:
+        for name, start, end in STAGES:
+            self.stages[name].add(token.get(start), token.get(end))
+        if EVENT_CAPTURED not in token and EVENT_POOLED not in token:
+            # Solved in a page that closed before the token was read
+            return
+
+        outcomes = self.outcomes
+        outcomes['captured'] += 1
+        outcomes['returned'] += token.get('returned', 0)
+        if EVENT_INJECTED in token:
+            outcomes['injected'] += 1
+        if EVENT_HANDED in token:
+            outcomes['handed'] += 1
+        elif EVENT_EXPIRED in token:
+            outcomes['expired'] += 1
+        else:
+            outcomes['unused'] += 1
+
+        harvester_id = token.get('h')
+        counts = self.harvesters.get(harvester_id)
+        captured = token.get(EVENT_CAPTURED, token.get(EVENT_POOLED))
+        if counts is None:
+            counts = self.harvesters[harvester_id] = {
+                'sitekey': token.get('s'), 'tokens': 0, 'expired': 0, 'first': captured, 'last': captured,
+                'solve': _Durations(),
+            }
+        counts['tokens'] += 1
+        if EVENT_EXPIRED in token and EVENT_HANDED not in token:
+            counts['expired'] += 1
+        rendered = token.get(EVENT_RENDERED)
+        counts['first'] = min(counts['first'], captured if rendered is None else rendered)
+        counts['last'] = max(counts['last'], captured)
+        counts['solve'].add(token.get(EVENT_RENDERED), token.get(EVENT_SOLVED))
+
+
+def analyze(paths: Iterable[pathlib.Path], settle: float = 600.0) -> Dict[str, Any]:
+    """
+    Analyze trace files, e.g. a manager's and its shards', merged by time
+
+    Returns:
+        dict: See TraceAnalysis.report
+    """
+    streams = [read_trace(path) for path in paths]
+    return TraceAnalysis(settle).feed_all(heapq.merge(*streams, key=lambda record: record['t'])).report()
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Plain text tables of a report"""
+    def value(number: Any) -> str:
+        return '-' if number is None else str(number)
+
+    lines = [f'{report["events"]} events over {report["seconds"]}s' + (
+        f' from {report["started"]}' if report['started'] else ''
+    ), '']
+
+    lines.append(f'{"stage":<24}{"count":>8}{"p50 s":>10}{"p95 s":>10}{"mean s":>10}')
+    for name, summary in report['stages'].items():
+        lines.append(
+            f'{name:<24}{summary["count"]:>8}{value(summary["p50"]):>10}'
+            f'{value(summary["p95"]):>10}{value(summary["mean"]):>10}'
+        )
+
+    outcomes, waste = report['outcomes'], report['waste']
+    lines += ['', f'{"tokens":<24}{"count":>8}{"share %":>10}']
+    lines.append(f'{"captured":<24}{outcomes["captured"]:>8}')
+    for name, share in (('handed', None), ('expired', 'expired_pct'), ('unused', 'unused_pct'),
+                        ('returned', 'returned_pct'), ('injected', None)):
+        if share is None:
+            percent = round(100.0 * outcomes[name] / outcomes['captured'], 1) if outcomes['captured'] else None
+        else:
+            percent = waste[share]
+        lines.append(f'{name:<24}{outcomes[name]:>8}{value(percent):>10}')
+
+    lines += ['', f'{"harvester":<12}{"sitekey":<24}{"tokens":>8}{"per hour":>10}{"expired":>9}{"solve s":>9}']
+    for harvester in report['harvesters']:
+        sitekey = value(harvester['sitekey'])
+        lines.append(
+            f'{value(harvester["harvester"]):<12}{sitekey[:22]:<24}{harvester["tokens"]:>8}'
+            f'{value(harvester["tokens_per_hour"]):>10}{harvester["expired"]:>9}{value(harvester["solve_p50"]):>9}'
+        )
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command line entry point, python -m harvester.trace"""
+    parser = argparse.ArgumentParser(
+        prog='python -m harvester.trace',
+        description='Latency breakdown, waste and per-harvester throughput of token trace logs. '
+                    'Rotated backups of each file are read too.',
+    )
+    parser.add_argument('paths', nargs='+', type=pathlib.Path, help='Trace files, e.g. a manager and its shards')
+    parser.add_argument('--settle', type=float, default=600.0,
+                        help='Seconds without events after which a token is counted as done')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args(argv)
+
+    missing = [str(path) for path in args.paths if not trace_files(path)]
+    if missing:
+        parser.error(f'no trace at {", ".join(missing)}')
+    report = analyze(args.paths, args.settle)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
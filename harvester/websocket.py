@@ -0,0 +1,146 @@
+from typing import Tuple, Callable
+import asyncio
+import base64
+import hashlib
+import os
+import struct
+
+GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+def accept_key(key: str) -> str:
+    """Sec-WebSocket-Accept value for a client's Sec-WebSocket-Key"""
+    digest = hashlib.sha1((key + GUID).encode('ascii')).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def apply_mask(payload: bytes, mask: bytes) -> bytes:
+    """XOR a payload with a 4 byte mask, whole buffer at once rather than per byte"""
+    if not payload:
+        return payload
+    repeated = (mask * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, 'little') ^ int.from_bytes(repeated, 'little')).to_bytes(len(payload), 'little')
+
+
+def encode_frame(payload: bytes, opcode: int = OP_TEXT, mask: bool = False) -> bytes:
+    """
+    Build a single final frame
+
+    Args:
+        payload: Frame payload
+        opcode: Frame opcode
+        mask: Mask the payload, required for frames sent by clients
+
+    Returns:
+        bytes: Encoded frame
+    """
+    length = len(payload)
+    header = bytes([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+
+    if length < 126:
+        header += bytes([mask_bit | length])
+    elif length < 65536:
+        header += bytes([mask_bit | 126]) + struct.pack('!H', length)
+    else:
+        header += bytes([mask_bit | 127]) + struct.pack('!Q', length)
+
+    if mask:
+        mask_key = os.urandom(4)
+        return header + mask_key + apply_mask(payload, mask_key)
+    return header + payload
+
+
+def decode_header(header: bytes) -> Tuple[bool, int, bool, int]:
+    """
+    Split the first two bytes of a frame
+
+    Returns:
+        tuple: (fin, opcode, masked, length) where length 126/127 means an
+            extended 2/8 byte length follows
+    """
+    return bool(header[0] & 0x80), header[0] & 0x0F, bool(header[1] & 0x80), header[1] & 0x7F
+
+
+async def read_frame(reader: asyncio.StreamReader, max_size: int = 1 << 20) -> Tuple[int, bytes]:
+    """
+    Read one message, joining continuation frames
+
+    Args:
+        reader: Stream to read from
+        max_size: Largest accepted message
+
+    Returns:
+        tuple: (opcode, payload)
+    """
+    message_opcode, chunks, size = None, [], 0
+    while True:
+        fin, opcode, masked, length = decode_header(await reader.readexactly(2))
+        if length == 126:
+            length = struct.unpack('!H', await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', await reader.readexactly(8))[0]
+
+        size += length
+        if size > max_size:
+            raise ValueError(f"WebSocket message too large: {size} bytes")
+
+        mask_key = await reader.readexactly(4) if masked else None
+        payload = await reader.readexactly(length)
+        if mask_key:
+            payload = apply_mask(payload, mask_key)
+
+        if opcode >= OP_CLOSE:
+            # Control frames may arrive between fragments
+            return opcode, payload
+
+        if message_opcode is None:
+            message_opcode = opcode
+        chunks.append(payload)
+        if fin:
+            return message_opcode, b''.join(chunks)
+
+
+def read_frame_blocking(read_exactly: Callable[[int], bytes], max_size: int = 1 << 20) -> Tuple[int, bytes]:
+    """
+    Blocking twin of read_frame for clients on a plain socket
+
+    Args:
+        read_exactly: Returns exactly n bytes or raises EOFError
+        max_size: Largest accepted message
+
+    Returns:
+        tuple: (opcode, payload)
+    """
+    message_opcode, chunks, size = None, [], 0
+    while True:
+        fin, opcode, masked, length = decode_header(read_exactly(2))
+        if length == 126:
+            length = struct.unpack('!H', read_exactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', read_exactly(8))[0]
+
+        size += length
+        if size > max_size:
+            raise ValueError(f"WebSocket message too large: {size} bytes")
+
+        mask_key = read_exactly(4) if masked else None
+        payload = read_exactly(length)
+        if mask_key:
+            payload = apply_mask(payload, mask_key)
+
+        if opcode >= OP_CLOSE:
+            return opcode, payload
+
+        if message_opcode is None:
+            message_opcode = opcode
+        chunks.append(payload)
+        if fin:
+            return message_opcode, b''.join(chunks)
@@ -0,0 +1,48 @@
+import pathlib
+import sys
+
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+# Tests import the package from the checkout, like the benchmarks do, and share the
+# benchmarks' offline stand-ins (fakes.FakeHarvester, fakes.FakeProxy, ...)
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+from fakes import FakeRecaptchaServer, CaptchaSolver, FakeHarvester  # noqa: E402
+
+
+@pytest.fixture
+def recaptcha_server():
+    server = FakeRecaptchaServer()
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def solver(recaptcha_server):
+    solver = CaptchaSolver(recaptcha_server, solve_time=0.05)
+    solver.start()
+    yield solver
+    solver.stop()
+
+
+@pytest.fixture
+def make_harvester(recaptcha_server, solver):
+    """FakeHarvester factory on the fake shop, every harvester made is quit after the test"""
+    harvesters = []
+
+    def make(number=0, url=None, sitekey=None, harvester_class=FakeHarvester, **kwargs):
+        kwargs.setdefault('latency', 0)
+        kwargs.setdefault('push_capture', False)
+        harvester = harvester_class(
+            url or recaptcha_server.page_url(number), sitekey or recaptcha_server.sitekey, solver, **kwargs
+        )
+        harvesters.append(harvester)
+        return harvester
+
+    yield make
+    for harvester in harvesters:
+        harvester.quit()
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+
+from harvester.async_manager import AsyncHarvesterManager
+from harvester.harvester_manager import HarvesterManager
+from harvester.token_pool import Token
+
+
+def test_waiter_survives_token_taken_by_another_consumer():
+    async def scenario():
+        manager = HarvesterManager()
+        async_manager = AsyncHarvesterManager(manager)
+        waiting = asyncio.ensure_future(async_manager.get_token('key', timeout=2.0))
+        await asyncio.sleep(0)
+
+        # Both dispatches are queued on the loop; the first token is gone before its turn
+        manager.push_response(Token('first', sitekey='key', url='https://a'))
+        assert manager.take_response('key').response == 'first'
+        manager.push_response(Token('second', sitekey='key', url='https://a'))
+
+        token = await waiting
+        assert token is not None and token.response == 'second'
+        assert not async_manager._waiters[(None, 'key')]
+
+    asyncio.run(scenario())
+
+
+def test_waiter_keeps_waiting_when_claim_fails_and_pool_is_empty():
+    async def scenario():
+        manager = HarvesterManager()
+        async_manager = AsyncHarvesterManager(manager)
+        waiting = asyncio.ensure_future(async_manager.get_token('key', timeout=2.0))
+        await asyncio.sleep(0)
+
+        manager.push_response(Token('first', sitekey='key'))
+        manager.take_response('key')
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+
+        manager.push_response(Token('later', sitekey='key'))
+        assert (await waiting).response == 'later'
+
+    asyncio.run(scenario())
+
+
+def test_get_token_returns_queued_tokens_right_away_and_times_out_without_one():
+    async def scenario():
+        manager = HarvesterManager()
+        async_manager = AsyncHarvesterManager(manager)
+        manager.push_response(Token('queued', sitekey='key'))
+        assert (await async_manager.get_token('key', timeout=0)).response == 'queued'
+
+        assert await async_manager.get_token('key', timeout=0.05) is None
+        assert not async_manager._waiters[(None, 'key')]
+        manager.push_response(Token('late', sitekey='key'))
+        await asyncio.sleep(0)
+        assert manager.token_count('key') == 1
+
+    asyncio.run(scenario())
+
+
+def test_tokens_go_to_the_most_specific_waiter_and_respect_min_ttl():
+    async def scenario():
+        manager = HarvesterManager()
+        async_manager = AsyncHarvesterManager(manager)
+        anything = asyncio.ensure_future(async_manager.get_token(timeout=2.0))
+        exact = asyncio.ensure_future(async_manager.get_token('key', timeout=2.0, url='https://a'))
+        patient = asyncio.ensure_future(async_manager.get_token('key', timeout=2.0, min_ttl=100))
+        await asyncio.sleep(0)
+
+        manager.push_response(Token('short', sitekey='key', url='https://a', lifetime=50))
+        manager.push_response(Token('elsewhere', sitekey='other', url='https://b', lifetime=50))
+        manager.push_response(Token('long', sitekey='key', url='https://c'))
+
+        assert (await exact).response == 'short'
+        assert (await anything).response == 'elsewhere'
+        assert (await patient).response == 'long'
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_gives_its_token_back():
+    async def scenario():
+        manager = HarvesterManager()
+        async_manager = AsyncHarvesterManager(manager)
+        waiting = asyncio.ensure_future(async_manager.get_token('key'))
+        await asyncio.sleep(0)
+
+        manager.push_response(Token('solved', sitekey='key'))
+        # The dispatch hands the token over, the task is cancelled before it resumes
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+
+        # Either the task still got its token or the token is back in the pool, never lost
+        if waiting.cancelled():
+            assert manager.token_count('key') == 1
+        else:
+            assert waiting.result().response == 'solved' and manager.token_count('key') == 0
+
+    asyncio.run(scenario())
+
+
+def test_tokens_iterates_over_harvested_tokens():
+    async def scenario():
+        manager = HarvesterManager()
+        async_manager = AsyncHarvesterManager(manager)
+        for name in ('one', 'two', 'three'):
+            manager.push_response(Token(name, sitekey='key'))
+
+        received = []
+        async for token in async_manager.tokens('key'):
+            received.append(token.response)
+            if len(received) == 3:
+                break
+        assert received == ['one', 'two', 'three']
+
+    asyncio.run(scenario())
+
+
+def test_main_loop_ticks_in_the_executor_until_the_fleet_is_gone():
+    class CountingManager(HarvesterManager):
+        def __init__(self):
+            super().__init__(delay=0.01)
+            self.threads = []
+
+        def tick(self):
+            self.threads.append(threading.get_ident())
+            if len(self.threads) == 3:
+                self.harvesters.clear()
+
+    async def scenario():
+        manager = CountingManager()
+        manager.harvesters.append(object())
+        await AsyncHarvesterManager(manager).main_loop()
+        assert len(manager.threads) == 3
+        assert threading.get_ident() not in manager.threads
+
+    asyncio.run(scenario())
@@ -0,0 +1,110 @@
+import math
+import time
+
+import pytest
+
+from harvester.autoscaler import Autoscaler, _Policy, _Signals
+from harvester.harvester_manager import HarvesterManager
+from harvester.token_pool import Token
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def plan(autoscaler, current, depth=0, consumption_rate=0.0, harvest_rate=1 / 30, changed_at=0.0, now=1000.0,
+         target=10, min_harvesters=0, max_harvesters=8, waste_rate=0.0):
+    signals = _Signals(now, harvest_rate)
+    signals.depth = depth
+    signals.consumption_rate = consumption_rate
+    signals.waste_rate = waste_rate
+    signals.changed_at = changed_at
+    change = autoscaler._plan(_Policy(target, 30, min_harvesters, max_harvesters), signals, current, now)
+    return change, signals.desired
+
+
+@pytest.fixture
+def autoscaler():
+    autoscaler = Autoscaler(HarvesterManager(), refill_time=60, up_cooldown=5, down_cooldown=60, hysteresis=0.5)
+    yield autoscaler
+    autoscaler.stop()
+
+
+def test_plan_covers_consumption_and_refills_the_shortfall(autoscaler):
+    # 0.1 tokens/s consumed plus 6 missing within 60s, at 1/30 tokens/s per harvester
+    assert plan(autoscaler, current=1, depth=4, consumption_rate=0.1) == (5, 6)
+    assert plan(autoscaler, current=1, depth=4, consumption_rate=1.0) == (7, 8)
+
+
+def test_plan_waits_for_the_up_cooldown(autoscaler):
+    assert plan(autoscaler, current=1, depth=0, changed_at=997.0) == (0, 5)
+    assert plan(autoscaler, current=1, depth=0, changed_at=995.0) == (4, 5)
+
+
+def test_plan_keeps_the_fleet_within_its_bounds(autoscaler):
+    assert plan(autoscaler, current=0, depth=50, min_harvesters=2)[0] == 2
+    assert plan(autoscaler, current=6, depth=0, max_harvesters=4)[0] == -2
+
+
+def test_plan_parks_one_harvester_only_well_above_target(autoscaler):
+    # Within the hysteresis band nothing changes
+    assert plan(autoscaler, current=3, depth=14)[0] == 0
+    assert plan(autoscaler, current=3, depth=15)[0] == -1
+    # Tokens expiring unused count as surplus once the target is met
+    assert plan(autoscaler, current=3, depth=10, waste_rate=0.01)[0] == -1
+    # Not while the domain scaled within the down cooldown
+    assert plan(autoscaler, current=3, depth=15, changed_at=950.0)[0] == 0
+
+
+def test_update_averages_the_domain_counters(autoscaler):
+    signals = _Signals(0.0, 1 / 30)
+    autoscaler._update(signals, {'harvested': 10, 'consumed': 5, 'expired': 0}, active=2, depth=3, now=0.0)
+    assert signals.consumption_rate == 0
+    autoscaler._update(signals, {'harvested': 22, 'consumed': 11, 'expired': 0}, active=2, depth=4, now=60.0)
+    weight = 1 - math.exp(-1)
+    assert signals.consumption_rate == pytest.approx(weight * 0.1)
+    assert signals.harvest_rate == pytest.approx(1 / 30 + weight * (0.1 - 1 / 30))
+    assert signals.depth == 4
+
+
+def test_policy_bounds_are_validated(autoscaler):
+    with pytest.raises(ValueError):
+        autoscaler.set_policy('https://a', 'key', 5, min_harvesters=3, max_harvesters=2)
+
+
+def test_fleet_opens_parks_and_unparks_with_the_pool(make_harvester, recaptcha_server):
+    class FakeManager(HarvesterManager):
+        def create_harvester(self, url, sitekey, **kwargs):
+            return make_harvester(url=url, sitekey=sitekey)
+
+    manager = FakeManager()
+    autoscaler = Autoscaler(manager, up_cooldown=0, down_cooldown=0, refill_time=60, expected_solve_time=30)
+    url, sitekey = recaptcha_server.page_url(0), recaptcha_server.sitekey
+    autoscaler.set_policy(url, sitekey, 3, min_ttl=0, max_harvesters=4)
+    try:
+        autoscaler.check()
+        # 3 missing within 60s at 1/30 tokens/s per harvester
+        wait_for(lambda: len(manager.harvesters) == 2)
+        assert autoscaler.launches == 2
+
+        for n in range(5):
+            manager.push_response(Token(f'token{n}', sitekey=sitekey, url=url))
+        autoscaler.check()
+        wait_for(lambda: len(autoscaler.parked(url, sitekey)) == 1)
+        assert len(manager.harvesters) == 1 and autoscaler.parks == 1
+        parked = autoscaler.parked(url, sitekey)[0]
+        assert not parked.ready
+
+        while manager.take_response(sitekey, url=url):
+            pass
+        autoscaler.check()
+        wait_for(lambda: autoscaler.unparks == 1)
+        assert parked in manager.harvesters and parked.ready
+        assert autoscaler.launches == 2
+        assert autoscaler.stats()['domains'][(url, sitekey)]['parked'] == 0
+    finally:
+        autoscaler.stop()
+        manager.stop()
@@ -0,0 +1,93 @@
+import argparse
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+import scaling
+from fakes import FakeRecaptchaServer, CaptchaSolver, FakeHarvester, SITEKEY
+from harvester.harvester_manager import HarvesterManager
+from harvester.token_listener import TokenListener
+
+
+def harvest(manager, seconds):
+    loop = threading.Thread(target=manager.main_loop, daemon=True)
+    loop.start()
+    time.sleep(seconds)
+    manager.looping = False
+    loop.join(5)
+
+
+def test_server_serves_the_widget_and_issues_repeatable_tokens(recaptcha_server):
+    with urllib.request.urlopen(recaptcha_server.page_url(7), timeout=5) as response:
+        page = response.read().decode()
+    assert 'Shop 7' in page and f'data-sitekey="{SITEKEY}"' in page
+    with pytest.raises(urllib.error.HTTPError):
+        urllib.request.urlopen(recaptcha_server.page_url(7) + '/missing', timeout=5)
+
+    token = recaptcha_server.fetch_token(SITEKEY)
+    assert token in recaptcha_server.issued and len(token) > 500
+    assert FakeRecaptchaServer(seed=0).issue(SITEKEY) == token
+    assert FakeRecaptchaServer(seed=1).issue(SITEKEY) != token
+
+
+@pytest.mark.parametrize('batched_tick', [True, False])
+def test_polling_fleet_harvests_the_issued_tokens(make_harvester, recaptcha_server, batched_tick):
+    manager = HarvesterManager(delay=0.02)
+    harvesters = [make_harvester(n, batched_tick=batched_tick) for n in range(3)]
+    for harvester in harvesters:
+        manager.add_harvester(harvester)
+    manager.start_harvesters(concurrency=3)
+    assert all(harvester.ready for harvester in harvesters)
+
+    harvest(manager, 0.5)
+    tokens = []
+    while manager.token_count():
+        tokens.append(manager.take_response())
+    manager.stop()
+
+    assert tokens and all(token.response in recaptcha_server.issued for token in tokens)
+    assert {token.harvester_id for token in tokens} == {harvester.id for harvester in harvesters}
+    if batched_tick:
+        # Set up and solving, each tick reads the whole page state in one round trip
+        assert min(harvester.round_trips_per_tick for harvester in harvesters) < 1.5
+
+
+def test_pushed_tokens_reach_the_manager_through_the_listener(make_harvester, recaptcha_server):
+    listener = TokenListener()
+    listener.start()
+    manager = HarvesterManager(delay=0.02)
+    harvester = make_harvester(0, push_capture=True, token_listener=listener, fallback_poll_interval=3600)
+    manager.add_harvester(harvester)
+    manager.start_harvesters()
+
+    captured = []
+    manager.add_response_listener(captured.extend)
+    harvest(manager, 0.5)
+    manager.stop()
+    listener.stop()
+
+    assert captured and all(token.response in recaptcha_server.issued for token in captured)
+
+
+def test_scaling_run_reports_a_small_fleet(recaptcha_server):
+    solver = CaptchaSolver(recaptcha_server, solve_time=0.05)
+    solver.start()
+    listener = TokenListener()
+    listener.start()
+    args = argparse.Namespace(
+        delay=0.02, workers=None, latency=0.0, jitter=0.0, no_push=False, unbatched=False, launch_concurrency=4,
+        duration=0.5,
+    )
+    try:
+        result = scaling.run(4, recaptcha_server, solver, listener, args)
+    finally:
+        listener.stop()
+        solver.stop()
+
+    assert result['harvesters'] == 4
+    assert result['ticks_per_second'] > 0
+    assert result['tokens_captured'] > 0 and result['tokens_issued'] >= result['tokens_captured']
+    assert result['capture_p50_ms'] <= result['capture_p95_ms']
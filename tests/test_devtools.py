@@ -0,0 +1,315 @@
+import json
+import shutil
+import socket
+import struct
+import subprocess
+import threading
+
+import pytest
+from selenium.common.exceptions import JavascriptException
+from selenium.webdriver.remote.webdriver import WebDriver
+
+from harvester import websocket
+from harvester.browser import Browser
+from harvester.devtools import DevToolsConnection, DevToolsError, function_call
+
+
+class FakeDevTools:
+    """
+    Stand-in for Chrome's debugging endpoint: /json/list and one page WebSocket.
+
+    Runtime.evaluate returns the length of the expression, or throws when it
+    contains `throw`; other methods are rejected. With batch set, replies are
+    held until that many commands arrived and sent back in reverse order.
+    """
+
+    def __init__(self, batch=1, accept=None):
+        self.batch = batch
+        self.accept = accept
+        self.commands = []
+        self.pongs = []
+        self.clients = []
+        self._server = socket.create_server(('127.0.0.1', 0))
+        self.address = f'127.0.0.1:{self._server.getsockname()[1]}'
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def stop(self):
+        self._server.close()
+        for client in self.clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            client.close()
+
+    def send(self, message, opcode=websocket.OP_TEXT):
+        payload = message if isinstance(message, bytes) else json.dumps(message).encode()
+        self.clients[-1].sendall(websocket.encode_frame(payload, opcode))
+
+    def _serve(self):
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+            self.clients.append(client)
+            threading.Thread(target=self._handle, args=(client,), daemon=True).start()
+
+    def _handle(self, client):
+        stream = client.makefile('rb')
+        request = stream.readline().decode()
+        headers = {}
+        while True:
+            line = stream.readline().decode().strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.lower()] = value.strip()
+
+        if request.startswith('GET /json/list'):
+            body = json.dumps([
+                {'type': 'service_worker', 'id': 'SW', 'webSocketDebuggerUrl': f'ws://{self.address}/sw'},
+                {'type': 'page', 'id': 'OTHER', 'webSocketDebuggerUrl': f'ws://{self.address}/devtools/page/OTHER'},
+                {'type': 'page', 'id': 'PAGE', 'webSocketDebuggerUrl': f'ws://{self.address}/devtools/page/PAGE'},
+            ]).encode()
+            client.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s'
+                           % (len(body), body))
+            client.close()
+            return
+
+        accept = self.accept or websocket.accept_key(headers['sec-websocket-key'])
+        client.sendall(
+            f'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept}\r\n\r\n'.encode()
+        )
+
+        def read_exactly(size):
+            data = stream.read(size)
+            if len(data) < size:
+                raise EOFError
+            return data
+
+        held = []
+        try:
+            while True:
+                opcode, payload = websocket.read_frame_blocking(read_exactly)
+                if opcode == websocket.OP_CLOSE:
+                    client.sendall(websocket.encode_frame(payload, websocket.OP_CLOSE))
+                    return
+                if opcode == websocket.OP_PONG:
+                    self.pongs.append(payload)
+                    continue
+                command = json.loads(payload)
+                self.commands.append(command)
+                held.append(self._reply(command))
+                if len(held) >= self.batch:
+                    for reply in reversed(held):
+                        client.sendall(websocket.encode_frame(json.dumps(reply).encode()))
+                    held = []
+        except (EOFError, OSError):
+            client.close()
+
+    @staticmethod
+    def _reply(command):
+        if command['method'] != 'Runtime.evaluate':
+            return {'id': command['id'], 'error': {'code': -32601, 'message': f"'{command['method']}' wasn't found"}}
+        expression = command['params']['expression']
+        if 'throw' in expression:
+            return {'id': command['id'], 'result': {
+                'result': {'type': 'object'},
+                'exceptionDetails': {'text': 'Uncaught', 'exception': {'description': 'Error: boom'}},
+            }}
+        return {'id': command['id'], 'result': {'result': {'type': 'number', 'value': len(expression)}}}
+
+
+@pytest.fixture
+def devtools():
+    servers = []
+
+    def make(**kwargs):
+        server = FakeDevTools(**kwargs)
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.stop()
+
+
+def reader_of(data):
+    buffer = memoryview(data)
+
+    def read_exactly(size):
+        nonlocal buffer
+        chunk, buffer = bytes(buffer[:size]), buffer[size:]
+        if len(chunk) < size:
+            raise EOFError
+        return chunk
+    return read_exactly
+
+
+def test_accept_key_matches_the_rfc_example():
+    assert websocket.accept_key('dGhlIHNhbXBsZSBub25jZQ==') == 's3pPLMBiTxaQ9kYGzzhZRbK+xOo='
+
+
+@pytest.mark.parametrize('length', [0, 1, 125, 126, 65535, 65536])
+@pytest.mark.parametrize('mask', [False, True])
+def test_frames_round_trip(length, mask):
+    payload = bytes(range(256)) * (length // 256) + bytes(range(length % 256))
+    frame = websocket.encode_frame(payload, websocket.OP_BINARY, mask=mask)
+    read_exactly = reader_of(frame + b'next')
+    assert websocket.read_frame_blocking(read_exactly, max_size=1 << 20) == (websocket.OP_BINARY, payload)
+    assert read_exactly(4) == b'next'
+    assert (frame[1] & 0x80 != 0) == mask
+
+
+def test_fragments_are_joined_around_control_frames():
+    first = bytes([websocket.OP_TEXT, 3]) + b'abc'
+    ping = websocket.encode_frame(b'hi', websocket.OP_PING)
+    last = bytes([0x80 | websocket.OP_CONTINUATION, 3]) + b'def'
+    read_exactly = reader_of(first + ping + last)
+    assert websocket.read_frame_blocking(read_exactly) == (websocket.OP_PING, b'hi')
+    read_exactly = reader_of(first + last)
+    assert websocket.read_frame_blocking(read_exactly) == (websocket.OP_TEXT, b'abcdef')
+
+
+def test_oversized_messages_are_refused():
+    header = bytes([0x80 | websocket.OP_TEXT, 127]) + struct.pack('!Q', 1 << 40)
+    with pytest.raises(ValueError):
+        websocket.read_frame_blocking(reader_of(header), max_size=1 << 20)
+
+
+def test_mask_is_its_own_inverse():
+    payload = bytes(range(7)) * 100
+    masked = websocket.apply_mask(payload, b'\x01\x02\x03\x04')
+    assert masked != payload and websocket.apply_mask(masked, b'\x01\x02\x03\x04') == payload
+    assert masked[:4] == bytes([0 ^ 1, 1 ^ 2, 2 ^ 3, 3 ^ 4])
+
+
+@pytest.mark.skipif(not shutil.which('node'), reason='needs node to evaluate the expression')
+def test_function_call_runs_the_script_with_its_arguments():
+    expression = function_call('return arguments[0] + arguments[1].length;', ('a"b', [1, 2]))
+    output = subprocess.run(['node', '-p', f'JSON.stringify({expression})'], capture_output=True, text=True,
+                            timeout=30, check=True).stdout
+    assert json.loads(output) == 'a"b2'
+
+
+def test_function_call_refuses_non_json_arguments():
+    with pytest.raises(TypeError):
+        function_call('return 1;', (object(),))
+
+
+def test_for_target_attaches_to_the_requested_page(devtools):
+    server = devtools()
+    connection = DevToolsConnection.for_target(server.address, 'PAGE')
+    assert connection.target_id == 'PAGE' and connection.connected
+    connection.close()
+
+    connection = DevToolsConnection.for_target(server.address, 'GONE')
+    assert connection.target_id == 'OTHER'
+    connection.close()
+
+
+def test_evaluate_returns_values_and_raises_script_errors(devtools):
+    server = devtools()
+    connection = DevToolsConnection.for_target(server.address, 'PAGE')
+    assert connection.evaluate('1 + 1') == 5
+    with pytest.raises(DevToolsError, match='Error: boom'):
+        connection.evaluate('throw new Error("boom")')
+    with pytest.raises(DevToolsError, match='wasn\'t found'):
+        connection.call('Page.nope')
+    assert connection.stats() == {'connected': True, 'calls': 3, 'events': 0, 'in_flight': 0}
+    connection.close()
+    assert not connection.connected
+    with pytest.raises(ConnectionError):
+        connection.evaluate('1')
+
+
+def test_call_many_pipelines_and_matches_replies_by_id(devtools):
+    # Replies only come once all three commands arrived, and in reverse order
+    server = devtools(batch=3)
+    connection = DevToolsConnection.for_target(server.address, 'PAGE', timeout=2)
+    results = connection.call_many([
+        ('Runtime.evaluate', DevToolsConnection.evaluate_params('1')),
+        ('Runtime.evaluate', DevToolsConnection.evaluate_params('throw 1')),
+        ('Runtime.evaluate', DevToolsConnection.evaluate_params('123')),
+    ])
+    assert DevToolsConnection.value(results[0]) == 1
+    with pytest.raises(DevToolsError):
+        DevToolsConnection.value(results[1])
+    assert DevToolsConnection.value(results[2]) == 3
+    assert [command['id'] for command in server.commands] == [1, 2, 3]
+    connection.close()
+
+
+def test_events_and_pings_are_handled_by_the_reader(devtools):
+    server = devtools()
+    received = []
+    event = threading.Event()
+    connection = DevToolsConnection.for_target(server.address, 'PAGE')
+    connection.on_event = lambda method, params: (received.append((method, params)), event.set())
+
+    server.send(b'are you there', websocket.OP_PING)
+    server.send({'method': 'Page.loadEventFired', 'params': {'timestamp': 1.5}})
+    assert event.wait(5)
+    assert received == [('Page.loadEventFired', {'timestamp': 1.5})]
+    # Frames are handled in order, so the pong went out before the event was read
+    assert connection.evaluate('1') == 1
+    assert server.pongs == [b'are you there']
+    connection.close()
+
+
+def test_lost_connection_fails_commands_in_flight(devtools):
+    server = devtools(batch=2)
+    connection = DevToolsConnection.for_target(server.address, 'PAGE')
+    future = connection.send('Runtime.evaluate', DevToolsConnection.evaluate_params('1'))
+    server.stop()
+    with pytest.raises(ConnectionError):
+        future.result(5)
+    assert not connection.connected
+
+
+def test_handshake_with_a_wrong_accept_key_is_refused(devtools):
+    server = devtools(accept='bogus')
+    with pytest.raises(ConnectionError, match='handshake'):
+        DevToolsConnection.for_target(server.address, 'PAGE')
+
+
+@pytest.fixture
+def browser(devtools):
+    browser = Browser()
+    browser._devtools = DevToolsConnection.for_target(devtools().address, 'PAGE')
+    browser._window = 'PAGE'
+    yield browser
+    browser.close_devtools()
+
+
+def test_browser_runs_scripts_over_devtools(browser):
+    expression = function_call('return 1;', ('a',))
+    assert browser.execute_script('return 1;', 'a') == len(expression)
+    assert browser.round_trips == 1 and browser.is_open
+    with pytest.raises(JavascriptException, match='boom'):
+        browser.execute_script('throw new Error("boom");')
+
+    results = browser.execute_scripts([('return 1;', ()), ('throw 1;', ()), ('return 22;', ())])
+    assert results[0] == len(function_call('return 1;'))
+    assert isinstance(results[1], JavascriptException)
+    assert browser.round_trips == 3
+
+
+def test_browser_falls_back_to_webdriver_for_other_windows_and_elements(browser, monkeypatch):
+    calls = []
+    monkeypatch.setattr(WebDriver, 'execute_script', lambda self, script, *args: calls.append((script, args)))
+    browser._window = 'OTHER'
+    browser.execute_script('return 1;')
+    browser._window = 'PAGE'
+    element = object()
+    browser.execute_script('arguments[0].click();', element)
+    assert calls == [('return 1;', ()), ('arguments[0].click();', (element,))]
+    assert browser.round_trips == 0
+
+
+def test_browser_is_closed_with_its_devtools_connection(browser):
+    browser._devtools.close()
+    browser._alive = None
+    assert not browser.is_open
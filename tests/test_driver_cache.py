@@ -0,0 +1,118 @@
+import json
+import os
+import subprocess
+import sys
+import types
+
+import pytest
+
+from harvester import driver_cache
+from harvester.driver_cache import DriverResolver
+
+
+@pytest.fixture(autouse=True)
+def fresh_resolver(monkeypatch, tmp_path):
+    DriverResolver.clear()
+    monkeypatch.setattr(driver_cache, 'WDM_DRIVERS_DIR', tmp_path / 'wdm')
+    yield
+    DriverResolver.clear()
+
+
+@pytest.fixture
+def downloads(monkeypatch, tmp_path):
+    """webdriver_manager stand-in recording every download"""
+    installed = []
+    downloaded = tmp_path / 'downloaded' / 'chromedriver'
+    downloaded.parent.mkdir()
+    downloaded.write_text('')
+
+    class ChromeDriverManager:
+        def install(self):
+            installed.append(str(downloaded))
+            return str(downloaded)
+
+    chrome = types.ModuleType('webdriver_manager.chrome')
+    chrome.ChromeDriverManager = ChromeDriverManager
+    monkeypatch.setitem(sys.modules, 'webdriver_manager', types.ModuleType('webdriver_manager'))
+    monkeypatch.setitem(sys.modules, 'webdriver_manager.chrome', chrome)
+    return installed
+
+
+@pytest.fixture
+def windows(monkeypatch):
+    """Makes driver_cache, and only driver_cache, see os.name == 'nt'"""
+    class WindowsOs(types.ModuleType):
+        name = 'nt'
+
+        def __getattr__(self, attribute):
+            return getattr(os, attribute)
+
+    monkeypatch.setattr(driver_cache, 'os', WindowsOs('os'))
+
+
+def write_cache(path, entries):
+    path.write_text(json.dumps(entries))
+
+
+def test_unknown_version_downloads_instead_of_reusing_unversioned_driver(monkeypatch, tmp_path, downloads):
+    stale = tmp_path / 'stale-chromedriver'
+    stale.write_text('')
+    cache = tmp_path / 'cache.json'
+    write_cache(cache, {'unknown': str(stale)})
+    monkeypatch.setattr(DriverResolver, '_detect_version', lambda self: None)
+    monkeypatch.setattr(driver_cache.shutil, 'which', lambda name: str(stale))
+
+    driver = DriverResolver(offline=False, cache_file=cache).resolve()
+
+    assert driver == downloads[0]
+    assert json.loads(cache.read_text()) == {'unknown': str(stale)}
+
+
+def test_unknown_version_offline_falls_back_to_local_driver(monkeypatch, tmp_path):
+    local = tmp_path / 'chromedriver'
+    local.write_text('')
+    monkeypatch.setattr(DriverResolver, '_detect_version', lambda self: None)
+    monkeypatch.setattr(driver_cache.shutil, 'which', lambda name: str(local))
+
+    assert DriverResolver(offline=True, cache_file=tmp_path / 'cache.json').resolve() == str(local)
+
+
+def test_known_version_is_cached(monkeypatch, tmp_path, downloads):
+    cache = tmp_path / 'cache.json'
+    monkeypatch.setattr(DriverResolver, '_detect_version', lambda self: '120')
+
+    driver = DriverResolver(offline=False, cache_file=cache).resolve()
+
+    assert json.loads(cache.read_text()) == {'120': driver}
+
+
+def test_windows_version_read_from_file_version(monkeypatch, windows):
+    commands = []
+
+    def run(command, **kwargs):
+        commands.append(command)
+        return subprocess.CompletedProcess(command, 0, stdout='120.0.6099.71\r\n')
+
+    monkeypatch.setattr(driver_cache.subprocess, 'run', run)
+    resolver = DriverResolver(chrome_executable="C:/Chrome's/chrome.exe")
+
+    assert resolver.chrome_major_version() == '120'
+    assert commands[0][0] == 'powershell'
+    assert "'C:/Chrome''s/chrome.exe'" in commands[0][-1]
+
+
+def test_windows_version_read_from_registry(monkeypatch, windows):
+    class Key:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+    winreg = types.ModuleType('winreg')
+    winreg.HKEY_CURRENT_USER, winreg.HKEY_LOCAL_MACHINE = 1, 2
+    winreg.OpenKey = lambda root, path: Key()
+    winreg.QueryValueEx = lambda key, name: ('121.0.6167.85', 1)
+    monkeypatch.setitem(sys.modules, 'winreg', winreg)
+
+    assert DriverResolver().chrome_major_version() == '121'
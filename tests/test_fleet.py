@@ -0,0 +1,132 @@
+import threading
+import time
+
+from fakes import FakeHarvester
+from harvester import harvester as harvester_module
+from harvester.fleet import FleetLauncher, StandbyPool
+from harvester.harvester_manager import HarvesterManager
+
+
+class CountingHarvester(FakeHarvester):
+    """Records how many harvesters are starting at the same time"""
+    lock = threading.Lock()
+    starting = 0
+    most_starting = 0
+
+    def start(self, url=None):
+        cls = CountingHarvester
+        with cls.lock:
+            cls.starting += 1
+            cls.most_starting = max(cls.most_starting, cls.starting)
+        try:
+            time.sleep(0.03)
+            return super().start(url)
+        finally:
+            with cls.lock:
+                cls.starting -= 1
+
+
+class BrokenHarvester(FakeHarvester):
+
+    def start(self, url=None):
+        raise RuntimeError('chrome crashed')
+
+
+def test_launcher_bounds_concurrent_launches(make_harvester):
+    harvesters = [make_harvester(n, harvester_class=CountingHarvester) for n in range(6)]
+    launcher = FleetLauncher(concurrency=2)
+    up = launcher.launch_and_wait(harvesters, timeout=10)
+    launcher.shutdown()
+
+    assert up == harvesters
+    assert CountingHarvester.most_starting == 2
+    assert set(launcher.launch_times) == {harvester.id for harvester in harvesters}
+    assert launcher.failed == []
+
+
+def test_launcher_reports_each_launch_and_keeps_failures(make_harvester):
+    good = make_harvester(0)
+    bad = make_harvester(1, harvester_class=BrokenHarvester)
+    reported = []
+    launcher = FleetLauncher(concurrency=2, ready_callback=lambda h, ok, elapsed: reported.append((h, ok)))
+    up = launcher.launch_and_wait([good, bad], timeout=10)
+    launcher.shutdown()
+
+    assert up == [good]
+    assert launcher.failed == [bad]
+    assert sorted(reported, key=lambda item: item[1]) == [(bad, False), (good, True)]
+
+
+def test_launcher_survives_a_failing_ready_callback(make_harvester):
+    harvester = make_harvester(0)
+
+    def callback(harvester, ok, elapsed):
+        raise ValueError('boom')
+
+    launcher = FleetLauncher(ready_callback=callback)
+    futures = launcher.launch([harvester])
+    assert futures[0].result(10) is True
+    launcher.shutdown()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def standby_pool(monkeypatch, solver, size):
+    made = []
+
+    class StandbyHarvester(FakeHarvester):
+        # StandbyPool builds Harvester(url=None, sitekey=None, ...) itself
+        def __init__(self, url, sitekey, **kwargs):
+            super().__init__(url, sitekey, solver, latency=0, push_capture=False, **kwargs)
+            made.append(self)
+
+    monkeypatch.setattr(harvester_module, 'Harvester', StandbyHarvester)
+    return StandbyPool(size=size), made
+
+
+def test_standby_pool_fills_and_assigns_a_blank_browser(monkeypatch, solver, recaptcha_server):
+    pool, made = standby_pool(monkeypatch, solver, size=2)
+    try:
+        pool.fill()
+        wait_for(lambda: pool.available() == 2)
+        assert all(not harvester.ready and harvester.url is None for harvester in pool.standby)
+
+        manager = HarvesterManager()
+        harvester = pool.assign(recaptcha_server.page_url(1), recaptcha_server.sitekey, manager)
+        assert harvester.ready and harvester.url == recaptcha_server.page_url(1)
+        assert manager.harvesters == [harvester]
+        # The pool tops itself back up after handing one out
+        wait_for(lambda: pool.available() == 2)
+        assert len(made) == 3
+    finally:
+        pool.stop()
+        for harvester in made:
+            harvester.quit()
+
+
+def test_standby_pool_keeps_the_browser_a_full_quota_rejects(monkeypatch, solver, recaptcha_server):
+    pool, made = standby_pool(monkeypatch, solver, size=1)
+    try:
+        pool.fill()
+        wait_for(lambda: pool.available() == 1)
+        manager = HarvesterManager()
+        manager.set_quota(recaptcha_server.page_url(1), recaptcha_server.sitekey, 0)
+
+        assert pool.assign(recaptcha_server.page_url(1), recaptcha_server.sitekey, manager) is None
+        assert manager.harvesters == []
+        assert made[0] in pool.standby and not made[0].closed
+    finally:
+        pool.stop()
+        for harvester in made:
+            harvester.quit()
+
+
+def test_standby_pool_assign_returns_none_when_empty(monkeypatch, solver):
+    pool, made = standby_pool(monkeypatch, solver, size=0)
+    assert pool.assign('https://a', 'key') is None
+    pool.stop()
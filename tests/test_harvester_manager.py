@@ -0,0 +1,147 @@
+import threading
+import time
+
+from harvester.harvester_manager import HarvesterManager
+from harvester.token_pool import Token
+
+
+def push_later(manager, token, delay=0.05):
+    timer = threading.Timer(delay, manager.push_response, (token,))
+    timer.start()
+    return timer
+
+
+def test_acquire_blocks_until_a_token_is_handed_over():
+    manager = HarvesterManager()
+    push_later(manager, Token('other', sitekey='other'))
+    push_later(manager, Token('solved', sitekey='key', url='https://a'), 0.1)
+
+    token = manager.acquire(timeout=2.0, sitekey='key')
+    assert token.response == 'solved'
+    assert manager.token_count('key') == 0 and manager.token_count('other') == 1
+    assert not manager._waiters
+
+
+def test_acquire_timeout_leaves_no_waiter_behind():
+    manager = HarvesterManager()
+    started = time.monotonic()
+    assert manager.acquire(timeout=0.1, sitekey='key', url='https://a') is None
+    assert time.monotonic() - started >= 0.1
+    assert not manager._waiters
+
+    manager.push_response(Token('late', sitekey='key', url='https://a'))
+    assert manager.token_count('key') == 1
+
+
+def test_hand_off_prefers_the_most_specific_filter():
+    manager = HarvesterManager()
+    results = {}
+
+    def wait(name, **filters):
+        results[name] = manager.acquire(timeout=2.0, **filters)
+
+    threads = [
+        threading.Thread(target=wait, args=('any',)),
+        threading.Thread(target=wait, args=('exact',), kwargs={'sitekey': 'key', 'url': 'https://a'}),
+    ]
+    for thread in threads:
+        thread.start()
+    while sum(len(waiters) for waiters in list(manager._waiters.values())) < 2:
+        time.sleep(0.01)
+
+    manager.push_response(Token('first', sitekey='key', url='https://a'))
+    manager.push_response(Token('second', sitekey='key', url='https://a'))
+    for thread in threads:
+        thread.join()
+    assert results['exact'].response == 'first' and results['any'].response == 'second'
+    assert not manager._waiters
+
+
+def test_lease_is_consumed_on_success_and_returned_on_error():
+    manager = HarvesterManager()
+    manager.push_response(Token('kept', sitekey='key'))
+    with manager.lease(timeout=0, sitekey='key') as lease:
+        assert lease.token.response == 'kept'
+    assert manager.token_count('key') == 0
+
+    manager.push_response(Token('returned', sitekey='key'))
+    try:
+        with manager.lease(timeout=0, sitekey='key'):
+            raise RuntimeError('checkout aborted')
+    except RuntimeError:
+        pass
+    assert manager.token_count('key') == 1
+    stats = manager.domain_status()[(None, 'key')]
+    assert (stats['consumed'], stats['returned']) == (1, 1)
+
+
+def test_return_token_rejects_double_and_unknown_returns():
+    manager = HarvesterManager()
+    manager.push_response(Token('solved', sitekey='key'))
+    token = manager.take_response('key')
+
+    assert manager.return_token(token)
+    assert not manager.return_token(token)
+    assert not manager.return_token(Token('never-handed-out', sitekey='key'))
+    assert manager.token_count('key') == 1
+
+    # Taken again it can come back again
+    assert manager.take_response('key') is token
+    assert manager.return_token(token)
+
+
+def test_expired_responses_are_not_returned_and_stop_being_tracked():
+    manager = HarvesterManager()
+    manager.push_response(Token('old', sitekey='key', lifetime=0.05))
+    token = manager.take_response('key')
+    time.sleep(0.06)
+    assert not manager.return_token(token)
+
+    manager.push_response(Token('new', sitekey='key'))
+    manager.take_response('key')
+    assert list(manager._outstanding) == ['new']
+
+
+class StubHarvester:
+    """Just the parts pull_responses_from_harvesters reads"""
+    url, sitekey = 'https://a', 'key'
+    ready = closed = False
+
+    def __init__(self, responses):
+        self.responses = responses
+
+    def pull_response_queue(self):
+        responses, self.responses = self.responses, []
+        return responses
+
+
+def test_response_callback_may_use_the_manager():
+    seen = []
+
+    def callback(token):
+        # Any of these used to deadlock on the manager lock
+        seen.append((token.response, manager.take_response(), manager.token_count(), manager.stats()['tokens']))
+
+    manager = HarvesterManager(response_callback=callback)
+    pusher = threading.Thread(target=manager.push_response, args=(Token('pushed', sitekey='key'),), daemon=True)
+    pusher.start()
+    pusher.join(2.0)
+    assert not pusher.is_alive()
+
+    manager.harvesters.append(StubHarvester([Token('pulled', sitekey='key')]))
+    puller = threading.Thread(target=manager.pull_responses_from_harvesters, daemon=True)
+    puller.start()
+    puller.join(2.0)
+    assert not puller.is_alive()
+
+    assert seen == [('pushed', None, 0, 0), ('pulled', None, 0, 0)]
+    assert manager.domain_status()[(None, 'key')]['harvested'] == 2
+
+
+def test_failing_response_callback_does_not_break_the_push():
+    def callback(token):
+        raise RuntimeError('bot crashed')
+
+    manager = HarvesterManager(response_callback=callback)
+    manager.push_response(Token('pushed', sitekey='key'))
+    assert manager.domain_status()[(None, 'key')]['harvested'] == 1
@@ -0,0 +1,34 @@
+import pathlib
+import statistics
+import sys
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / 'benchmarks'))
+
+import import_time  # noqa: E402
+
+REPEAT = 3
+
+
+@pytest.mark.parametrize('name, statement, forbidden, budget', import_time.SCENARIOS,
+                         ids=[scenario[0] for scenario in import_time.SCENARIOS])
+def test_import_budget(name, statement, forbidden, budget):
+    times = []
+    for _ in range(REPEAT):
+        elapsed, loaded = import_time.run(statement)
+        if elapsed is None:
+            if 'No module named' in ''.join(loaded) and 'harvester' not in ''.join(loaded):
+                pytest.skip(f'optional dependency missing: {"".join(loaded)}')
+            pytest.fail(f'{statement} failed: {"".join(loaded)}')
+        assert not set(loaded) & set(forbidden), f'{name} loaded {", ".join(sorted(set(loaded) & set(forbidden)))}'
+        times.append(elapsed)
+
+    if budget is not None:
+        assert statistics.median(times) <= budget, f'{name} took {statistics.median(times):.1f} ms'
+
+
+def test_import_harvester_loads_no_heavy_dependency():
+    elapsed, loaded = import_time.run('import harvester')
+    assert elapsed is not None, loaded
+    assert loaded == []
@@ -0,0 +1,111 @@
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from harvester import injector
+from harvester.injector import TokenInjector, INJECT_JS, SYNC_JS
+from harvester.token_pool import Token, TOKEN_LIFETIME
+
+RESPONSE = '03A' + 'x' * 300 + "');alert(1);//"
+
+
+class RecordingDriver:
+
+    def __init__(self, result=None):
+        self.result = result
+        self.calls = []
+
+    def execute_script(self, script, *args):
+        self.calls.append((script, args))
+        return self.result
+
+
+@pytest.fixture
+def traced(monkeypatch):
+    events = []
+    monkeypatch.setattr(injector.TRACE, 'emit', lambda event, **fields: events.append((event, fields)))
+    monkeypatch.setattr(injector.TRACE, 'emit_token', lambda event, token, **fields: events.append((event, token)))
+    return events
+
+
+def test_sync_is_a_single_call_with_the_queue_size():
+    driver = RecordingDriver({'clicked': True, 'solved': False, 'injected': False, 'expires_in': None})
+    token_injector = TokenInjector(driver, control_element='box')
+    assert token_injector.sync(3)['clicked']
+    assert driver.calls == [(SYNC_JS, ('box', 3))]
+
+
+def test_inject_passes_the_token_as_an_argument_with_its_ttl(traced):
+    driver = RecordingDriver({'fields': 1, 'callback': True})
+    token_injector = TokenInjector(driver)
+    token = Token(RESPONSE, sitekey='key', url='https://a', lifetime=120)
+
+    assert token_injector.inject(token) == {'fields': 1, 'callback': True}
+    (script, (control_element, response, ttl)), = driver.calls
+    # The token is never formatted into the script source
+    assert script == INJECT_JS
+    assert control_element == token_injector.control_element
+    assert response == RESPONSE
+    assert 115 < ttl <= 120
+    assert traced == [('injected', token)]
+
+
+def test_inject_of_a_raw_response_uses_the_full_lifetime(traced):
+    driver = RecordingDriver()
+    TokenInjector(driver).inject(RESPONSE)
+    TokenInjector(driver).inject(RESPONSE, ttl=30)
+    assert [args[2] for _, args in driver.calls] == [TOKEN_LIFETIME, 30]
+    assert traced[0] == ('injected', {'token': RESPONSE[-16:]})
+
+
+# Just enough DOM for INJECT_JS: one response field and the widget config reCAPTCHA keeps in the page
+DOM_JS = """
+class Node {}
+globalThis.window = globalThis;
+const field = {value: '', innerHTML: ''};
+globalThis.document = {
+    querySelectorAll: () => [field],
+    querySelector: () => (WIDGET),
+};
+let received = null;
+window.shop = {onCaptcha: (token) => { received = token; }};
+window.___grecaptcha_cfg = {clients: {0: {ab: {cd: {element: new Node()}, ef: {sitekey: 'key', callback: CALLBACK}}}}};
+window.box = {clicked: true, expiresAt: 0};
+const result = (function () { SCRIPT }).apply(null, ARGUMENTS);
+console.log(JSON.stringify({result: result, received: received, field: field, state: window.box}));
+"""
+
+
+def run_inject(widget='null', callback="'shop.onCaptcha'"):
+    source = (
+        DOM_JS.replace('SCRIPT', INJECT_JS).replace('ARGUMENTS', json.dumps(['box', RESPONSE, 60]))
+        .replace('WIDGET', widget).replace('CALLBACK', callback)
+    )
+    output = subprocess.run(['node', '-e', source], capture_output=True, text=True, timeout=30, check=True).stdout
+    return json.loads(output)
+
+
+@pytest.mark.skipif(not shutil.which('node'), reason='needs node to run the page script')
+def test_inject_script_fills_the_field_and_finds_the_widget_callback():
+    page = run_inject()
+    assert page['result'] == {'fields': 1, 'callback': True}
+    assert page['received'] == RESPONSE
+    assert page['field'] == {'value': RESPONSE, 'innerHTML': RESPONSE}
+    assert page['state']['clicked'] is False and page['state']['expiresAt'] > 0
+
+
+@pytest.mark.skipif(not shutil.which('node'), reason='needs node to run the page script')
+def test_inject_script_prefers_the_data_callback_attribute():
+    widget = "{getAttribute: () => 'shop.onCaptcha'}"
+    page = run_inject(widget=widget, callback="() => { throw new Error('wrong callback'); }")
+    assert page['result'] == {'fields': 1, 'callback': True}
+    assert page['received'] == RESPONSE
+
+
+@pytest.mark.skipif(not shutil.which('node'), reason='needs node to run the page script')
+def test_inject_script_without_a_callback_only_fills_the_field():
+    page = run_inject(callback='undefined')
+    assert page['result'] == {'fields': 1, 'callback': False}
+    assert page['received'] is None and page['field']['value'] == RESPONSE
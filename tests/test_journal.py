@@ -0,0 +1,95 @@
+import logging
+import time
+
+from harvester.journal import TokenJournal, FSYNC_NEVER
+from harvester.token_pool import Token
+
+
+def journal_at(path, **kwargs):
+    kwargs.setdefault('fsync', FSYNC_NEVER)
+    return TokenJournal(path, **kwargs)
+
+
+def test_appended_tokens_survive_a_reload_and_removed_ones_do_not(tmp_path):
+    path = tmp_path / 'tokens.journal'
+    journal = journal_at(path)
+    assert journal.load() == []
+    kept = Token('kept\twith\ttabs\nand\\newlines', sitekey='key', url='https://a', harvester_id=3)
+    gone = Token('gone', sitekey='key')
+    journal.append(kept)
+    journal.append(gone)
+    journal.append(kept)
+    journal.remove(gone)
+    journal.close()
+
+    restored = journal_at(path).load()
+    assert [token.response for token in restored] == [kept.response]
+    token = restored[0]
+    assert (token.sitekey, token.url, token.harvester_id) == ('key', 'https://a', 3)
+    assert abs(token.ttl() - kept.ttl()) < 0.1
+
+
+def test_expired_tokens_are_not_restored(tmp_path):
+    path = tmp_path / 'tokens.journal'
+    journal = journal_at(path)
+    journal.load()
+    journal.append(Token('stale', sitekey='key', captured_at=time.monotonic() - 200))
+    journal.append(Token('fresh', sitekey='key'))
+    journal.close()
+
+    assert [token.response for token in journal_at(path).load()] == ['fresh']
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    path = tmp_path / 'tokens.journal'
+    journal = journal_at(path)
+    journal.load()
+    journal.append(Token('whole', sitekey='key'))
+    journal.close()
+    with open(path, 'ab') as f:
+        f.write(b'A\t1\t1700000000.000\t120.0\t\tkey\t\thalf-writ')
+
+    reloaded = journal_at(path)
+    assert [token.response for token in reloaded.load()] == ['whole']
+    assert reloaded.stats()['corrupt_lines'] == 1
+    # The torn line is gone after the rewrite on load
+    assert path.read_bytes().count(b'\n') == 1
+    reloaded.close()
+
+
+def test_compaction_keeps_only_live_tokens(tmp_path):
+    path = tmp_path / 'tokens.journal'
+    # Compacted by hand, the background thread never gets there first
+    journal = journal_at(path, compact_min=10 ** 6)
+    journal.load()
+    tokens = [Token(f'token-{i}', sitekey='key') for i in range(10)]
+    for token in tokens:
+        journal.append(token)
+    for token in tokens[:8]:
+        journal.remove(token)
+    assert journal.stats()['lines'] == 18
+
+    journal.compact()
+    assert journal.stats()['lines'] == 2
+    assert len(path.read_bytes().splitlines()) == 2
+    # Ids keep counting past the compacted ones, so later deletes hit the right lines
+    journal.remove(tokens[8])
+    journal.close()
+    assert [token.response for token in journal_at(path).load()] == ['token-9']
+
+
+def test_append_before_load_keeps_the_tokens_on_disk(tmp_path, caplog):
+    path = tmp_path / 'tokens.journal'
+    journal = journal_at(path)
+    journal.load()
+    journal.append(Token('on-disk', sitekey='key'))
+    journal.close()
+
+    unopened = journal_at(path)
+    with caplog.at_level(logging.WARNING):
+        unopened.append(Token('early', sitekey='key'))
+        unopened.append(Token('early-2', sitekey='key'))
+    assert len([record for record in caplog.records if 'not open' in record.message]) == 1
+
+    assert [token.response for token in unopened.load()] == ['on-disk']
+    unopened.close()
@@ -0,0 +1,23 @@
+from harvester.metrics import Registry
+
+
+def test_labels_hit_the_fast_path_for_non_string_values():
+    counter = Registry().counter('harvested_total', 'Tokens harvested', ('harvester',))
+    child = counter.labels(7)
+    assert counter._aliases[(7,)] is child
+    assert counter.labels(7) is child
+    assert counter.labels('7') is child
+
+    counter.labels(7).inc()
+    counter.labels('7').inc()
+    assert counter.snapshot() == {'7': 2.0}
+    assert counter.render() == ['harvested_total{harvester="7"} 2.0']
+
+
+def test_remove_forgets_every_alias():
+    counter = Registry().counter('harvested_total', 'Tokens harvested', ('harvester',))
+    counter.labels(7).inc()
+    counter.labels('7').inc()
+    counter.remove(7)
+    assert counter.snapshot() == {}
+    assert counter.labels(7) is not None and counter.snapshot() == {'7': 0.0}
@@ -0,0 +1,90 @@
+import time
+import types
+
+from fakes import FakeRecaptchaServer, CaptchaSolver, FakeHarvester
+from harvester import planner
+from harvester.harvester_manager import HarvesterManager
+from harvester.planner import DropPlan, DropPlanner
+
+
+class StubManager:
+    """Just what the planner reads, harvests are counted by hand"""
+
+    def __init__(self):
+        self.planner = None
+        self.harvesters = []
+        self.harvested = 0
+
+    def domain_status(self):
+        return {('https://a', 'key'): {'harvested': self.harvested}}
+
+    def token_ttls(self, sitekey, url=None):
+        return []
+
+
+def make_plan(**kwargs):
+    arguments = dict(
+        name='drop', url='https://a', sitekey='key', release_at=time.time() + 600, demand=12, min_ttl=10,
+        solve_time=30, max_harvesters=8, launch_time=20, nudge_lead=60, linger=30, lifetime=120,
+    )
+    arguments.update(kwargs)
+    return DropPlan(**arguments)
+
+
+def test_plan_solves_the_demand_inside_the_window():
+    plan = make_plan()
+    # 110s window at 30s per token needs 4 harvesters, which take 90s for 12 tokens
+    assert plan.harvesters == 4
+    assert plan.harvest_seconds == 90
+    assert plan.expected_tokens == 12
+    assert plan.solve_offset == -90
+    assert plan.open_offset == -110
+
+
+def test_planned_ramps_up_to_release_and_is_empty_after():
+    plan = make_plan()
+    assert plan.planned(-100) == 0
+    assert plan.planned(-45) == 6
+    assert plan.planned(0) == 12
+    assert plan.planned(1) == 0
+
+
+def test_measured_solve_time_uses_the_time_actually_spent_solving(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(planner, 'time', types.SimpleNamespace(monotonic=lambda: clock[0], time=time.time))
+    manager = StubManager()
+    manager.harvesters = [types.SimpleNamespace(url='https://a', sitekey='key', closed=False) for _ in range(4)]
+    drop_planner = DropPlanner(manager)
+    plan = make_plan()
+
+    manager.harvested = 3
+    drop_planner._start_solving(plan)
+    # Solving started late, 40s before release instead of the planned 90s
+    clock[0] += 40
+    manager.harvested = 11
+    drop_planner._record_release(plan)
+    drop_planner.stop()
+
+    assert plan.measured_solve_time == 4 * 40 / 8
+    assert drop_planner.solve_time('https://a', 'key') == 20
+
+
+def test_harvesters_over_the_quota_are_never_launched():
+    solver = CaptchaSolver(FakeRecaptchaServer())
+
+    class FakeManager(HarvesterManager):
+        def create_harvester(self, url, sitekey, **kwargs):
+            return FakeHarvester(url, sitekey, solver, push_capture=False)
+
+    manager = FakeManager()
+    manager.set_quota('https://a', 'key', 2)
+    drop_planner = DropPlanner(manager)
+    launched = []
+    drop_planner._launcher = types.SimpleNamespace(launch=launched.extend, shutdown=lambda: None)
+    plan = make_plan()
+
+    drop_planner._open(plan)
+    drop_planner.stop()
+    assert plan.harvesters == 4
+    assert len(launched) == 2 and plan.opened == launched
+    assert manager.harvesters == launched
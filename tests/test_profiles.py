@@ -0,0 +1,129 @@
+import errno
+import sys
+
+import pytest
+
+from harvester import profiles
+from harvester.profiles import ProfileProvisioner, clone_tree, CLONE_MARKER, GOLDEN_MARKER
+
+
+def build_golden(path):
+    (path / 'Default').mkdir()
+    (path / 'Default' / 'Cookies').write_bytes(b'cookies')
+    (path / 'Default' / 'Cache').mkdir()
+    (path / 'Default' / 'Cache' / 'data_0').write_bytes(b'x' * 100)
+    (path / 'SingletonLock').write_text('host-1')
+    (path / 'Local State').write_text('{}')
+
+
+@pytest.fixture
+def no_reflink(monkeypatch):
+    monkeypatch.setattr(profiles, '_reflink', lambda src, dst: False)
+
+
+def test_clone_tree_copies_when_reflink_is_unsupported(tmp_path, no_reflink):
+    src, dst = tmp_path / 'src', tmp_path / 'dst'
+    src.mkdir()
+    build_golden(src)
+    (src / GOLDEN_MARKER).write_text('{}')
+
+    stats = clone_tree(src, dst)
+    assert stats == {'reflinked': 0, 'copied': 2, 'bytes_copied': len(b'cookies') + 2}
+    assert (dst / 'Default' / 'Cookies').read_bytes() == b'cookies'
+    assert (dst / 'Local State').read_text() == '{}'
+    # Caches, Chrome's locks and the golden marker are left out
+    assert not (dst / 'Default' / 'Cache').exists()
+    assert not (dst / 'SingletonLock').exists()
+    assert not (dst / GOLDEN_MARKER).exists()
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='FICLONE ioctl')
+def test_reflink_falls_back_and_remembers_the_device(tmp_path, monkeypatch):
+    import fcntl
+    calls = []
+
+    def ioctl(fd, request, arg):
+        calls.append(request)
+        raise OSError(errno.EOPNOTSUPP, 'not supported')
+
+    monkeypatch.setattr(fcntl, 'ioctl', ioctl)
+    monkeypatch.setattr(profiles, '_reflink_unsupported', set())
+    src = tmp_path / 'a'
+    src.write_bytes(b'data')
+
+    assert profiles._reflink(str(src), str(tmp_path / 'b')) is False
+    assert not (tmp_path / 'b').exists()
+    # The filesystem is not asked again
+    assert profiles._reflink(str(src), str(tmp_path / 'c')) is False
+    assert calls == [profiles.FICLONE]
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='FICLONE ioctl')
+def test_reflink_raises_unexpected_errors(tmp_path, monkeypatch):
+    import fcntl
+
+    def ioctl(fd, request, arg):
+        raise OSError(errno.ENOSPC, 'no space left')
+
+    monkeypatch.setattr(fcntl, 'ioctl', ioctl)
+    monkeypatch.setattr(profiles, '_reflink_unsupported', set())
+    src = tmp_path / 'a'
+    src.write_bytes(b'data')
+
+    with pytest.raises(OSError):
+        profiles._reflink(str(src), str(tmp_path / 'b'))
+    assert not (tmp_path / 'b').exists()
+
+
+def test_slots_are_cloned_once_per_golden_generation(tmp_path, no_reflink):
+    provisioner = ProfileProvisioner(tmp_path)
+    provisioner.ensure_golden(build_golden)
+
+    profile = provisioner.clone(1)
+    assert (profile / 'Default' / 'Cookies').read_bytes() == b'cookies'
+    assert (profile / CLONE_MARKER).exists()
+
+    # Restarting a harvester keeps what its browser wrote to the profile
+    (profile / 'Default' / 'History').write_bytes(b'visited')
+    assert provisioner.clone(1) == profile
+    assert (profile / 'Default' / 'History').exists()
+    assert list(provisioner.clone_times) == [1]
+
+    # Logging the golden profile in rebuilds it, and the stale clone is replaced
+    provisioner.ensure_golden(lambda path: (path / 'Default' / 'Login Data').write_bytes(b'login'), logged_in=True)
+    assert provisioner.golden_state()['generation'] == 2
+    profile = provisioner.clone(1)
+    assert (profile / 'Default' / 'Login Data').read_bytes() == b'login'
+    assert not (profile / 'Default' / 'History').exists()
+
+
+def test_golden_is_not_rebuilt_when_already_good_enough(tmp_path):
+    provisioner = ProfileProvisioner(tmp_path)
+    provisioner.ensure_golden(logged_in=True)
+    built = []
+    provisioner.ensure_golden(built.append)
+    provisioner.ensure_golden(built.append, logged_in=True)
+    assert built == []
+    assert provisioner.golden_state()['generation'] == 1
+
+
+def test_profile_from_before_cloning_is_kept(tmp_path, no_reflink):
+    provisioner = ProfileProvisioner(tmp_path)
+    legacy = provisioner.slots_dir / '3'
+    legacy.mkdir(parents=True)
+    (legacy / 'Cookies').write_bytes(b'old login')
+
+    assert provisioner.clone(3) == legacy
+    assert (legacy / 'Cookies').read_bytes() == b'old login'
+    assert provisioner.clone_times == {}
+
+
+def test_identical_extensions_share_one_directory(tmp_path):
+    provisioner = ProfileProvisioner(tmp_path)
+    first = provisioner.extension_dir('proxy', {'manifest.json': '{}', 'background.js': 'a'})
+    second = provisioner.extension_dir('proxy', {'background.js': b'a', 'manifest.json': b'{}'})
+    other = provisioner.extension_dir('proxy', {'manifest.json': '{}', 'background.js': 'b'})
+
+    assert first == second != other
+    assert (first / 'background.js').read_text() == 'a'
+    assert sorted(path.name for path in provisioner.extensions_dir.iterdir()) == sorted({first.name, other.name})
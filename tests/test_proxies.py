@@ -0,0 +1,134 @@
+import base64
+import socket
+import time
+from socketserver import ThreadingTCPServer, StreamRequestHandler
+from threading import Thread
+
+import pytest
+
+from harvester.proxies import Proxy, ProxyPool
+
+
+class _Handler(StreamRequestHandler):
+    def handle(self):
+        request = []
+        while True:
+            line = self.rfile.readline(8192)
+            if not line or line in (b'\r\n', b'\n'):
+                break
+            request.append(line.decode('latin-1'))
+        proxy = self.server.stand_in
+        proxy.requests.append(request)
+        time.sleep(proxy.latency)
+        if proxy.credentials and f'Proxy-Authorization: Basic {proxy.credentials}\r\n' not in request:
+            self.wfile.write(b'HTTP/1.1 407 Proxy Authentication Required\r\n\r\n')
+        else:
+            self.wfile.write(b'HTTP/1.1 200 Connection established\r\n\r\n')
+
+
+class _Server(ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class StandInProxy:
+    """Loopback proxy answering CONNECT after `latency` seconds without opening the tunnel"""
+
+    def __init__(self, latency=0.0, username=None, password=None):
+        self.latency = latency
+        self.credentials = base64.b64encode(f'{username}:{password}'.encode()).decode() if username else None
+        self.requests = []
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.stand_in = self
+        self.port = self.server.server_address[1]
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def address(self):
+        return f'127.0.0.1:{self.port}'
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def refusing_address():
+    """Loopback port nothing listens on"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f'127.0.0.1:{sock.getsockname()[1]}'
+
+
+@pytest.fixture
+def stand_ins():
+    proxies = []
+
+    def start(*args, **kwargs):
+        proxy = StandInProxy(*args, **kwargs)
+        proxies.append(proxy)
+        return proxy
+
+    yield start
+    for proxy in proxies:
+        proxy.stop()
+
+
+def test_health_check_opens_a_connect_tunnel(stand_ins):
+    healthy = stand_ins()
+    pool = ProxyPool([healthy.address], check_url='https://www.google.com/', check_timeout=1.0)
+
+    latency = pool.check(Proxy.parse(healthy.address))
+
+    assert latency is not None
+    assert healthy.requests[0][0] == 'CONNECT www.google.com:443 HTTP/1.1\r\n'
+
+
+def test_ranking_prefers_healthy_and_fast_proxies(stand_ins):
+    slow, fast = stand_ins(latency=0.05), stand_ins()
+    refused = refusing_address()
+    pool = ProxyPool([slow.address, refused, fast.address], check_timeout=1.0, max_failures=3)
+
+    results = pool.check_all()
+
+    assert results[Proxy.parse(refused)] is None
+    assert pool.proxies() == [Proxy.parse(fast.address), Proxy.parse(slow.address), Proxy.parse(refused)]
+
+
+def test_refusing_proxy_is_evicted_after_max_failures(stand_ins):
+    healthy = stand_ins()
+    refused = refusing_address()
+    pool = ProxyPool([healthy.address, refused], check_timeout=1.0, max_failures=2)
+
+    pool.check_all()
+    assert Proxy.parse(refused) in pool.proxies()
+    pool.check_all()
+
+    assert pool.proxies() == [Proxy.parse(healthy.address)]
+    assert pool.evicted() == [Proxy.parse(refused)]
+    assert pool.stats()['evicted'][0]['failures'] == 2
+    assert pool.acquire() == Proxy.parse(healthy.address)
+
+
+def test_wrong_credentials_count_as_failures(stand_ins):
+    authed = stand_ins(username='user', password='right')
+    right = Proxy.parse(f'{authed.address}:user:right')
+    wrong = Proxy.parse(f'{authed.address}:user:wrong')
+    pool = ProxyPool([right, wrong], check_timeout=1.0, max_failures=1)
+
+    pool.check_all()
+
+    assert pool.proxies() == [right]
+    assert pool.evicted() == [wrong]
+    assert 'tunnel refused: HTTP/1.1 407' in pool.stats()['evicted'][0]['error']
+
+
+def test_success_resets_failures_and_acquire_spreads_load(stand_ins):
+    first, second = stand_ins(), stand_ins()
+    pool = ProxyPool([first.address, second.address], check_timeout=1.0, max_failures=2)
+    proxy = Proxy.parse(first.address)
+    pool.report(proxy, False, error='page load timed out')
+    pool.report(proxy, True, latency=0.01)
+    pool.report(Proxy.parse(second.address), True, latency=0.01)
+
+    assert pool.stats()['evictions'] == 0
+    assert {pool.acquire(), pool.acquire()} == {proxy, Proxy.parse(second.address)}
@@ -0,0 +1,94 @@
+import threading
+import time
+
+from harvester.scheduler import TickScheduler
+
+
+class Ticker:
+    """Harvester stand-in whose tick blocks until released"""
+
+    def __init__(self, block=False, fail=False):
+        self.ticks = 0
+        self.fail = fail
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+        self.started = threading.Event()
+
+    def tick(self):
+        self.started.set()
+        self.release.wait(5)
+        self.ticks += 1
+        if self.fail:
+            raise RuntimeError('page crashed')
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not met in time'
+        time.sleep(0.005)
+
+
+def test_a_harvester_is_queued_or_in_flight_at_most_once():
+    scheduler = TickScheduler(workers=2)
+    scheduler.start()
+    slow = Ticker(block=True)
+    assert scheduler.submit(slow)
+    slow.started.wait(1)
+    assert not scheduler.submit(slow)
+    assert scheduler.stats()['busy'] == 1
+
+    slow.release.set()
+    wait_for(lambda: scheduler.stats()['ticks'] == 1)
+    assert scheduler.submit(slow)
+    wait_for(lambda: slow.ticks == 2)
+    scheduler.stop()
+
+
+def test_failing_tick_does_not_kill_its_worker():
+    scheduler = TickScheduler(workers=1)
+    scheduler.start()
+    failing, healthy = Ticker(fail=True), Ticker()
+    scheduler.submit(failing)
+    scheduler.submit(healthy)
+    wait_for(lambda: healthy.ticks == 1)
+    assert scheduler.stats()['workers'] == 1
+    scheduler.stop()
+
+
+def test_overdue_tick_is_reported_and_stuck_worker_replaced():
+    stuck = []
+    scheduler = TickScheduler(workers=1, tick_deadline=0.05, stuck_timeout=0.1, stuck_callback=stuck.append)
+    scheduler.start()
+    hung, next_one = Ticker(block=True), Ticker()
+    scheduler.submit(hung)
+    hung.started.wait(1)
+
+    time.sleep(0.06)
+    assert scheduler.check_stuck() == [hung]
+    assert scheduler.stats()['overruns'] == 1 and not stuck
+
+    time.sleep(0.05)
+    scheduler.check_stuck()
+    assert stuck == [hung]
+    stats = scheduler.stats()
+    assert stats['replaced_workers'] == 1 and stats['abandoned_workers'] == 1 and stats['workers'] == 1
+
+    # The replacement keeps ticking the other harvesters while the hung tick is stuck
+    scheduler.submit(next_one)
+    wait_for(lambda: next_one.ticks == 1)
+
+    # Once the hung tick returns its worker retires instead of growing the pool
+    hung.release.set()
+    wait_for(lambda: scheduler.stats()['abandoned_workers'] == 0)
+    assert scheduler.stats()['workers'] == 1 and scheduler.stats()['overruns'] == 1
+    scheduler.stop()
+
+
+def test_stopped_scheduler_rejects_ticks():
+    scheduler = TickScheduler(workers=1)
+    assert not scheduler.submit(Ticker())
+    scheduler.start()
+    scheduler.stop()
+    assert not scheduler.submit(Ticker())
@@ -0,0 +1,228 @@
+import asyncio
+import base64
+import json
+import os
+
+from harvester import websocket
+from harvester.harvester_manager import HarvesterManager
+from harvester.server import TokenServer
+from harvester.token_pool import Token
+
+
+class StubManager(HarvesterManager):
+    """Manager without harvesters, the test pushes its tokens"""
+
+    def start_harvesters(self, *args, **kwargs):
+        raise AssertionError('the server must not start harvesters')
+
+    def tick(self):
+        raise AssertionError('the server must not tick harvesters')
+
+
+def serve(scenario):
+    """Run scenario(server, manager) against a TokenServer on a free loopback port"""
+    async def main():
+        manager = StubManager()
+        server = TokenServer(manager, port=0, max_wait=5.0)
+        await server.start()
+        try:
+            await asyncio.wait_for(scenario(server, manager), 10.0)
+        finally:
+            await server.stop()
+
+    asyncio.run(main())
+
+
+async def request(server, target, headers=''):
+    """Send one GET and return (status, headers, body, reader, writer)"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+    writer.write(f'GET {target} HTTP/1.1\r\nHost: localhost\r\n{headers}\r\n'.encode('latin-1'))
+    await writer.drain()
+    status, response_headers, body = await read_response(reader)
+    return status, response_headers, body, reader, writer
+
+
+async def read_response(reader):
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    status = int(head[0].split(' ')[1])
+    headers = {}
+    for line in head[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length') or 0)
+    body = await reader.readexactly(length) if length else b''
+    return status, headers, body
+
+
+def push(manager, response, sitekey='key', url='https://a'):
+    manager.push_response(Token(response, sitekey=sitekey, url=url))
+
+
+def test_long_poll_waits_for_a_token():
+    async def scenario(server, manager):
+        waiting = asyncio.ensure_future(request(server, '/token?sitekey=key&timeout=5'))
+        await asyncio.sleep(0.1)
+        assert not waiting.done()
+
+        push(manager, 'other-site', sitekey='other')
+        push(manager, 'solved')
+        status, _, body, _, writer = await waiting
+        writer.close()
+
+        assert status == 200
+        assert json.loads(body)['response'] == 'solved'
+        assert manager.token_count('other') == 1
+
+    serve(scenario)
+
+
+def test_queued_token_is_served_right_away_on_a_kept_alive_connection():
+    async def scenario(server, manager):
+        push(manager, 'first')
+        push(manager, 'second')
+        status, headers, body, reader, writer = await request(server, '/token?sitekey=key')
+        assert status == 200 and headers['connection'] == 'keep-alive'
+        assert json.loads(body)['response'] == 'first'
+
+        writer.write(b'GET /token?sitekey=key HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        status, _, body = await read_response(reader)
+        writer.close()
+        assert status == 200 and json.loads(body)['response'] == 'second'
+
+    serve(scenario)
+
+
+def test_long_poll_times_out_with_no_content():
+    async def scenario(server, manager):
+        status, _, body, _, writer = await request(server, '/token?sitekey=key&timeout=0.2')
+        writer.close()
+        assert status == 204 and body == b''
+
+        # The timed out waiter must not swallow the next token
+        push(manager, 'late')
+        assert manager.token_count('key') == 1
+
+    serve(scenario)
+
+
+def test_invalid_parameters_and_unknown_paths():
+    async def scenario(server, manager):
+        status, _, _, _, writer = await request(server, '/token?min_ttl=soon')
+        writer.close()
+        assert status == 400
+
+        status, _, _, _, writer = await request(server, '/nowhere')
+        writer.close()
+        assert status == 404
+
+    serve(scenario)
+
+
+def test_status_reports_the_pool():
+    async def scenario(server, manager):
+        push(manager, 'one')
+        push(manager, 'two', sitekey='other', url='https://b')
+        status, headers, body, _, writer = await request(server, '/status', 'Connection: close\r\n')
+        writer.close()
+
+        assert status == 200 and headers['content-type'] == 'application/json'
+        report = json.loads(body)
+        assert report['tokens'] == 2
+        assert report['sitekeys'] == {'key': 1, 'other': 1}
+        assert {(domain['url'], domain['sitekey']) for domain in report['domains']} == {
+            ('https://a', 'key'), ('https://b', 'other')
+        }
+
+    serve(scenario)
+
+
+def test_websocket_stream_handshake_and_frames():
+    async def scenario(server, manager):
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        status, headers, _, reader, writer = await request(
+            server, '/tokens?sitekey=key',
+            f'Upgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n'
+        )
+        assert status == 101
+        assert headers['sec-websocket-accept'] == websocket.accept_key(key)
+
+        push(manager, 'streamed-1')
+        push(manager, 'streamed-2')
+        for expected in ('streamed-1', 'streamed-2'):
+            opcode, payload = await websocket.read_frame(reader)
+            assert opcode == websocket.OP_TEXT
+            assert json.loads(payload)['response'] == expected
+
+        writer.write(websocket.encode_frame(b'hello', websocket.OP_PING, mask=True))
+        assert await websocket.read_frame(reader) == (websocket.OP_PONG, b'hello')
+
+        writer.write(websocket.encode_frame(b'\x03\xe8', websocket.OP_CLOSE, mask=True))
+        assert await websocket.read_frame(reader) == (websocket.OP_CLOSE, b'\x03\xe8')
+        writer.close()
+
+        # Tokens harvested after the stream closed stay in the pool
+        await asyncio.sleep(0.05)
+        push(manager, 'after-close')
+        await asyncio.sleep(0.05)
+        assert manager.token_count('key') == 1
+
+    serve(scenario)
+
+
+def test_websocket_without_key_is_rejected():
+    async def scenario(server, manager):
+        status, _, _, _, writer = await request(server, '/tokens', 'Upgrade: websocket\r\nConnection: Upgrade\r\n')
+        writer.close()
+        assert status == 400
+
+    serve(scenario)
+
+
+def test_client_leaving_a_long_poll_does_not_lose_the_next_token():
+    async def scenario(server, manager):
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        writer.write(b'GET /token?sitekey=key&timeout=5 HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        await writer.drain()
+        await asyncio.sleep(0.1)
+        writer.close()
+        await asyncio.sleep(0.1)
+
+        push(manager, 'after-disconnect')
+        await asyncio.sleep(0.05)
+        assert manager.token_count('key') == 1
+        assert manager.domain_status()[('https://a', 'key')]['consumed'] == 0
+
+    serve(scenario)
+
+
+def test_request_pipelined_behind_a_long_poll_is_served():
+    async def scenario(server, manager):
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        writer.write(b'GET /token?sitekey=key&timeout=5 HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        await writer.drain()
+        await asyncio.sleep(0.1)
+        writer.write(b'GET /status HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        await writer.drain()
+        await asyncio.sleep(0.1)
+
+        push(manager, 'solved')
+        status, _, body = await read_response(reader)
+        assert status == 200 and json.loads(body)['response'] == 'solved'
+        status, _, body = await read_response(reader)
+        writer.close()
+        assert status == 200 and json.loads(body)['tokens'] == 0
+
+    serve(scenario)
+
+
+def test_websocket_with_invalid_filters_is_rejected_before_upgrading():
+    async def scenario(server, manager):
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        upgrade = f'Upgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n'
+        for target in ('/tokens?sitekey=key&min_ttl=soon', '/tokens?sitekey=key&min_ttl=-1', '/tokens?sitekey=key&min_ttl=nan'):
+            status, _, body, _, writer = await request(server, target, upgrade)
+            writer.close()
+            assert status == 400 and json.loads(body) == {'error': 'invalid parameters'}
+
+    serve(scenario)
@@ -0,0 +1,207 @@
+import multiprocessing
+import os
+import threading
+import time
+import types
+
+import pytest
+
+from multiprocessing.connection import Connection
+
+from fakes import FakeHarvester
+from harvester import harvester as harvester_module
+from harvester import sharding
+from harvester.sharding import ShardedHarvesterManager, RemoteHarvester, MSG_STATE, MSG_STARTED, CMD_STOP
+
+
+class ThreadProcess:
+    """Runs a shard's entry point on a thread, the pipe protocol is the same as across processes"""
+
+    def __init__(self, target, args, name, daemon):
+        # The broker closes its copy of the child end once the shard started, like after a fork
+        args = (Connection(os.dup(args[0].fileno())),) + args[1:]
+        self._thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        self.pid = None
+        self.exitcode = None
+
+    def start(self):
+        self._thread.start()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self.exitcode = 0
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def terminate(self):
+        pass
+
+
+@pytest.fixture
+def sharded(monkeypatch, solver):
+    class ShardHarvester(FakeHarvester):
+        # The shard builds Harvester(url=..., sitekey=..., **harvester_kwargs) itself
+        def __init__(self, url, sitekey, **kwargs):
+            super().__init__(url, sitekey, solver, latency=0, **kwargs)
+
+    context = types.SimpleNamespace(Pipe=multiprocessing.Pipe, Process=ThreadProcess)
+    monkeypatch.setattr(sharding.multiprocessing, 'get_context', lambda method: context)
+    monkeypatch.setattr(harvester_module, 'Harvester', ShardHarvester)
+    managers = []
+
+    def make(**kwargs):
+        manager = ShardedHarvesterManager(delay=0.02, stop_timeout=5, **kwargs)
+        managers.append(manager)
+        return manager
+
+    yield make
+    for manager in managers:
+        manager.stop()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def run_loop(manager):
+    thread = threading.Thread(target=manager.main_loop, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_harvesters_go_to_the_least_loaded_shard(sharded, recaptcha_server):
+    manager = sharded(shards=2)
+    harvesters = [
+        manager.create_harvester(recaptcha_server.page_url(n), recaptcha_server.sitekey, push_capture=False)
+        for n in range(3)
+    ]
+    assert [harvester.shard.index for harvester in harvesters] == [0, 1, 0]
+    assert [harvester.id for harvester in harvesters] == [0, 1, 2]
+    assert not any(harvester.ready for harvester in harvesters)
+
+
+def test_shards_stream_tokens_into_the_broker_pool(sharded, recaptcha_server):
+    manager = sharded(shards=2)
+    url, sitekey = recaptcha_server.page_url(0), recaptcha_server.sitekey
+    harvesters = [manager.create_harvester(url, sitekey, push_capture=False) for _ in range(2)]
+    for harvester in harvesters:
+        assert manager.add_harvester(harvester)
+    manager.start_harvesters(concurrency=2)
+    assert all(harvester.ready and not harvester.closed for harvester in harvesters)
+
+    run_loop(manager)
+    wait_for(lambda: manager.token_count(sitekey, url=url) >= 4)
+    token = manager.take_response(sitekey, url=url)
+    assert token.response in recaptcha_server.issued
+    assert token.harvester_id in {harvester.id for harvester in harvesters}
+    assert 100 < token.ttl() <= 120
+
+    # Tick state is mirrored from the shards
+    wait_for(lambda: all(harvester.ticks > 0 for harvester in harvesters))
+    shards = manager.stats()['shards']
+    assert [shard['harvesters'] for shard in shards] == [1, 1]
+    assert all(shard['alive'] and shard['tokens'] > 0 and shard['spawns'] == 1 for shard in shards)
+
+
+def test_dead_shard_closes_its_harvesters_and_respawns_on_restart(sharded, recaptcha_server):
+    manager = sharded(shards=1)
+    url, sitekey = recaptcha_server.page_url(0), recaptcha_server.sitekey
+    harvester = manager.create_harvester(url, sitekey, push_capture=False)
+    manager.add_harvester(harvester)
+    harvester.start()
+    closed = []
+    manager.closed_callback = closed.append
+
+    # The shard exits without the broker asking it to
+    shard = harvester.shard
+    shard.send((CMD_STOP,), spawn=False)
+    wait_for(lambda: harvester.closed)
+    assert not harvester.ready and not shard.stats()['alive']
+    manager.tick()
+    assert closed == [harvester] and manager.harvesters == []
+
+    harvester.restart()
+    assert harvester.ready and not harvester.closed and harvester.generation == 1
+    assert shard.stats()['spawns'] == 2
+    assert manager.add_harvester(harvester)
+    run_loop(manager)
+    wait_for(lambda: manager.token_count(sitekey, url=url) > 0)
+
+
+def test_removed_harvester_is_no_longer_ticked(sharded, recaptcha_server):
+    manager = sharded(shards=1)
+    harvester = manager.create_harvester(recaptcha_server.page_url(0), recaptcha_server.sitekey, push_capture=False)
+    manager.add_harvester(harvester)
+    harvester.start()
+    wait_for(lambda: harvester.ticks > 0)
+
+    manager.remove_harvester(harvester)
+    time.sleep(2 * sharding.STATE_INTERVAL)
+    ticks = harvester.ticks
+    time.sleep(2 * sharding.STATE_INTERVAL)
+    assert harvester.ticks == ticks
+
+
+class StubShard:
+    """Shard that answers a start with the given error, or never when answer is False"""
+
+    def __init__(self, running=True, answer=None):
+        self.index = 0
+        self.running = running
+        self.answer = answer
+        self.harvester = None
+
+    def send(self, message, spawn=True):
+        if self.running and self.answer is not False:
+            threading.Timer(0.01, self.harvester._on_started, (self.answer,)).start()
+        return self.running
+
+
+def remote(shard, launch_timeout=5.0):
+    harvester = RemoteHarvester(shard, 7, 'https://a', 'key', {}, launch_timeout)
+    shard.harvester = harvester
+    return harvester
+
+
+def test_remote_start_reports_a_failed_launch():
+    harvester = remote(StubShard(answer='chrome crashed'))
+    with pytest.raises(RuntimeError, match='chrome crashed'):
+        harvester.start()
+    assert harvester.closed and not harvester.ready and not harvester.launching
+
+
+def test_remote_start_times_out_on_a_silent_shard():
+    harvester = remote(StubShard(answer=False), launch_timeout=0.05)
+    with pytest.raises(RuntimeError, match='no answer'):
+        harvester.start()
+    assert harvester.closed
+
+    harvester = remote(StubShard(running=False))
+    with pytest.raises(RuntimeError, match='not running'):
+        harvester.start()
+
+
+def test_state_reports_skip_launching_harvesters():
+    manager = ShardedHarvesterManager(shards=1)
+    shard = manager.shards[0]
+    harvester = remote(StubShard())
+    shard.harvesters[harvester.id] = harvester
+    harvester.ready = True
+
+    manager._on_message(shard, (MSG_STATE, [(7, False, True, 12.5, 3)]))
+    assert (harvester.ticking, harvester.tick_started, harvester.ticks) == (True, 12.5, 3)
+    harvester.launching = True
+    manager._on_message(shard, (MSG_STATE, [(7, True, False, 13.0, 4)]))
+    assert harvester.ready and harvester.ticks == 3
+    harvester.launching = False
+    manager._on_message(shard, (MSG_STATE, [(7, True, False, 13.0, 4)]))
+    assert harvester.closed and not harvester.ready
+
+    manager._on_message(shard, (MSG_STARTED, 7, None))
+    assert harvester.ready and not harvester.closed
+    manager.stop()
@@ -0,0 +1,159 @@
+import json
+import time
+
+import requests
+
+SITEKEY = '6LcAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+WIDGET = f'<div class="g-recaptcha" data-sitekey="{SITEKEY}"></div>'.encode()
+
+from harvester.sitekeys import SitekeyDiscovery, scan_stream, scan_response, find_sitekey, TYPE_V2, TYPE_V3, TYPE_INVISIBLE
+
+
+class StubResponse:
+
+    def __init__(self, status_code=200, body=b'', headers=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = headers or {}
+        self.encoding = 'utf-8'
+        self.body = body
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class StubSession:
+    """Answers every get with the next queued response, or raises it"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        self.requests.append((url, headers))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def test_discovers_pages_concurrently_and_caches_them(tmp_path, recaptcha_server):
+    urls = [recaptcha_server.page_url(n) for n in range(6)]
+    cache_file = tmp_path / 'sitekeys.json'
+    discovery = SitekeyDiscovery(cache_file=cache_file, workers=4)
+
+    found = discovery.discover(urls + urls[:2])
+    assert list(found) == urls
+    assert all(entry['sitekey'] == recaptcha_server.sitekey and entry['type'] == TYPE_V2 for entry in found.values())
+    assert discovery.fetches == 6
+
+    # Fresh entries are served from memory, and from disk by the next process
+    assert discovery.get(urls[0]) == recaptcha_server.sitekey
+    assert discovery.fetches == 6
+    reloaded = SitekeyDiscovery(cache_file=cache_file)
+    assert reloaded.get(urls[3]) == recaptcha_server.sitekey
+    assert reloaded.fetches == 0
+    assert set(json.loads(cache_file.read_text())) == set(urls)
+
+
+def test_missing_page_is_not_cached(tmp_path, recaptcha_server):
+    discovery = SitekeyDiscovery(cache_file=tmp_path / 'sitekeys.json')
+    url = f'http://{recaptcha_server.host}:{recaptcha_server.port}/missing'
+    assert discovery.discover([url]) == {url: None}
+    assert discovery.get(url) is None
+    assert discovery.fetches == 0
+
+
+def test_page_without_a_captcha_uses_the_negative_ttl(tmp_path):
+    session = StubSession(StubResponse(body=b'<html>no captcha</html>'), StubResponse(body=b'<html></html>'))
+    discovery = SitekeyDiscovery(cache_file=tmp_path / 'sitekeys.json', ttl=3600, negative_ttl=60, session=session)
+    assert discovery.get('https://a') is None
+    assert discovery.get('https://a') is None
+    assert discovery.fetches == 1
+
+    discovery._cache['https://a']['fetched'] -= 61
+    discovery.get('https://a')
+    assert discovery.fetches == 2
+
+
+def test_stale_entry_is_revalidated_with_its_validators(tmp_path):
+    session = StubSession(
+        StubResponse(body=WIDGET, headers={'ETag': '"v1"', 'Last-Modified': 'Mon, 12 Oct 2026 10:00:00 GMT'}),
+        StubResponse(status_code=304),
+    )
+    discovery = SitekeyDiscovery(cache_file=tmp_path / 'sitekeys.json', ttl=60, session=session)
+    assert discovery.get('https://a') == SITEKEY
+    discovery._cache['https://a']['fetched'] = time.time() - 61
+
+    entry = discovery.discover(['https://a'])['https://a']
+    assert entry['sitekey'] == SITEKEY
+    assert time.time() - entry['fetched'] < 5
+    assert session.requests[1] == ('https://a', {
+        'If-None-Match': '"v1"', 'If-Modified-Since': 'Mon, 12 Oct 2026 10:00:00 GMT',
+    })
+    assert discovery.fetches == 1 and discovery.revalidations == 1
+
+
+def test_failed_refresh_keeps_the_cached_sitekey(tmp_path):
+    session = StubSession(StubResponse(body=WIDGET), requests.ConnectionError('down'), StubResponse(status_code=503))
+    discovery = SitekeyDiscovery(cache_file=tmp_path / 'sitekeys.json', session=session)
+    assert discovery.get('https://a') == SITEKEY
+    assert discovery.get('https://a', refresh=True) == SITEKEY
+    assert discovery.get('https://a', refresh=True) == SITEKEY
+    assert discovery.fetches == 1
+
+
+def chunked(data, size):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+def test_find_sitekey_tells_the_captcha_types_apart():
+    assert find_sitekey(WIDGET.decode()) == (SITEKEY, TYPE_V2)
+    assert find_sitekey(f'<div class="g-recaptcha" data-size="invisible" data-sitekey="{SITEKEY}">') == (
+        SITEKEY, TYPE_INVISIBLE
+    )
+    assert find_sitekey(f'<script src="https://www.google.com/recaptcha/api.js?render={SITEKEY}">') == (
+        SITEKEY, TYPE_V3
+    )
+    assert find_sitekey('<script src="https://www.google.com/recaptcha/api.js?render=explicit">') == (None, None)
+
+
+def test_scan_stops_at_the_chunk_holding_the_sitekey():
+    page = b'<html>' + b'a' * 1000 + WIDGET + b'b' * 100000
+    chunks = iter(chunked(page, 512))
+    sitekey, captcha_type, read = scan_stream(chunks)
+    assert (sitekey, captcha_type) == (SITEKEY, TYPE_V2)
+    assert read == 1536
+    assert len(list(chunks)) == len(chunked(page, 512)) - 3
+
+
+def test_scan_finds_a_match_split_across_chunks():
+    page = b'x' * 100 + WIDGET + b'y' * 100
+    # Every cut through the widget, down to one byte chunks
+    for cut in range(100, 100 + len(WIDGET)):
+        assert scan_stream([page[:cut], page[cut:]], dom_fallback=False)[:2] == (SITEKEY, TYPE_V2)
+    assert scan_stream(chunked(page, 1), dom_fallback=False)[:2] == (SITEKEY, TYPE_V2)
+
+
+def test_scan_decodes_characters_split_across_chunks():
+    page = ('<p>Prüfung ✓</p>' + f'<div class="g-recaptcha" title="é" data-sitekey="{SITEKEY}">').encode('utf-8')
+    assert scan_stream(chunked(page, 1), dom_fallback=False)[:2] == (SITEKEY, TYPE_V2)
+    latin = f'<p>Caf\xe9</p><div class="g-recaptcha" data-sitekey="{SITEKEY}">'.encode('latin-1')
+    assert scan_stream(chunked(latin, 7), encoding='latin-1')[:2] == (SITEKEY, TYPE_V2)
+
+
+def test_dom_fallback_catches_unquoted_attributes():
+    page = f'<div data-size=invisible data-sitekey={SITEKEY}></div>'.encode()
+    assert scan_stream(chunked(page, 8)) == (SITEKEY, TYPE_INVISIBLE, len(page))
+    assert scan_stream(chunked(page, 8), dom_fallback=False) == (None, None, len(page))
+
+
+def test_scan_response_closes_the_response_early():
+    response = StubResponse(body=WIDGET + b'z' * 100000)
+    assert scan_response(response, chunk_size=1024) == (SITEKEY, TYPE_V2, 1024)
+    assert response.closed
@@ -0,0 +1,157 @@
+import time
+import types
+
+import pytest
+
+from fakes import FakeHarvester
+from harvester import supervisor as supervisor_module
+from harvester.harvester_manager import HarvesterManager
+from harvester.supervisor import HarvesterSupervisor
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(supervisor_module, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def crashed(harvester_id, url='https://a', sitekey='key'):
+    return types.SimpleNamespace(id=harvester_id, url=url, sitekey=sitekey, closed=True)
+
+
+def test_backoff_doubles_up_to_the_maximum(clock):
+    supervisor = HarvesterSupervisor(HarvesterManager(), base_backoff=1, max_backoff=5, crash_limit=100)
+    harvester = crashed(1)
+    waits = []
+    for _ in range(5):
+        supervisor.on_closed(harvester)
+        waits.append(supervisor._slots[1].restart_at - clock[0])
+    supervisor.stop()
+    assert waits == [1, 2, 4, 5, 5]
+
+
+def test_backoff_resets_once_a_harvester_stayed_up(clock):
+    supervisor = HarvesterSupervisor(HarvesterManager(), base_backoff=1, healthy_after=60, crash_limit=100)
+    harvester = crashed(1)
+    supervisor.on_closed(harvester)
+    supervisor.on_closed(harvester)
+    assert supervisor._slots[1].failures == 2
+
+    slot = supervisor._slots[1]
+    slot.started_at = clock[0]
+    clock[0] += 61
+    supervisor.on_closed(harvester)
+    supervisor.stop()
+    assert slot.failures == 1
+    assert slot.restart_at - clock[0] == 1
+
+
+def test_breaker_pauses_a_crashing_domain_for_the_cooldown(clock):
+    manager = HarvesterManager()
+    supervisor = HarvesterSupervisor(manager, base_backoff=0, crash_limit=3, crash_window=60, breaker_cooldown=120)
+    relaunched = []
+    supervisor._relaunch = lambda slot, restart: relaunched.append(slot.harvester.id)
+    supervisor._executor = types.SimpleNamespace(submit=lambda fn, *args: fn(*args), shutdown=lambda wait: None)
+
+    for harvester_id in range(3):
+        supervisor.on_closed(crashed(harvester_id))
+    supervisor.on_closed(crashed(9, url='https://b'))
+    supervisor.check()
+    # Only the other domain is relaunched while the breaker is open
+    assert relaunched == [9]
+    assert supervisor.stats()['domains'][('https://a', 'key')]['breaker_open']
+
+    clock[0] += 121
+    supervisor.check()
+    supervisor.stop()
+    assert sorted(relaunched) == [0, 1, 2, 9]
+    assert not supervisor.stats()['domains'][('https://a', 'key')]['breaker_open']
+
+
+def test_crashes_outside_the_window_do_not_open_the_breaker(clock):
+    supervisor = HarvesterSupervisor(HarvesterManager(), crash_limit=2, crash_window=60)
+    supervisor.on_closed(crashed(1))
+    clock[0] += 61
+    supervisor.on_closed(crashed(2))
+    supervisor.stop()
+    assert supervisor._breakers == {}
+
+
+def test_closed_harvester_is_restarted_into_the_manager(make_harvester):
+    harvester = make_harvester(0)
+    harvester.start()
+    manager = HarvesterManager()
+    manager.add_harvester(harvester)
+    supervisor = HarvesterSupervisor(manager, base_backoff=0)
+
+    harvester.closed = True
+    manager.tick()
+    assert manager.harvesters == []
+    assert supervisor.stats()['domains'][(harvester.url, harvester.sitekey)]['down'] == 1
+
+    supervisor.check()
+    wait_for(lambda: supervisor.restarts == 1)
+    supervisor.stop()
+    assert manager.harvesters == [harvester]
+    assert harvester.ready and not harvester.closed
+    stats = supervisor.stats()
+    assert stats['domains'][(harvester.url, harvester.sitekey)]['live'] == 1
+    assert stats['capacity_lost_seconds'] > 0
+
+
+def test_failed_restart_is_retried_with_a_longer_backoff(make_harvester):
+    class BrokenHarvester(FakeHarvester):
+        def start(self, url=None):
+            raise RuntimeError('chrome crashed')
+
+    harvester = make_harvester(0, harvester_class=BrokenHarvester)
+    supervisor = HarvesterSupervisor(HarvesterManager(), base_backoff=0, max_backoff=60, crash_limit=100)
+    supervisor.on_closed(harvester)
+    supervisor.check()
+    slot = supervisor._slots[harvester.id]
+    # Rescheduled through on_closed right after the failed attempt is counted
+    wait_for(lambda: slot.failures == 2)
+    supervisor.stop()
+    assert supervisor.failed_restarts == 1 and supervisor.restarts == 0
+    assert slot.restart_at is not None and not slot.restarting
+
+
+def test_hung_tick_closes_the_harvester(make_harvester):
+    harvester = make_harvester(0)
+    manager = HarvesterManager()
+    manager.add_harvester(harvester)
+    supervisor = HarvesterSupervisor(manager, hang_timeout=5)
+    harvester.ticking = True
+    harvester.tick_started = time.monotonic() - 6
+    supervisor.check()
+    supervisor.stop()
+    assert harvester.closed and supervisor.hangs == 1
+
+
+def test_targets_are_filled_with_new_harvesters(make_harvester, recaptcha_server):
+    class FakeManager(HarvesterManager):
+        def create_harvester(self, url, sitekey, **kwargs):
+            return make_harvester(url=url, sitekey=sitekey)
+
+    manager = FakeManager()
+    supervisor = HarvesterSupervisor(manager)
+    url, sitekey = recaptcha_server.page_url(0), recaptcha_server.sitekey
+    supervisor.set_target(url, sitekey, 2)
+    supervisor.check()
+    # Launching harvesters count towards the target, none are started twice
+    supervisor.check()
+    wait_for(lambda: len(manager.harvesters) == 2)
+    supervisor.check()
+    supervisor.stop()
+    assert len(manager.harvesters) == 2 and all(harvester.ready for harvester in manager.harvesters)
+    assert supervisor.stats()['domains'][(url, sitekey)] == {
+        'live': 2, 'down': 0, 'target': 2, 'capacity_lost_seconds': 0.0, 'breaker_open': False,
+    }
@@ -0,0 +1,98 @@
+import random
+import time
+
+from harvester.token_pool import TokenPool, Token, POLICY_FRESHEST
+
+
+def token(name, ttl, sitekey='key', url='https://a', now=None):
+    """Token with ttl seconds left"""
+    now = time.monotonic() if now is None else now
+    return Token(name, sitekey=sitekey, url=url, lifetime=ttl, captured_at=now)
+
+
+def test_expired_tokens_are_evicted_and_their_domain_forgotten():
+    pool = TokenPool()
+    now = time.monotonic()
+    pool.extend([token('old', 10, now=now), token('new', 100, now=now), token('other', 10, sitekey='other', now=now)])
+
+    expired = pool.evict_expired(now + 50)
+    assert sorted(t.response for t in expired) == ['old', 'other']
+    assert [t.response for t in pool] == ['new']
+    assert pool.sitekeys() == ['key']
+    assert ('https://a', 'other') not in pool._buckets and 'other' not in pool._by_sitekey
+
+
+def test_min_ttl_selects_the_oldest_token_with_enough_ttl_left():
+    pool = TokenPool()
+    pool.extend([token('a', 5), token('b', 30), token('c', 60), token('d', 90)])
+
+    assert pool.count('key', min_ttl=20) == 3
+    assert pool.pull('key', min_ttl=20).response == 'b'
+    assert pool.pull('key', min_ttl=20, policy=POLICY_FRESHEST).response == 'd'
+    assert pool.pull('key', min_ttl=100) is None
+    assert pool.count('key', min_ttl=20) == 1
+    assert [t.response for t in pool] == ['a', 'c']
+
+
+def test_taking_from_the_middle_leaves_the_other_tokens_in_order():
+    pool = TokenPool()
+    tokens = [token(str(i), 10 + i) for i in range(10)]
+    pool.extend(tokens)
+
+    assert pool.remove(tokens[4]) and pool.remove(tokens[6])
+    assert not pool.remove(tokens[4])
+    assert pool.pull('key', min_ttl=14.5).response == '5'
+    assert [t.response for t in pool] == ['0', '1', '2', '3', '7', '8', '9']
+    assert len(pool) == 7 and pool.count('key', min_ttl=13.5) == 3
+
+    # A returned token takes back a free slot next to where it was
+    pool.add(tokens[5])
+    assert [t.response for t in pool] == ['0', '1', '2', '3', '5', '7', '8', '9']
+    assert pool.pull('key', min_ttl=14.5).response == '5'
+
+
+def test_compaction_drops_tombstones_and_keeps_the_pool_consistent():
+    pool = TokenPool()
+    tokens = [token(str(i), 10 + i) for i in range(300)]
+    pool.extend(tokens)
+    bucket = pool._buckets[('https://a', 'key')]
+
+    for t in tokens[1:-1:2] + tokens[2:200:2]:
+        pool.remove(t)
+    # Tombstones outnumbered the live tokens at some point, so the slots were rebuilt
+    assert len(bucket.tokens) < 300
+    assert len(pool) == 300 - 149 - 99
+    assert [t.response for t in pool] == [t.response for t in tokens[:1] + tokens[200::2] + tokens[-1:]]
+    assert pool.count('key', min_ttl=250) == len([t for t in pool if t.ttl() >= 250])
+
+
+def test_pool_matches_a_plain_list_under_random_operations():
+    rng = random.Random(7)
+    pool, reference = TokenPool(), []
+    now = time.monotonic()
+    for step in range(3000):
+        action = rng.random()
+        if action < 0.45 or not reference:
+            new = token(f't{step}', rng.uniform(1, 200), now=now)
+            pool.add(new)
+            reference.append(new)
+        elif action < 0.75:
+            min_ttl = rng.uniform(0, 150)
+            policy = POLICY_FRESHEST if rng.random() < 0.3 else None
+            pulled = pool.pull('key', min_ttl=min_ttl, policy=policy)
+            usable = [t for t in reference if t.ttl() >= min_ttl]
+            if not usable:
+                assert pulled is None
+            else:
+                pick = max if policy else min
+                assert pulled.expires_at == pick(t.expires_at for t in usable)
+                reference.remove(pulled)
+        elif action < 0.95:
+            removed = rng.choice(reference)
+            assert pool.remove(removed)
+            reference.remove(removed)
+        else:
+            min_ttl = rng.uniform(0, 150)
+            assert pool.count('key', min_ttl=min_ttl) == len([t for t in reference if t.ttl() >= min_ttl])
+        assert len(pool) == len(reference)
+    assert sorted(t.expires_at for t in pool) == [t.expires_at for t in pool]
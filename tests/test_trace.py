@@ -0,0 +1,187 @@
+import json
+import threading
+import time
+
+import pytest
+
+from harvester import trace
+from harvester.harvester_manager import HarvesterManager
+from harvester.token_pool import Token
+from harvester.trace import TraceLog, TraceAnalysis, analyze, read_trace, trace_files, token_key, TRACE
+
+
+def record(at, event, harvester_id=None, key=None, sitekey='key'):
+    event_record = {'t': at, 'e': event, 's': sitekey}
+    if harvester_id is not None:
+        event_record['h'] = harvester_id
+    if key is not None:
+        event_record['k'] = key
+    return event_record
+
+
+def lifecycle(harvester_id, key, start, *events):
+    """Render, solve and then the given (offset, event) pairs of one token"""
+    records = [record(start, 'rendered', harvester_id), record(start + 2, 'challenge', harvester_id),
+               record(start + 10, 'solved', harvester_id, key)]
+    records += [record(start + offset, event, harvester_id, key) for offset, event in events]
+    return records
+
+
+def test_emitted_events_are_written_as_json_lines(tmp_path):
+    log = TraceLog(flush_interval=60)
+    log.emit('rendered', 1)
+    assert log.events == 0
+
+    path = tmp_path / 'trace.jsonl'
+    log.open(path)
+    log.emit('rendered', 1, 'key', at=5.0)
+    log.emit_token('pooled', Token('03A' + 'x' * 40 + 'tail', sitekey='key', harvester_id=1), depth=3)
+    log.close()
+
+    records = list(read_trace(path))
+    assert records[0]['e'] == 'open' and 'wall' in records[0]
+    assert records[1] == {'t': 5.0, 'e': 'rendered', 'h': 1, 's': 'key'}
+    assert records[2]['k'] == token_key('03A' + 'x' * 40 + 'tail') and records[2]['depth'] == 3
+    assert log.stats()['written'] == 2 and not log.enabled
+
+
+def test_rotation_keeps_the_configured_backups(tmp_path):
+    path = tmp_path / 'trace.jsonl'
+    log = TraceLog(max_bytes=300, backups=2, flush_interval=60)
+    log.open(path)
+    for number in range(40):
+        log.emit('rendered', number, at=float(number))
+        log.flush()
+    log.close()
+
+    assert trace_files(path) == [tmp_path / 'trace.jsonl.2', tmp_path / 'trace.jsonl.1', path]
+    assert not (tmp_path / 'trace.jsonl.3').exists()
+    assert log.rotations > 2
+    assert all(file.stat().st_size < 300 + 100 for file in trace_files(path))
+    # Oldest first across the files, every file starting with its own open line
+    harvesters = [event['h'] for event in read_trace(path) if event['e'] == 'rendered']
+    assert harvesters == sorted(harvesters) and harvesters[-1] == 39
+    assert sum(event['e'] == 'open' for event in read_trace(path)) == 3
+
+
+def test_rotation_without_backups_starts_over(tmp_path):
+    path = tmp_path / 'trace.jsonl'
+    log = TraceLog(max_bytes=200, backups=0, flush_interval=60)
+    log.open(path)
+    for number in range(20):
+        log.emit('rendered', number)
+        log.flush()
+    log.close()
+    assert trace_files(path) == [path]
+
+
+def test_read_trace_skips_lines_cut_short(tmp_path):
+    path = tmp_path / 'trace.jsonl'
+    path.write_text('{"t":1,"e":"rendered"}\n{"t":2,"e":"solv\n[1,2]\n{"t":3,"e":"solved","k":"a"}\n')
+    assert [event['t'] for event in read_trace(path)] == [1, 3]
+
+
+def test_stages_and_outcomes_of_each_token():
+    analysis = TraceAnalysis()
+    analysis.feed({'t': 0.0, 'e': 'open', 'wall': 1000.0})
+    # Handed over and injected
+    analysis.feed_all(lifecycle(1, 'a', 0.0, (11, 'captured'), (12, 'pooled'), (20, 'handed'), (25, 'injected')))
+    # Left in the pool until it expired
+    analysis.feed_all(lifecycle(1, 'b', 30.0, (11, 'captured'), (12, 'pooled'), (130, 'expired')))
+    # Still queued at the end of the trace
+    analysis.feed_all(lifecycle(2, 'c', 0.0, (11, 'captured'), (12, 'pooled')))
+    # Given back once before it was used
+    analysis.feed_all(lifecycle(2, 'd', 40.0, (11, 'captured'), (12, 'pooled'), (13, 'handed'), (14, 'returned'),
+                                (15, 'handed')))
+    # Solved in a page that closed before the token was read
+    analysis.feed_all(lifecycle(3, 'e', 0.0))
+    report = analysis.report()
+
+    assert report['outcomes'] == {'captured': 4, 'handed': 2, 'expired': 1, 'unused': 1, 'returned': 1,
+                                  'injected': 1}
+    assert report['waste'] == {'expired_pct': 25.0, 'unused_pct': 25.0, 'returned_pct': 25.0}
+    stages = report['stages']
+    assert stages['waiting for operator'] == {'count': 5, 'p50': 2.0, 'p95': 2.0, 'mean': 2.0}
+    assert stages['render to solve']['count'] == 5 and stages['render to solve']['p50'] == 10.0
+    assert stages['solve to capture']['count'] == 4
+    # The returned token counts from its pooling to the hand-off that kept it
+    assert stages['queued in pool']['count'] == 2 and stages['queued in pool']['mean'] == (8 + 3) / 2
+    assert stages['hand-off to inject'] == {'count': 1, 'p50': 5.0, 'p95': 5.0, 'mean': 5.0}
+    assert stages['solve to checkout']['p50'] == 15.0
+    assert report['started'] is not None and report['seconds'] == 160.0
+
+    harvesters = {harvester['harvester']: harvester for harvester in report['harvesters']}
+    assert set(harvesters) == {1, 2}
+    assert harvesters[1]['tokens'] == 2 and harvesters[1]['expired'] == 1
+    # Two tokens between its first render at 0 and its last capture at 41
+    assert harvesters[1]['tokens_per_hour'] == round(2 * 3600 / 41, 1)
+    assert harvesters[2]['solve_p50'] == 10.0
+
+
+def test_hand_off_before_pooling_is_a_shard_relay():
+    analysis = TraceAnalysis()
+    # A shard's relay callback takes the token, then the broker pools it
+    analysis.feed_all(lifecycle(1, 'a', 0.0, (11, 'captured'), (11.5, 'handed'), (12, 'pooled')))
+    assert analysis.report()['outcomes']['unused'] == 1
+
+
+def test_settled_tokens_are_not_kept_in_memory():
+    analysis = TraceAnalysis(settle=10)
+    for number in range(6000):
+        analysis.feed_all(lifecycle(number % 5, f'k{number}', number * 20.0, (11, 'captured'), (12, 'pooled')))
+    # Swept every 10000 events, 5 per token
+    assert len(analysis._tokens) <= 2000
+    assert analysis.report()['outcomes']['captured'] == 6000
+
+
+def write_trace(path, records):
+    path.write_text(''.join(json.dumps(event) + '\n' for event in records))
+
+
+def test_analyze_merges_a_manager_and_its_shards(tmp_path):
+    shard = lifecycle(1, 'a', 0.0, (11, 'captured'))
+    broker = [record(12, 'pooled', 1, 'a'), record(20, 'handed', None, 'a')]
+    write_trace(tmp_path / 'trace.shard0.jsonl', shard)
+    write_trace(tmp_path / 'trace.jsonl', broker)
+
+    report = analyze([tmp_path / 'trace.jsonl', tmp_path / 'trace.shard0.jsonl'])
+    assert report['outcomes']['handed'] == 1
+    assert report['stages']['capture to hand-off']['p50'] == 9.0
+
+
+def test_cli_prints_the_report(tmp_path, capsys):
+    write_trace(tmp_path / 'trace.jsonl', lifecycle(1, 'a', 0.0, (11, 'captured'), (12, 'pooled'), (20, 'handed')))
+    trace.main([str(tmp_path / 'trace.jsonl'), '--json'])
+    assert json.loads(capsys.readouterr().out)['outcomes']['handed'] == 1
+
+    trace.main([str(tmp_path / 'trace.jsonl')])
+    output = capsys.readouterr().out
+    assert 'render to solve' in output and 'handed' in output
+
+    with pytest.raises(SystemExit):
+        trace.main([str(tmp_path / 'missing.jsonl')])
+
+
+def test_harvesting_on_the_fakes_is_traced_end_to_end(tmp_path, make_harvester, recaptcha_server):
+    path = tmp_path / 'trace.jsonl'
+    TRACE.open(path)
+    try:
+        manager = HarvesterManager(delay=0.02)
+        for number in range(2):
+            manager.add_harvester(make_harvester(number))
+        manager.start_harvesters()
+        loop = threading.Thread(target=manager.main_loop, daemon=True)
+        loop.start()
+        time.sleep(0.5)
+        manager.looping = False
+        loop.join(5)
+        assert manager.take_response(recaptcha_server.sitekey) is not None
+        manager.stop()
+    finally:
+        TRACE.close()
+
+    report = analyze([path])
+    assert report['outcomes']['captured'] > 0 and report['outcomes']['handed'] >= 1
+    assert report['stages']['render to solve']['count'] > 0
+    assert report['stages']['capture to pool']['count'] > 0
+    assert {harvester['sitekey'] for harvester in report['harvesters']} == {recaptcha_server.sitekey}